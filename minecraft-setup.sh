@@ -23,7 +23,7 @@ fi
 # Install Java 21 and required tools
 echo "Installing Java 21 and dependencies..."
 apt-get update
-apt-get install -y openjdk-21-jdk-headless curl jq
+apt-get install -y openjdk-21-jdk-headless curl jq zstd pigz
 
 # Verify Java installation
 if ! java -version >/dev/null 2>&1; then
@@ -140,8 +140,8 @@ curl -L -o /tmp/unmined-cli.tar.gz "https://unmined.blob.core.windows.net/files/
 tar -xzf /tmp/unmined-cli.tar.gz -C ${MINECRAFT_DIR}
 rm /tmp/unmined-cli.tar.gz
 
-# Install ImageMagick for image processing
-apt-get install -y imagemagick
+# ImageMagick for image processing, Pillow and DejaVu fonts for the render overlay
+apt-get install -y imagemagick python3-pil fonts-dejavu-core
 
 # Create optimized server.properties
 echo "Creating server.properties..."
@@ -0,0 +1,74 @@
+# Anvil region file helpers
+# A region file r.<rx>.<rz>.mca covers 32x32 chunks. It starts with two
+# 4 KiB tables of 1024 big-endian entries each: chunk locations (3-byte
+# sector offset + 1-byte sector count) and last-modified timestamps.
+
+import os
+import struct
+
+SECTOR = 4096
+HEADER = 2 * SECTOR
+WORLD_DIR = "/opt/minecraft/world"
+
+
+def region_path(world, rx, rz, kind="region"):
+    return os.path.join(world, kind, f"r.{rx}.{rz}.mca")
+
+def chunk_index(cx, cz):
+    return (cx & 31) + (cz & 31) * 32
+
+def regions_for_chunks(cx0, cx1, cz0, cz1):
+    """(rx, rz) of every region overlapping an inclusive chunk box"""
+    for rx in range(min(cx0, cx1) >> 5, (max(cx0, cx1) >> 5) + 1):
+        for rz in range(min(cz0, cz1) >> 5, (max(cz0, cz1) >> 5) + 1):
+            yield rx, rz
+
+def read_header_bytes(path):
+    """Raw 8 KiB header, or None if the region does not exist yet"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(HEADER)
+    except FileNotFoundError:
+        return None
+    return data if len(data) == HEADER else None
+
+def parse_header(data):
+    """Return (locations, timestamps); locations are (sector offset, sector count)"""
+    entries = struct.unpack(">1024I", data[:SECTOR])
+    locations = [(e >> 8, e & 0xFF) for e in entries]
+    timestamps = list(struct.unpack(">1024I", data[SECTOR:HEADER]))
+    return locations, timestamps
+
+def read_header(path):
+    data = read_header_bytes(path)
+    return parse_header(data) if data else None
+
+def chunk_slices(data):
+    """Yield (index, timestamp, chunk bytes) for every chunk stored in a
+    region file's contents; the bytes are the length-prefixed payload as it
+    sits in its sectors, without the padding"""
+    if len(data) < HEADER:
+        return
+    locations, timestamps = parse_header(data)
+    for i, (offset, count) in enumerate(locations):
+        if offset < 2 or count == 0:
+            continue
+        start, limit = offset * SECTOR, (offset + count) * SECTOR
+        length = int.from_bytes(data[start:start + 4], "big")
+        end = start + 4 + length
+        if length == 0 or end > limit or end > len(data):
+            end = min(limit, len(data))  # damaged entry: keep its sectors verbatim
+        yield i, timestamps[i], data[start:end]
+
+def pack_region(chunks):
+    """Region file bytes from (index, timestamp, chunk bytes), laid out
+    back to back from the first free sector"""
+    locations, timestamps = [0] * 1024, [0] * 1024
+    body, sector = bytearray(), HEADER // SECTOR
+    for i, timestamp, data in sorted(chunks):
+        count = -(-len(data) // SECTOR)
+        locations[i] = (sector << 8) | count
+        timestamps[i] = timestamp
+        body += data + b"\0" * (count * SECTOR - len(data))
+        sector += count
+    return struct.pack(">1024I", *locations) + struct.pack(">1024I", *timestamps) + bytes(body)
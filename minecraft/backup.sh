@@ -1,31 +1,159 @@
 #\!/bin/bash
 # Minecraft World Backup Script
-# Keeps last 7 daily backups
+# BACKUP_MODE=tar     full world_<date>.tar.gz, keeps the last MAX_BACKUPS
+# BACKUP_MODE=chunks  deduplicated chunk-level snapshot (chunkstore.py),
+#                     keeps the last MAX_SNAPSHOTS
+# Saving is only off while a point-in-time copy of the world is taken; the
+# archive is then written from that copy with the server saving normally.
 
 BACKUP_DIR="/opt/minecraft/backups"
 WORLD_DIR="/opt/minecraft/world"
+BACKUP_MODE="${BACKUP_MODE:-tar}"
 MAX_BACKUPS=7
+MAX_SNAPSHOTS="${MAX_SNAPSHOTS:-60}"
+CHUNKSTORE="python3 /opt/minecraft/chunkstore.py --store ${BACKUP_DIR}/chunkstore"
+# tar mode: BACKUP_INDEX=1 writes an indexed, seekable .tar.gz (single
+# region/chunk restore with world_archive.py); BACKUP_INDEX=0 streams through
+# BACKUP_COMPRESSOR: zstd | pigz | gzip | auto (first one installed)
+BACKUP_INDEX="${BACKUP_INDEX:-1}"
+BACKUP_COMPRESSOR="${BACKUP_COMPRESSOR:-auto}"
+BACKUP_THREADS="${BACKUP_THREADS:-$(nproc)}"
+BACKUP_LEVEL="${BACKUP_LEVEL:-}"       # default 3 for zstd, 6 for gzip/pigz
 DATE=$(date +%Y-%m-%d_%H%M)
 
-# Notify server
-RCON_PASS="${RCON_PASSWORD:-$(grep rcon.password /opt/minecraft/server.properties | cut -d= -f2)}"
-/usr/local/bin/mcrcon -H 127.0.0.1 -P 25575 -p "$RCON_PASS" "say Starting backup..." 2>/dev/null
+RCON="python3 /opt/minecraft/rcon.py"
+SNAPSHOT_NAME="mcbackup_${DATE}"
 
-# Disable autosave during backup
-/usr/local/bin/mcrcon -H 127.0.0.1 -P 25575 -p $RCON_PASS "save-off" 2>/dev/null
-/usr/local/bin/mcrcon -H 127.0.0.1 -P 25575 -p $RCON_PASS "save-all" 2>/dev/null
-sleep 5
+now_ms() { echo $(( $(date +%s%N) / 1000000 )); }
 
-# Create backup
-tar -czf "${BACKUP_DIR}/world_${DATE}.tar.gz" -C /opt/minecraft world
+# Point-in-time copy of the world while saving is off; sets FROZEN_PARENT
+# (directory containing the frozen "world") and FREEZE_METHOD. ZFS gives an
+# instant snapshot; otherwise cp --reflink=auto clones extents on btrfs/XFS
+# and falls back to a plain copy. Hardlinks are not an option: the server
+# rewrites region files in place, which would change the "frozen" copy.
+freeze_world() {
+    local fstype dataset mountpoint rel
+    fstype=$(findmnt -no FSTYPE -T "$WORLD_DIR" 2>/dev/null)
+    if [ "$fstype" = "zfs" ] && command -v zfs >/dev/null; then
+        dataset=$(findmnt -no SOURCE -T "$WORLD_DIR")
+        mountpoint=$(findmnt -no TARGET -T "$WORLD_DIR")
+        if zfs snapshot "${dataset}@${SNAPSHOT_NAME}" 2>/dev/null; then
+            FREEZE_METHOD="zfs"
+            rel="${WORLD_DIR#$mountpoint}"
+            FROZEN_PARENT="${mountpoint%/}/.zfs/snapshot/${SNAPSHOT_NAME}$(dirname "/${rel#/}")"
+            ZFS_SNAPSHOT="${dataset}@${SNAPSHOT_NAME}"
+            return 0
+        fi
+    fi
+    FREEZE_METHOD="copy"
+    FROZEN_PARENT="${BACKUP_DIR}/.frozen"
+    rm -rf "$FROZEN_PARENT"
+    mkdir -p "$FROZEN_PARENT"
+    cp -a --reflink=auto "$WORLD_DIR" "$FROZEN_PARENT/world"
+}
 
-# Re-enable autosave
-/usr/local/bin/mcrcon -H 127.0.0.1 -P 25575 -p $RCON_PASS "save-on" 2>/dev/null
-/usr/local/bin/mcrcon -H 127.0.0.1 -P 25575 -p $RCON_PASS "say Backup complete\!" 2>/dev/null
+# Sets COMPRESS (command reading tar on stdin) and EXT
+pick_compressor() {
+    local c="$BACKUP_COMPRESSOR"
+    if [ "$c" = "auto" ]; then
+        if command -v zstd >/dev/null; then c=zstd
+        elif command -v pigz >/dev/null; then c=pigz
+        else c=gzip; fi
+    fi
+    case "$c" in
+        zstd) COMPRESS="zstd -q -T${BACKUP_THREADS} -${BACKUP_LEVEL:-3}"; EXT="tar.zst" ;;
+        pigz) COMPRESS="pigz -p ${BACKUP_THREADS} -${BACKUP_LEVEL:-6}"; EXT="tar.gz" ;;
+        *)    COMPRESS="gzip -${BACKUP_LEVEL:-6}"; EXT="tar.gz" ;;
+    esac
+}
 
-# Delete old backups (keep last MAX_BACKUPS)
-cd "${BACKUP_DIR}"
-ls -t world_*.tar.gz 2>/dev/null | tail -n +$((MAX_BACKUPS + 1)) | xargs -r rm --
+release_world() {
+    if [ -n "$ZFS_SNAPSHOT" ]; then
+        zfs destroy "$ZFS_SNAPSHOT"
+    elif [ "$FREEZE_METHOD" = "copy" ]; then
+        rm -rf "$FROZEN_PARENT"
+    fi
+}
+
+# Never leave autosave off, whatever happens below
+SAVE_OFF=0
+trap '[ $SAVE_OFF -eq 1 ] && $RCON save-on >/dev/null 2>&1; release_world' EXIT
+
+# Flush everything to disk and stop saving just long enough to freeze a copy
+WINDOW_START=$(now_ms)
+# Set first: if rcon fails part-way, save-off may already have gone through
+SAVE_OFF=1
+printf '%s\n' "say Starting backup..." "save-off" "save-all flush" | $RCON - >/dev/null
+if [ "${PIPESTATUS[1]}" -ne 0 ]; then
+    echo "Backup failed: could not turn off saving over RCON"
+    exit 1
+fi
+freeze_world
+FREEZE_RC=$?
+$RCON save-on >/dev/null 2>&1
+SAVE_OFF=0
+WINDOW_MS=$(( $(now_ms) - WINDOW_START ))
+echo "Save-off window: $((WINDOW_MS / 1000)).$(printf '%03d' $((WINDOW_MS % 1000)))s (${FREEZE_METHOD})"
+if [ $FREEZE_RC -ne 0 ]; then
+    echo "Backup failed: could not freeze the world"
+    exit 1
+fi
 
-echo "Backup completed: world_${DATE}.tar.gz"
-ls -lh "${BACKUP_DIR}"
+# Archive from the frozen copy while the server keeps saving
+BACKUP_OK=1
+if [ "$BACKUP_MODE" = "chunks" ]; then
+    nice -n 10 ionice -c3 $CHUNKSTORE backup "${FROZEN_PARENT}/world" --name "world_${DATE}" || BACKUP_OK=0
+elif [ "$BACKUP_INDEX" = "1" ]; then
+    ARCHIVE="world_${DATE}.tar.gz"
+    nice -n 10 ionice -c3 python3 /opt/minecraft/world_archive.py create "$FROZEN_PARENT" "${BACKUP_DIR}/${ARCHIVE}" \
+        --threads "$BACKUP_THREADS" --level "${BACKUP_LEVEL:-6}" || BACKUP_OK=0
+else
+    # Streamed straight into the compressor; the name only appears once the
+    # archive is complete
+    pick_compressor
+    ARCHIVE="world_${DATE}.${EXT}"
+    RAW_BYTES=$(du -sb "${FROZEN_PARENT}/world" | cut -f1)
+    ARCHIVE_START=$(now_ms)
+    nice -n 10 ionice -c3 tar -cf - -C "$FROZEN_PARENT" world \
+        | nice -n 10 $COMPRESS > "${BACKUP_DIR}/${ARCHIVE}.partial"
+    STATUS=("${PIPESTATUS[@]}")
+    ARCHIVE_MS=$(( $(now_ms) - ARCHIVE_START ))
+    if [ "${STATUS[0]}" -eq 0 ] && [ "${STATUS[1]}" -eq 0 ]; then
+        mv "${BACKUP_DIR}/${ARCHIVE}.partial" "${BACKUP_DIR}/${ARCHIVE}"
+        OUT_BYTES=$(stat -c%s "${BACKUP_DIR}/${ARCHIVE}")
+        awk -v raw="$RAW_BYTES" -v out="$OUT_BYTES" -v ms="$ARCHIVE_MS" -v how="$COMPRESS" 'BEGIN {
+            s = (ms > 0 ? ms : 1) / 1000
+            printf "Archive: %.1f MB -> %.1f MB in %.1fs, %.1f MB/s (%s)\n", raw / 1e6, out / 1e6, s, raw / 1e6 / s, how
+        }'
+    else
+        rm -f "${BACKUP_DIR}/${ARCHIVE}.partial"
+        BACKUP_OK=0
+    fi
+fi
+release_world
+FREEZE_METHOD=""
+ZFS_SNAPSHOT=""
+
+if [ $BACKUP_OK -ne 1 ]; then
+    $RCON 'say Backup failed!' >/dev/null 2>&1
+    echo "Backup failed, keeping existing backups"
+    exit 1
+fi
+$RCON 'say Backup complete!' >/dev/null 2>&1
+
+# Delete old backups (keep last MAX_BACKUPS / MAX_SNAPSHOTS), only after a
+# successful backup; leftovers of interrupted runs go too
+cd "${BACKUP_DIR}"
+if [ "$BACKUP_MODE" = "chunks" ]; then
+    $CHUNKSTORE prune --keep "$MAX_SNAPSHOTS"
+    echo "Backup completed: snapshot world_${DATE}"
+    $CHUNKSTORE list | tail -n 5
+else
+    find . -maxdepth 1 -name 'world_*.partial' -delete
+    ls -t world_*.tar.gz world_*.tar.zst 2>/dev/null | tail -n +$((MAX_BACKUPS + 1)) | xargs -r rm --
+    for idx in world_*.idx; do
+        [ -e "$idx" ] && [ ! -e "${idx%.idx}" ] && rm -f -- "$idx"
+    done
+    echo "Backup completed: ${ARCHIVE}"
+    ls -lh "${BACKUP_DIR}"
+fi
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Change detection for scheduled renders
+# Digests the per-chunk timestamp table of every region header overlapping
+# the rendered area. A render only has to run when that digest differs from
+# the one recorded after the previous successful render.
+#
+# Usage:
+#   chunk_changes.py check NAME (--blocks X0 Z0 X1 Z1 | --chunks X0 X1 Z0 Z1)
+#       prints the current digest; exit 0 if changed, 3 if unchanged (any
+#       other status is an error)
+#   chunk_changes.py mark NAME DIGEST
+
+import argparse
+import hashlib
+import os
+import sys
+
+import anvil
+
+STATE_DIR = os.environ.get("RENDER_STATE_DIR", "/var/lib/jeebz-render")
+# Not 1 or 2, which Python and argparse use for errors
+UNCHANGED = 3
+
+
+def area_digest(cx0, cx1, cz0, cz1, world=anvil.WORLD_DIR):
+    cx0, cx1 = sorted((cx0, cx1))
+    cz0, cz1 = sorted((cz0, cz1))
+    h = hashlib.sha256(f"{cx0},{cx1},{cz0},{cz1}".encode())
+    for rx, rz in anvil.regions_for_chunks(cx0, cx1, cz0, cz1):
+        header = anvil.read_header(anvil.region_path(world, rx, rz))
+        if header is None:
+            continue
+        locations, timestamps = header
+        for cz in range(max(cz0, rz * 32), min(cz1, rz * 32 + 31) + 1):
+            for cx in range(max(cx0, rx * 32), min(cx1, rx * 32 + 31) + 1):
+                i = anvil.chunk_index(cx, cz)
+                if locations[i][0]:
+                    h.update(f"{cx},{cz}:{timestamps[i]};".encode())
+    return h.hexdigest()[:32]
+
+def stamp_path(name):
+    return os.path.join(STATE_DIR, f"{name}.digest")
+
+def last_digest(name):
+    try:
+        with open(stamp_path(name)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def mark(name, digest):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp = stamp_path(name) + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(digest + "\n")
+    os.replace(tmp, stamp_path(name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect chunk changes in a render area")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("check")
+    p.add_argument("name")
+    area = p.add_mutually_exclusive_group(required=True)
+    area.add_argument("--blocks", type=int, nargs=4, metavar=("X0", "Z0", "X1", "Z1"))
+    area.add_argument("--chunks", type=int, nargs=4, metavar=("X0", "X1", "Z0", "Z1"))
+    p.add_argument("--world", default=anvil.WORLD_DIR)
+    p = sub.add_parser("mark")
+    p.add_argument("name")
+    p.add_argument("digest")
+    args = parser.parse_args()
+
+    if args.cmd == "check":
+        if args.blocks:
+            x0, z0, x1, z1 = args.blocks
+            chunks = (x0 >> 4, x1 >> 4, z0 >> 4, z1 >> 4)
+        else:
+            chunks = args.chunks
+        digest = area_digest(*chunks, world=args.world)
+        print(digest)
+        sys.exit(0 if digest != last_digest(args.name) else UNCHANGED)
+    elif args.cmd == "mark":
+        mark(args.name, args.digest)
+
+
+if __name__ == "__main__":
+    main()
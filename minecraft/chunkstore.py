@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# Deduplicated chunk-level world backups
+# Region files (*.mca) are split into their chunks using the sector tables;
+# every other file is split into fixed-size blocks. Chunks and blocks are
+# stored once, addressed by their SHA-256, and each backup is a manifest
+# listing what every file is made of. A nightly backup only writes the
+# chunks that were saved since the last one. Directories are listed too, so
+# empty ones (a dimension with no region files yet) come back on restore.
+#
+# Usage:
+#   chunkstore.py backup WORLD_DIR --name NAME
+#   chunkstore.py list
+#   chunkstore.py restore NAME DEST [--path PREFIX]
+#   chunkstore.py verify NAME
+#   chunkstore.py prune --keep N
+
+import argparse
+import collections
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+import zlib
+
+import anvil
+
+STORE_DIR = os.environ.get("CHUNKSTORE_DIR", "/opt/minecraft/backups/chunkstore")
+BLOCK = 1 << 20
+SKIP = ("session.lock",)
+
+# First byte of every object: how the rest is stored
+RAW, ZLIB = b"R", b"Z"
+
+
+class ChunkStore:
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.snapshots = os.path.join(root, "snapshots")
+
+    # -- objects
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest[2:])
+
+    def has(self, digest):
+        return os.path.exists(self.object_path(digest))
+
+    def put(self, data, compress):
+        """Store data unless present; returns (digest, bytes written)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        # Chunk payloads are already compressed by the game
+        stored = ZLIB + zlib.compress(data, 6) if compress else RAW + data
+        self._write(path, stored)
+        return digest, len(stored)
+
+    def put_stored(self, digest, stored):
+        """Add an object exactly as another store holds it (offsite restore)"""
+        if hashlib.sha256(decode(stored)).hexdigest() != digest:
+            raise ValueError(f"Object {digest} is damaged")
+        self._write(self.object_path(digest), stored)
+
+    def _write(self, path, stored):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(stored)
+        os.replace(tmp, path)
+
+    def get(self, digest):
+        with open(self.object_path(digest), "rb") as f:
+            return decode(f.read())
+
+    # -- snapshots
+
+    def manifest_path(self, name):
+        return os.path.join(self.snapshots, f"{name}.json.gz")
+
+    def names(self):
+        """Snapshot names, oldest first"""
+        try:
+            files = [f for f in os.listdir(self.snapshots) if f.endswith(".json.gz")]
+        except FileNotFoundError:
+            return []
+        return sorted((f[:-len(".json.gz")] for f in files),
+                      key=lambda n: os.path.getmtime(self.manifest_path(n)))
+
+    def load(self, name):
+        with gzip.open(self.manifest_path(name), "rt") as f:
+            return json.load(f)
+
+    def save(self, manifest):
+        os.makedirs(self.snapshots, exist_ok=True)
+        path = self.manifest_path(manifest["name"])
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wt") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    # -- backup
+
+    def backup(self, src, name):
+        names = self.names()
+        prev = self.load(names[-1]) if names else None
+        prev_files = prev["files"] if prev else {}
+        stats = collections.Counter()
+        manifest = {"name": name, "created": int(time.time()), "source": os.path.abspath(src), "files": {}}
+        for rel, path in walk(src):
+            st = os.stat(path)
+            old = prev_files.get(rel)
+            if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                entry = old
+                stats["files_unchanged"] += 1
+            elif rel.endswith(".mca"):
+                entry = self._backup_region(path, old, prev["created"] if prev else 0, stats)
+            else:
+                entry = self._backup_blob(path, stats)
+            entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+            manifest["files"][rel] = entry
+            stats["files"] += 1
+        manifest["dirs"] = list(walk_dirs(src))
+        manifest["stats"] = dict(stats)
+        self.save(manifest)
+        return manifest
+
+    def _backup_region(self, path, old, prev_created, stats):
+        with open(path, "rb") as f:
+            data = f.read()
+        # A chunk whose timestamp is unchanged and older than the previous
+        # backup cannot have been saved again since; reuse its digest
+        known = {}
+        if old and "chunks" in old:
+            known = {i: (ts, digest) for i, ts, digest in old["chunks"] if ts < prev_created}
+        chunks = []
+        for i, timestamp, chunk in anvil.chunk_slices(data):
+            if known.get(i, (None,))[0] == timestamp and self.has(known[i][1]):
+                digest, written = known[i][1], 0
+                stats["chunks_reused"] += 1
+            else:
+                digest, written = self.put(chunk, compress=False)
+                stats["chunks_new" if written else "chunks_dedup"] += 1
+            stats["bytes_written"] += written
+            chunks.append([i, timestamp, digest])
+        return {"chunks": chunks}
+
+    def _backup_blob(self, path, stats):
+        blocks = []
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(BLOCK)
+                if not block:
+                    break
+                digest, written = self.put(block, compress=True)
+                stats["blocks_new" if written else "blocks_dedup"] += 1
+                stats["bytes_written"] += written
+                blocks.append(digest)
+        return {"blocks": blocks}
+
+    # -- restore
+
+    def file_bytes(self, entry):
+        if "chunks" in entry:
+            return anvil.pack_region((i, ts, self.get(digest)) for i, ts, digest in entry["chunks"])
+        return b"".join(self.get(digest) for digest in entry["blocks"])
+
+    def restore(self, name, dest, prefix=""):
+        manifest = self.load(name)
+        # Older manifests have no directory list
+        for rel in manifest.get("dirs", ()):
+            if rel.startswith(prefix):
+                os.makedirs(os.path.join(dest, rel), exist_ok=True)
+        restored = 0
+        for rel, entry in manifest["files"].items():
+            if not rel.startswith(prefix):
+                continue
+            out = os.path.join(dest, rel)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            tmp = f"{out}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(self.file_bytes(entry))
+            os.replace(tmp, out)
+            os.utime(out, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+            restored += 1
+        return restored
+
+    def verify(self, name):
+        """Digests referenced by a snapshot that are missing or damaged"""
+        bad = []
+        for digest in sorted(referenced(self.load(name))):
+            try:
+                ok = hashlib.sha256(self.get(digest)).hexdigest() == digest
+            except (OSError, zlib.error):
+                ok = False
+            if not ok:
+                bad.append(digest)
+        return bad
+
+    # -- retention
+
+    def prune(self, keep):
+        """Drop all but the newest `keep` snapshots and unreferenced objects"""
+        names = self.names()
+        for name in names[:-keep] if keep else names:
+            os.remove(self.manifest_path(name))
+        live = set()
+        for name in self.names():
+            live |= referenced(self.load(name))
+        removed = freed = 0
+        for directory, _, files in os.walk(self.objects):
+            for f in files:
+                digest = os.path.basename(directory) + f
+                if f.endswith(".tmp") or digest in live:
+                    continue
+                path = os.path.join(directory, f)
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+        return removed, freed
+
+
+def decode(stored):
+    return zlib.decompress(stored[1:]) if stored[:1] == ZLIB else stored[1:]
+
+def walk(src):
+    """(relative path, path) of every file to back up, in a stable order"""
+    for directory, dirs, files in os.walk(src):
+        dirs.sort()
+        for f in sorted(files):
+            if f in SKIP:
+                continue
+            path = os.path.join(directory, f)
+            yield os.path.relpath(path, src), path
+
+def walk_dirs(src):
+    """Relative path of every directory below src"""
+    for directory, dirs, _ in os.walk(src):
+        dirs.sort()
+        for d in dirs:
+            yield os.path.relpath(os.path.join(directory, d), src)
+
+def referenced(manifest):
+    digests = set()
+    for entry in manifest["files"].values():
+        if "chunks" in entry:
+            digests.update(digest for _, _, digest in entry["chunks"])
+        else:
+            digests.update(entry["blocks"])
+    return digests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicated chunk-level world backups")
+    parser.add_argument("--store", default=STORE_DIR)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("backup")
+    p.add_argument("world")
+    p.add_argument("--name", required=True)
+    sub.add_parser("list")
+    p = sub.add_parser("restore")
+    p.add_argument("name")
+    p.add_argument("dest")
+    p.add_argument("--path", default="", help="only restore files under this relative path")
+    p = sub.add_parser("verify")
+    p.add_argument("name")
+    p = sub.add_parser("prune")
+    p.add_argument("--keep", type=int, required=True)
+    args = parser.parse_args()
+
+    store = ChunkStore(args.store)
+    if args.cmd == "backup":
+        start = time.time()
+        stats = store.backup(args.world, args.name)["stats"]
+        print(f"Snapshot {args.name}: {stats.get('files', 0)} files, "
+              f"{stats.get('chunks_new', 0)} new / {stats.get('chunks_reused', 0) + stats.get('chunks_dedup', 0)} "
+              f"known chunks, {stats.get('bytes_written', 0) / 1e6:.1f} MB written in {time.time() - start:.1f}s")
+    elif args.cmd == "list":
+        for name in store.names():
+            m = store.load(name)
+            stats = m.get("stats", {})
+            print(f"{name}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(m['created']))}  "
+                  f"{stats.get('files', len(m['files']))} files  {stats.get('bytes_written', 0) / 1e6:.1f} MB new")
+    elif args.cmd == "restore":
+        print(f"Restored {store.restore(args.name, args.dest, args.path)} files")
+    elif args.cmd == "verify":
+        bad = store.verify(args.name)
+        for digest in bad:
+            print(f"missing or damaged: {digest}")
+        sys.exit(1 if bad else 0)
+    elif args.cmd == "prune":
+        removed, freed = store.prune(args.keep)
+        print(f"Removed {removed} objects, {freed / 1e6:.1f} MB freed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# Server log analyzer
+# Follows logs/latest.log and indexes the lines worth correlating with
+# renders, backups and player activity: "Can't keep up!" overloads (with
+# how far behind the server fell), joins and leaves, saves, errors, starts
+# and stops. Only new bytes are read. The read position is stored in the
+# same SQLite transaction as the events it produced, so a restart neither
+# loses nor repeats events. Rotation is followed: the rest of the old file
+# is read before switching, and after downtime the rotated .log.gz is
+# caught up from the stored position.
+#
+# The database lives on the shared mount for the webapp, which opens it read
+# only (so no WAL: readers could not create its shared-memory file). The
+# webapp imports this module through the webapp/log_index.py symlink.
+#
+# Usage:
+#   log_index.py follow              index until stopped (log-index.service)
+#   log_index.py events [--range S] [--kind K]
+
+import argparse
+import datetime
+import glob
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+
+LOG_DIR = os.environ.get("MC_LOG_DIR", "/opt/minecraft/logs")
+DB_PATH = os.environ.get("LOG_EVENTS_DB", "/mnt/shared/telemetry/events.db")
+POLL_INTERVAL = 1.0
+HEAD = 256              # bytes identifying a log file across renames
+MAX_DETAIL = 500
+KEEP_DAYS = 90
+
+LINE = re.compile(r"^\[(\d\d):(\d\d):(\d\d)\] \[([^\]]*)/(\w+)\]: (.*)$")
+# Commands run by anyone but the console are echoed as "[Source: message]",
+# e.g. "[Rcon: Saving the game (this may take a moment!)]" from backup.sh
+BY = r"^(?:\[\w+: )?"
+PATTERNS = (
+    ("lag", re.compile(r"Can't keep up! Is the server overloaded\? Running (\d+)ms or (\d+) ticks behind")),
+    ("join", re.compile(r"^(\w{1,16}) joined the game")),
+    ("leave", re.compile(r"^(\w{1,16}) left the game")),
+    ("start", re.compile(r"^Done \(([\d.]+)s\)! For help")),
+    ("stop", re.compile(BY + r"Stopping (?:the )?server")),
+    ("saving", re.compile(BY + r"Saving the game")),
+    ("saved", re.compile(BY + r"Saved the game")),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    time REAL NOT NULL,
+    kind TEXT NOT NULL,
+    player TEXT,
+    value REAL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_kind ON events (kind, time);
+CREATE TABLE IF NOT EXISTS position (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    head TEXT NOT NULL,
+    offset INTEGER NOT NULL
+);
+"""
+
+
+class LineParser:
+    """Turns log lines into (time, kind, player, value, detail) events.
+    Lines only carry a time of day. latest.log is rotated daily, so its
+    lines are from the last 24 hours; for a rotated log, `day` is the date
+    it started on and a clock going backwards means midnight passed."""
+
+    def __init__(self, day=None):
+        self.day = day
+        self.last = None
+        self.saving = None
+
+    def timestamp(self, h, m, s):
+        tod = datetime.time(int(h), int(m), int(s))
+        if self.day is None:
+            now = datetime.datetime.now()
+            t = datetime.datetime.combine(now.date(), tod)
+            if t > now + datetime.timedelta(minutes=1):
+                t -= datetime.timedelta(days=1)
+            return t.timestamp()
+        t = datetime.datetime.combine(self.day, tod)
+        if self.last is not None and t < self.last - datetime.timedelta(hours=1):
+            self.day += datetime.timedelta(days=1)
+            t += datetime.timedelta(days=1)
+        self.last = t
+        return t.timestamp()
+
+    def parse(self, line):
+        m = LINE.match(line)
+        if not m:
+            return None  # stack trace continuation and the like
+        h, mi, s, thread, level, message = m.groups()
+        t = self.timestamp(h, mi, s)
+        for kind, pattern in PATTERNS:
+            found = pattern.search(message)
+            if not found:
+                continue
+            if kind == "lag":
+                return (t, "lag", None, int(found.group(1)), f"{found.group(2)} ticks behind")
+            if kind in ("join", "leave"):
+                return (t, kind, found.group(1), None, None)
+            if kind == "start":
+                return (t, "start", None, float(found.group(1)), None)
+            if kind == "saving":
+                self.saving = t
+                return None
+            if kind == "saved":
+                # Seconds between "Saving the game" and "Saved the game"
+                took, self.saving = (t - self.saving if self.saving else None), None
+                return (t, "save", None, took, None)
+            return (t, kind, None, None, None)
+        if level == "ERROR":
+            return (t, "error", None, None, f"[{thread}] {message}"[:MAX_DETAIL])
+        return None
+
+
+class EventLog:
+    def __init__(self, path=DB_PATH, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        if not readonly:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            db = self.connect()
+            try:
+                db.executescript(SCHEMA)
+            finally:
+                db.close()
+
+    def connect(self):
+        if self.readonly:
+            db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=10)
+        else:
+            db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def position(self, db):
+        row = db.execute("SELECT head, offset FROM position WHERE id = 1").fetchone()
+        return (row["head"], row["offset"]) if row else (None, 0)
+
+    def record(self, db, events, head, offset):
+        """Store events and the position after them in one transaction"""
+        with db:
+            db.executemany("INSERT INTO events (time, kind, player, value, detail) VALUES (?, ?, ?, ?, ?)", events)
+            db.execute("INSERT OR REPLACE INTO position (id, head, offset) VALUES (1, ?, ?)", (head, offset))
+
+    def prune(self, db, keep_days=KEEP_DAYS):
+        with db:
+            db.execute("DELETE FROM events WHERE time < ?", (time.time() - keep_days * 86400,))
+
+    def query(self, start, end, kinds=None, limit=1000):
+        """Events in [start, end), newest first, plus per-kind totals"""
+        where, params = "time >= ? AND time < ?", [start, end]
+        if kinds:
+            where += f" AND kind IN ({','.join('?' * len(kinds))})"
+            params += list(kinds)
+        db = self.connect()
+        try:
+            rows = db.execute(f"SELECT * FROM events WHERE {where} ORDER BY time DESC LIMIT ?",
+                              params + [limit]).fetchall()
+            totals = db.execute(f"SELECT kind, COUNT(*) AS count, SUM(value) AS value, MAX(value) AS max "
+                                f"FROM events WHERE {where} GROUP BY kind", params).fetchall()
+        finally:
+            db.close()
+        return {"start": start, "end": end,
+                "events": [{k: r[k] for k in r.keys() if r[k] is not None} for r in rows],
+                "totals": {r["kind"]: {"count": r["count"], "value": r["value"], "max": r["max"]} for r in totals}}
+
+
+def file_head(f):
+    pos = f.tell()
+    f.seek(0)
+    head = f.read(HEAD)
+    f.seek(pos)
+    return hashlib.sha1(head).hexdigest() if len(head) == HEAD else None
+
+def rotated_logs(log_dir):
+    """Rotated logs, newest first: (path, date the file started on)"""
+    found = []
+    for path in glob.glob(os.path.join(log_dir, "*.log.gz")):
+        m = re.match(r"(\d{4}-\d\d-\d\d)-(\d+)\.log\.gz$", os.path.basename(path))
+        if m:
+            found.append((m.group(1), int(m.group(2)), path))
+    return [(path, datetime.date.fromisoformat(day)) for day, _, path in sorted(found, reverse=True)]
+
+
+class Follower:
+    def __init__(self, log, log_dir=LOG_DIR):
+        self.log = log
+        self.path = os.path.join(log_dir, "latest.log")
+        self.log_dir = log_dir
+        self.db = log.connect()
+        self.f = None
+        self.head = None
+        self.offset = 0
+        self.buf = b""
+        self.parser = None
+
+    def consume(self, data, head, offset, parser):
+        """Index the complete lines in data; the partial last line waits"""
+        data = self.buf + data
+        lines = data.split(b"\n")
+        self.buf = lines.pop()
+        events = [e for e in (parser.parse(l.decode("utf-8", "replace").rstrip("\r")) for l in lines) if e]
+        offset += len(data) - len(self.buf)
+        self.log.record(self.db, events, head, offset)
+        return offset
+
+    def catch_up_rotated(self, head, offset):
+        """After downtime, the file we were reading may have been rotated and
+        gzipped; finish it from the stored offset"""
+        for path, day in rotated_logs(self.log_dir)[:5]:
+            try:
+                with gzip.open(path, "rb") as f:
+                    if file_head(f) != head:
+                        continue
+                    # Decompressing the skipped part is unavoidable with gzip,
+                    # but happens once per restart across a rotation
+                    f.seek(offset)
+                    self.buf = b""
+                    parser = LineParser(day)
+                    while True:
+                        data = f.read(1 << 20)
+                        if not data:
+                            break
+                        offset = self.consume(data, head, offset, parser)
+                    print(f"Caught up on {os.path.basename(path)}", file=sys.stderr)
+            except (OSError, EOFError):
+                continue
+            return
+
+    def open(self, resume=False):
+        self.f = open(self.path, "rb")
+        self.buf = b""
+        self.head = file_head(self.f)
+        stored_head, stored_offset = self.log.position(self.db)
+        st = os.fstat(self.f.fileno())
+        if stored_head and stored_head == self.head and stored_offset <= st.st_size:
+            self.offset = stored_offset
+        else:
+            if resume and stored_head:
+                self.catch_up_rotated(stored_head, stored_offset)
+            self.offset = 0
+        self.f.seek(self.offset)
+        self.ino = st.st_ino
+        self.parser = LineParser()
+
+    def poll(self):
+        """Read what was appended since the last poll; True if the file was
+        replaced and should be reopened"""
+        # Checked before reading: nothing is written to the old file after
+        # the rename, so this read gets the rest of it
+        replaced = self._replaced()
+        if self.head is None:
+            # Too short to identify yet; index once it is
+            self.head = file_head(self.f)
+            if self.head is None:
+                return replaced
+        data = self.f.read()
+        if data:
+            self.offset = self.consume(data, self.head, self.offset, self.parser)
+        return replaced
+
+    def _replaced(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False  # between rename and create
+        return st.st_ino != self.ino or st.st_size < self.offset
+
+    def run(self):
+        last_prune = 0
+        resume = True
+        while True:
+            if self.f is None:
+                try:
+                    self.open(resume)
+                    resume = False
+                except FileNotFoundError:
+                    time.sleep(5)
+                    continue
+            if self.poll():
+                # Rotated: the old file was read to its end
+                self.f.close()
+                self.f = None
+                continue
+            if time.time() - last_prune > 86400:
+                self.log.prune(self.db)
+                last_prune = time.time()
+            time.sleep(POLL_INTERVAL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server log analyzer")
+    parser.add_argument("--db", default=DB_PATH)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("follow")
+    p.add_argument("--logs", default=LOG_DIR)
+    p = sub.add_parser("events")
+    p.add_argument("--range", type=int, default=86400, help="seconds back from now")
+    p.add_argument("--kind", action="append")
+    args = parser.parse_args()
+
+    if args.cmd == "follow":
+        Follower(EventLog(args.db), args.logs).run()
+    elif args.cmd == "events":
+        now = time.time()
+        data = EventLog(args.db, readonly=True).query(now - args.range, now, args.kind)
+        for kind, total in sorted(data["totals"].items()):
+            print(f"{kind:>6}: {total['count']}")
+        for e in reversed(data["events"]):
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e["time"]))
+            print(f"{when}  {e['kind']:<6} {e.get('player', '')} {e.get('value', '')} {e.get('detail', '')}".rstrip())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# Incremental tiled rendering of the spawn overview map
+# The map area is split into fixed-size tiles. Each tile is cached together
+# with the chunk digest (see chunk_changes.py) it was rendered from; only
+# tiles whose chunks changed are re-rendered with unmined, and the map is
+# reassembled from the cached tiles. A fresh tile's digest stays pending
+# until the whole map has been published, so a failed assembly or overlay
+# leaves the tile dirty for the next run instead of a stale map.
+#
+# Usage: map_tiles.py --output FILE [--if-changed]
+#   exit 0 when the map was written, 3 when --if-changed found nothing to do
+#        map_tiles.py --commit
+#   record the pending tile digests once the map is published
+
+import argparse
+import os
+import subprocess
+import sys
+
+import anvil
+from chunk_changes import area_digest
+
+UNMINED = "/opt/minecraft/unmined-cli_0.19.54-dev_linux-x64/unmined-cli"
+TILE_DIR = os.environ.get("MAP_TILE_DIR", "/var/cache/jeebz-render/map_tiles")
+AREA = (-285, 159, 227, 671)  # x0, z0, x1, z1 (blocks, end exclusive)
+TILE = 128                    # blocks per tile side; zoom 0 is 1 px per block
+
+
+def tiles(area=AREA, size=TILE):
+    x0, z0, x1, z1 = area
+    for j, tz in enumerate(range(z0, z1, size)):
+        for i, tx in enumerate(range(x0, x1, size)):
+            yield i, j, (tx, tz, min(tx + size, x1), min(tz + size, z1))
+
+def tile_path(i, j, ext="png"):
+    return os.path.join(TILE_DIR, f"tile_{i}_{j}.{ext}")
+
+def stored_digest(i, j, ext="digest"):
+    try:
+        with open(tile_path(i, j, ext)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def commit():
+    """Pending digests become the ones the next run compares against"""
+    for i, j, _ in tiles():
+        try:
+            os.replace(tile_path(i, j, "pending"), tile_path(i, j, "digest"))
+        except FileNotFoundError:
+            pass
+
+def render_tile(i, j, box, world):
+    x0, z0, x1, z1 = box
+    tmp = tile_path(i, j, "tmp.png")
+    subprocess.run([UNMINED, "image", "render", f"--world={world}", f"--output={tmp}",
+                    f"--area=b(({x0},{z0}),({x1},{z1}))", "--zoom=0"],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Pin every tile to its exact size so the grid always lines up
+    subprocess.run(["convert", tmp, "-background", "none", "-gravity", "NorthWest",
+                    "-extent", f"{x1 - x0}x{z1 - z0}", "+repage", tmp], check=True)
+    os.replace(tmp, tile_path(i, j))
+
+def assemble(grid, output):
+    cmd = ["convert"]
+    for row in grid:
+        cmd += ["(", *row, "+append", ")"]
+    cmd += ["-append", "-trim", "+repage", output]
+    subprocess.run(cmd, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the spawn map from cached tiles")
+    parser.add_argument("--output")
+    parser.add_argument("--if-changed", action="store_true")
+    parser.add_argument("--world", default=anvil.WORLD_DIR)
+    parser.add_argument("--commit", action="store_true", help="record the tiles of the published map")
+    args = parser.parse_args()
+    if args.commit:
+        commit()
+        return
+    if not args.output:
+        parser.error("--output is required")
+
+    os.makedirs(TILE_DIR, exist_ok=True)
+    grid, dirty, rendered = [], 0, 0
+    for i, j, box in tiles():
+        x0, z0, x1, z1 = box
+        digest = area_digest(x0 >> 4, (x1 - 1) >> 4, z0 >> 4, (z1 - 1) >> 4, world=args.world)
+        if digest != stored_digest(i, j) or not os.path.exists(tile_path(i, j)):
+            # Already rendered by a run whose map was never published
+            if digest != stored_digest(i, j, "pending") or not os.path.exists(tile_path(i, j)):
+                render_tile(i, j, box, args.world)
+                with open(tile_path(i, j, "pending"), "w") as f:
+                    f.write(digest + "\n")
+                rendered += 1
+            dirty += 1
+        if j == len(grid):
+            grid.append([])
+        grid[j].append(tile_path(i, j))
+
+    total = sum(len(row) for row in grid)
+    print(f"{dirty}/{total} tiles changed, {rendered} re-rendered")
+    if dirty == 0 and args.if_changed:
+        sys.exit(3)
+    assemble(grid, args.output)
+
+
+if __name__ == "__main__":
+    main()
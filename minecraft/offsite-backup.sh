@@ -1,32 +1,40 @@
 #!/bin/bash
 # Weekly offsite backup to Google Drive
-# Uploads the most recent local backup to gdrive:minecraft-backups/
+# Ships backups to gdrive:minecraft-backups/ with offsite_sync.py: only
+# chunks the remote does not have yet (chunk store), or the most recent
+# archive in resumable, checksummed parts (tar backups)
+# OFFSITE_REMOTE may also be a local directory, e.g. for testing
 
 BACKUP_DIR="/opt/minecraft/backups"
-GDRIVE_DIR="gdrive:minecraft-backups"
+GDRIVE_DIR="${OFFSITE_REMOTE:-gdrive:minecraft-backups}"
 LOG_FILE="/var/log/offsite-backup.log"
+SYNC="python3 /opt/minecraft/offsite_sync.py $GDRIVE_DIR"
 
-echo "[$(date -u '+%Y-%m-%d %H:%M UTC')] Starting offsite backup" >> $LOG_FILE
+log() { echo "[$(date -u '+%Y-%m-%d %H:%M UTC')] $*" >> $LOG_FILE; }
 
-# Find the most recent backup
-LATEST_BACKUP=$(ls -t $BACKUP_DIR/*.tar.gz 2>/dev/null | head -1)
+log "Starting offsite backup"
 
-if [ -z "$LATEST_BACKUP" ]; then
-    echo "[$(date -u '+%Y-%m-%d %H:%M UTC')] ERROR: No backups found" >> $LOG_FILE
-    exit 1
-fi
-
-BACKUP_NAME=$(basename "$LATEST_BACKUP")
-echo "[$(date -u '+%Y-%m-%d %H:%M UTC')] Uploading $BACKUP_NAME" >> $LOG_FILE
+if [ -d "$BACKUP_DIR/chunkstore/snapshots" ]; then
+    log "Syncing chunk store"
+    $SYNC push-chunks --store "$BACKUP_DIR/chunkstore" --keep 30 >> $LOG_FILE 2>&1
+    RC=$?
+else
+    # Find the most recent backup
+    LATEST_BACKUP=$(ls -t $BACKUP_DIR/world_*.tar.gz $BACKUP_DIR/world_*.tar.zst 2>/dev/null | head -1)
 
-# Upload to Google Drive
-rclone copy "$LATEST_BACKUP" "$GDRIVE_DIR/" --log-file=$LOG_FILE --log-level INFO
+    if [ -z "$LATEST_BACKUP" ]; then
+        log "ERROR: No backups found"
+        exit 1
+    fi
 
-# Keep only last 4 weekly backups on Google Drive (1 month)
-echo "[$(date -u '+%Y-%m-%d %H:%M UTC')] Cleaning old offsite backups" >> $LOG_FILE
-rclone lsf "$GDRIVE_DIR/" --files-only | sort -r | tail -n +5 | while read OLD_BACKUP; do
-    echo "[$(date -u '+%Y-%m-%d %H:%M UTC')] Deleting old backup: $OLD_BACKUP" >> $LOG_FILE
-    rclone delete "$GDRIVE_DIR/$OLD_BACKUP"
-done
+    # Keeps the last 4 weekly archives on Google Drive (1 month)
+    log "Uploading $(basename "$LATEST_BACKUP")"
+    $SYNC push-archive "$LATEST_BACKUP" --keep 4 >> $LOG_FILE 2>&1
+    RC=$?
+fi
 
-echo "[$(date -u '+%Y-%m-%d %H:%M UTC')] Offsite backup complete" >> $LOG_FILE
+if [ $RC -ne 0 ]; then
+    log "ERROR: Offsite backup failed, the next run resumes it"
+    exit 1
+fi
+log "Offsite backup complete"
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+# Incremental, resumable offsite sync
+# Chunk store (chunkstore.py): objects the remote does not have yet are
+# bundled into packs of about PACK_SIZE, each named by its SHA-256 and
+# uploaded with a small index, then the snapshot manifests follow. What has
+# been shipped is recorded locally after every pack, so an interrupted run
+# resumes where it stopped and a nightly run ships only new chunks. Only
+# the newest --keep snapshots are shipped and kept; packs none of them uses
+# any more are deleted, and packs that are mostly dead are repacked.
+# Archives (world_<date>.tar.*): uploaded in fixed-size parts; parts already
+# on the remote with the right size and MD5 are skipped, and the part list
+# is written last, so an archive counts as uploaded only once it is whole.
+#
+# Every upload goes to a temporary name, is checked against the local MD5
+# and only then renamed into place. Remotes are a local directory (testing,
+# NAS mounts) or anything rclone can reach, e.g. gdrive:minecraft-backups.
+#
+# Usage:
+#   offsite_sync.py REMOTE push-chunks [--store DIR] [--keep N]
+#   offsite_sync.py REMOTE push-archive ARCHIVE [--keep N]
+#   offsite_sync.py REMOTE pull-chunks NAME [--store DIR]
+#   offsite_sync.py REMOTE pull-archive NAME DEST_DIR
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from chunkstore import STORE_DIR, ChunkStore, referenced
+
+PACK_SIZE = 16 << 20
+PART_SIZE = 16 << 20
+REPACK_BELOW = 0.5   # repack packs whose live objects are less than this share of their bytes
+
+
+class SyncError(Exception):
+    pass
+
+
+class LocalRemote:
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def list(self, prefix, hashes=False):
+        """{name: {"size", "md5"}} of files under prefix"""
+        found = {}
+        base = self._path(prefix)
+        for directory, _, files in os.walk(base):
+            for f in files:
+                path = os.path.join(directory, f)
+                name = os.path.relpath(path, self.root)
+                found[name] = {"size": os.path.getsize(path),
+                               "md5": self.md5(name) if hashes else None}
+        return found
+
+    def put(self, name, data):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".partial", "wb") as f:
+            f.write(data)
+        return name + ".partial"
+
+    def rename(self, src, dest):
+        os.replace(self._path(src), self._path(dest))
+
+    def get(self, name):
+        with open(self._path(name), "rb") as f:
+            return f.read()
+
+    def md5(self, name):
+        with open(self._path(name), "rb") as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+class RcloneRemote:
+    def __init__(self, root):
+        self.root = root.rstrip("/")
+
+    def _run(self, *args, data=None):
+        result = subprocess.run(["rclone", *args], input=data, capture_output=True)
+        if result.returncode != 0:
+            raise SyncError(f"rclone {args[0]} failed: {result.stderr.decode()[-500:]}")
+        return result.stdout
+
+    def _path(self, name):
+        return f"{self.root}/{name}"
+
+    def list(self, prefix, hashes=False):
+        args = ["lsjson", "-R", "--files-only", self._path(prefix)]
+        if hashes:
+            args += ["--hash", "--hash-type", "md5"]
+        try:
+            entries = json.loads(self._run(*args))
+        except SyncError as e:
+            # The prefix does not exist yet; anything else (auth, network,
+            # quota) must not look like an empty remote
+            if "directory not found" in str(e):
+                return {}
+            raise
+        return {f"{prefix}/{e['Path']}": {"size": e["Size"], "md5": e.get("Hashes", {}).get("md5")}
+                for e in entries}
+
+    def put(self, name, data):
+        self._run("rcat", self._path(name + ".partial"), data=data)
+        return name + ".partial"
+
+    def rename(self, src, dest):
+        self._run("moveto", self._path(src), self._path(dest))
+
+    def get(self, name):
+        return self._run("cat", self._path(name))
+
+    def md5(self, name):
+        out = self._run("md5sum", self._path(name)).decode().split()
+        return out[0] if out and len(out[0]) == 32 else None
+
+    def delete(self, name):
+        self._run("deletefile", self._path(name))
+
+def open_remote(spec):
+    if ":" in spec and not spec.startswith("/"):
+        return RcloneRemote(spec)
+    return LocalRemote(spec)
+
+
+class Uploader:
+    """Verified uploads plus the throughput numbers for the log"""
+
+    def __init__(self, remote):
+        self.remote = remote
+        self.bytes = 0
+        self.files = 0
+        self.skipped = 0
+        self.packs_removed = 0
+        self.start = time.time()
+
+    def put(self, name, data):
+        tmp = self.remote.put(name, data)
+        remote_md5 = self.remote.md5(tmp)
+        if remote_md5 is not None and remote_md5 != hashlib.md5(data).hexdigest():
+            self.remote.delete(tmp)
+            raise SyncError(f"Checksum mismatch after uploading {name}")
+        self.remote.rename(tmp, name)
+        self.bytes += len(data)
+        self.files += 1
+
+    def summary(self):
+        elapsed = max(time.time() - self.start, 1e-3)
+        return (f"Uploaded {self.files} files, {self.bytes / 1e6:.1f} MB in {elapsed:.1f}s "
+                f"({self.bytes / 1e6 / elapsed:.2f} MB/s), {self.skipped} already on the remote, "
+                f"{self.packs_removed} old packs removed")
+
+
+# -- chunk store
+
+def shipped_path(store, remote):
+    key = hashlib.sha1(remote.root.encode()).hexdigest()[:8]
+    return os.path.join(store.root, f"offsite_shipped.{key}.txt")
+
+def load_shipped(store, remote):
+    """Digests known to be on the remote; rebuilt from the remote's pack
+    indexes when there is no local record"""
+    path = shipped_path(store, remote)
+    if os.path.exists(path):
+        with open(path) as f:
+            return {line.strip() for line in f if line.strip()}
+    shipped = set()
+    # A failed listing raises before anything is recorded, so the next run
+    # rebuilds the record instead of trusting an empty one
+    for name in remote.list("packs"):
+        if name.endswith(".idx"):
+            shipped.update(digest for digest, _, _ in json.loads(remote.get(name))["objects"])
+    save_shipped(path, shipped)
+    return shipped
+
+def save_shipped(path, shipped):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.writelines(d + "\n" for d in sorted(shipped))
+    os.replace(tmp, path)
+
+def push_chunks(store, remote, keep):
+    uploader = Uploader(remote)
+    shipped = load_shipped(store, remote)
+    # Older local snapshots would be pruned from the remote right away
+    names = store.names()[-keep:] if keep else store.names()
+    missing = set()
+    for name in names:
+        missing |= referenced(store.load(name))
+    missing -= shipped
+    uploader.skipped = len(shipped)
+
+    record = open(shipped_path(store, remote), "a")
+    try:
+        pack, index = bytearray(), []
+        for digest in sorted(missing):
+            with open(store.object_path(digest), "rb") as f:
+                data = f.read()
+            index.append([digest, len(pack), len(data)])
+            pack += data
+            if len(pack) >= PACK_SIZE:
+                ship_pack(uploader, pack, index, record)
+                pack, index = bytearray(), []
+        if index:
+            ship_pack(uploader, pack, index, record)
+    finally:
+        record.close()
+
+    # Manifests go last: a remote snapshot only ever refers to shipped objects
+    on_remote = remote.list("snapshots", hashes=True)
+    for name in names:
+        rel = f"snapshots/{name}.json.gz"
+        with open(store.manifest_path(name), "rb") as f:
+            data = f.read()
+        if on_remote.get(rel, {}).get("md5") == hashlib.md5(data).hexdigest():
+            continue
+        uploader.put(rel, data)
+    # Old remote snapshots are dropped; packs are kept, since other
+    # snapshots share their objects
+    remote_names = sorted(n for n in remote.list("snapshots") if n.endswith(".json.gz"))
+    for rel in remote_names[:-keep] if keep else []:
+        remote.delete(rel)
+    gc_packs(store, remote, uploader)
+    return uploader
+
+def gc_packs(store, remote, uploader):
+    """Delete packs no snapshot on the remote refers to and repack the ones
+    that are mostly dead; their dead objects are dropped from the shipped
+    record, so they are uploaded again if a later snapshot needs them"""
+    live = set()
+    for rel in remote.list("snapshots"):
+        if rel.endswith(".json.gz"):
+            live |= referenced(json.loads(gzip.decompress(remote.get(rel))))
+    listing = remote.list("packs")
+    drop, sparse, removed = [], [], set()
+    for rel in listing:
+        if rel.endswith(".pack") and rel[:-len(".pack")] + ".idx" not in listing:
+            drop.append(rel)  # upload interrupted before its index
+        if not rel.endswith(".idx"):
+            continue
+        objects = json.loads(remote.get(rel))["objects"]
+        used = [o for o in objects if o[0] in live]
+        if len(used) == len(objects):
+            continue
+        total = sum(length for _, _, length in objects)
+        if used and sum(length for _, _, length in used) >= total * REPACK_BELOW:
+            continue
+        if used:
+            sparse.append((rel[:-len(".idx")] + ".pack", used))
+        drop += [rel, rel[:-len(".idx")] + ".pack"]  # index first: a pack without one is garbage
+        removed.update(o[0] for o in objects if o[0] not in live)
+
+    # The live objects of sparse packs are in new packs before the old go
+    record = open(shipped_path(store, remote), "a")
+    try:
+        pack, index = bytearray(), []
+        for pack_name, objects in sparse:
+            data = remote.get(pack_name)
+            if hashlib.sha256(data).hexdigest() != os.path.basename(pack_name)[:-len(".pack")]:
+                raise SyncError(f"{pack_name} is damaged")
+            for digest, offset, length in objects:
+                index.append([digest, len(pack), length])
+                pack += data[offset:offset + length]
+                if len(pack) >= PACK_SIZE:
+                    ship_pack(uploader, pack, index, record)
+                    pack, index = bytearray(), []
+        if index:
+            ship_pack(uploader, pack, index, record)
+    finally:
+        record.close()
+    for rel in drop:
+        remote.delete(rel)
+    uploader.packs_removed += sum(rel.endswith(".pack") for rel in drop)
+    if removed:
+        path = shipped_path(store, remote)
+        save_shipped(path, load_shipped(store, remote) - removed)
+
+def ship_pack(uploader, pack, index, record):
+    pack = bytes(pack)
+    sha = hashlib.sha256(pack).hexdigest()
+    uploader.put(f"packs/{sha}.pack", pack)
+    uploader.put(f"packs/{sha}.idx", json.dumps({"objects": index}).encode())
+    record.writelines(digest + "\n" for digest, _, _ in index)
+    record.flush()
+    os.fsync(record.fileno())
+
+def pull_chunks(store, remote, name):
+    """Download one snapshot and every object it needs into a local store"""
+    manifest_data = remote.get(f"snapshots/{name}.json.gz")
+    manifest = json.loads(gzip.decompress(manifest_data))
+    needed = {d for d in referenced(manifest) if not store.has(d)}
+    by_pack = {}
+    for rel in remote.list("packs"):
+        if rel.endswith(".idx") and needed:
+            for digest, offset, length in json.loads(remote.get(rel))["objects"]:
+                if digest in needed:
+                    by_pack.setdefault(rel[:-len(".idx")] + ".pack", []).append((digest, offset, length))
+    fetched = 0
+    for pack_name, objects in by_pack.items():
+        pack = remote.get(pack_name)
+        if hashlib.sha256(pack).hexdigest() != os.path.basename(pack_name)[:-len(".pack")]:
+            raise SyncError(f"{pack_name} is damaged")
+        for digest, offset, length in objects:
+            store.put_stored(digest, pack[offset:offset + length])
+            needed.discard(digest)
+            fetched += 1
+    if needed:
+        raise SyncError(f"{len(needed)} objects of {name} are not on the remote")
+    # The manifest only appears once everything it refers to is here
+    os.makedirs(store.snapshots, exist_ok=True)
+    tmp = store.manifest_path(name) + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(manifest_data)
+    os.replace(tmp, store.manifest_path(name))
+    return fetched
+
+
+# -- archives
+
+def push_archive(path, remote, keep):
+    uploader = Uploader(remote)
+    name = os.path.basename(path)
+    prefix = f"archives/{name}"
+    on_remote = remote.list(prefix, hashes=True)
+    if f"{prefix}/parts.json" in on_remote:
+        uploader.skipped = 1
+        return uploader
+    parts = []
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(PART_SIZE)
+            if not data:
+                break
+            rel = f"{prefix}/part-{len(parts):05d}"
+            md5 = hashlib.md5(data).hexdigest()
+            have = on_remote.get(rel)
+            if have and have["size"] == len(data) and have["md5"] == md5:
+                uploader.skipped += 1  # uploaded by an interrupted run
+            else:
+                uploader.put(rel, data)
+            parts.append({"name": rel, "size": len(data), "sha256": hashlib.sha256(data).hexdigest()})
+    sidecar = path + ".idx"
+    if os.path.exists(sidecar):
+        with open(sidecar, "rb") as f:
+            uploader.put(f"{prefix}/index.idx", f.read())
+    uploader.put(f"{prefix}/parts.json", json.dumps({"name": name, "parts": parts}).encode())
+
+    complete = sorted({rel.split("/")[1] for rel in remote.list("archives") if rel.endswith("/parts.json")})
+    for old in complete[:-keep] if keep else []:
+        for rel in remote.list(f"archives/{old}"):
+            remote.delete(rel)
+    return uploader
+
+def pull_archive(remote, name, dest_dir):
+    prefix = f"archives/{name}"
+    listing = json.loads(remote.get(f"{prefix}/parts.json"))
+    dest = os.path.join(dest_dir, name)
+    os.makedirs(dest_dir, exist_ok=True)
+    with open(dest + ".partial", "wb") as out:
+        for part in listing["parts"]:
+            data = remote.get(part["name"])
+            if len(data) != part["size"] or hashlib.sha256(data).hexdigest() != part["sha256"]:
+                raise SyncError(f"{part['name']} is damaged")
+            out.write(data)
+    os.replace(dest + ".partial", dest)
+    if f"{prefix}/index.idx" in remote.list(prefix):
+        with open(dest + ".idx", "wb") as f:
+            f.write(remote.get(f"{prefix}/index.idx"))
+    return dest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental, resumable offsite sync")
+    parser.add_argument("remote", help="local directory or rclone remote (name:path)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("push-chunks")
+    p.add_argument("--store", default=STORE_DIR)
+    p.add_argument("--keep", type=int, default=30, help="snapshots to keep on the remote")
+    p = sub.add_parser("push-archive")
+    p.add_argument("archive")
+    p.add_argument("--keep", type=int, default=4, help="archives to keep on the remote")
+    p = sub.add_parser("pull-chunks")
+    p.add_argument("name")
+    p.add_argument("--store", default=STORE_DIR)
+    p = sub.add_parser("pull-archive")
+    p.add_argument("name")
+    p.add_argument("dest")
+    args = parser.parse_args()
+
+    remote = open_remote(args.remote)
+    try:
+        if args.cmd == "push-chunks":
+            print(push_chunks(ChunkStore(args.store), remote, args.keep).summary())
+        elif args.cmd == "push-archive":
+            print(push_archive(args.archive, remote, args.keep).summary())
+        elif args.cmd == "pull-chunks":
+            fetched = pull_chunks(ChunkStore(args.store), remote, args.name)
+            print(f"Fetched {fetched} objects for {args.name}")
+        elif args.cmd == "pull-archive":
+            print(f"Downloaded {pull_archive(remote, args.name, args.dest)}")
+    except (SyncError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
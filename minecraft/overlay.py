@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# Timestamp and logo overlay for finished renders
+# Replaces the two ImageMagick passes (resize the logo, then annotate and
+# composite) every render script used to run. The raw render is decoded
+# once, overlaid and encoded once, and the final file is written atomically
+# so readers never see a half-written image. The scaled logo and the stroked
+# glyph tiles are cached on disk (every render runs a fresh process) until
+# the logo, font or style changes; a cached timestamp needs no font at all.
+#
+# Usage: overlay.py SRC DEST [--style map|detail] [--text TEXT] [--logo PATH]
+
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import os
+
+from PIL import Image, ImageDraw, ImageFont
+
+LOGO = "/mnt/shared/jee.bz.png"
+CACHE_DIR = os.environ.get("OVERLAY_CACHE_DIR", "/var/cache/jeebz-render/overlay")
+FONT_DIR = "/usr/share/fonts/truetype/dejavu"
+LOGO_HEIGHT = 80
+LOGO_MARGIN = 5
+
+# Same look as the old convert -annotate settings
+STYLES = {
+    "map": {"font": "DejaVuSansMono-Bold.ttf", "size": 18, "fill": "white",
+            "stroke": "red", "stroke_width": 2, "margin": 8},
+    "detail": {"font": "DejaVuSansMono.ttf", "size": 12, "fill": "white",
+               "stroke": "black", "stroke_width": 1, "margin": 5},
+}
+
+
+def scaled_logo(path=LOGO, height=LOGO_HEIGHT):
+    """The logo resized to `height`, cached until the source file changes"""
+    st = os.stat(path)
+    cached = os.path.join(CACHE_DIR, f"logo_{height}_{st.st_mtime_ns}_{st.st_size}.png")
+    try:
+        with Image.open(cached) as im:
+            return im.convert("RGBA")
+    except OSError:
+        pass
+    with Image.open(path) as im:
+        logo = im.convert("RGBA")
+    logo = logo.resize((max(1, round(logo.width * height / logo.height)), height), Image.LANCZOS)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for old in glob.glob(os.path.join(CACHE_DIR, f"logo_{height}_*.png")):
+        os.remove(old)
+    tmp = f"{cached}.{os.getpid()}.tmp"
+    logo.save(tmp, format="PNG")
+    os.replace(tmp, cached)
+    return logo
+
+
+_fonts = {}
+_glyph_dirs = {}
+
+def font(style):
+    if style not in _fonts:
+        spec = STYLES[style]
+        try:
+            _fonts[style] = ImageFont.truetype(os.path.join(FONT_DIR, spec["font"]), spec["size"])
+        except OSError:
+            try:
+                _fonts[style] = ImageFont.load_default(spec["size"])
+            except TypeError:
+                # Pillow < 10.1 (bookworm) only has the fixed-size bitmap font
+                _fonts[style] = ImageFont.load_default()
+    return _fonts[style]
+
+def glyph_dir(style):
+    """Cache directory for a style's glyphs; a new font file or style
+    settings give a new directory"""
+    if style not in _glyph_dirs:
+        spec = STYLES[style]
+        try:
+            st = os.stat(os.path.join(FONT_DIR, spec["font"]))
+            source = [st.st_mtime_ns, st.st_size]
+        except OSError:
+            source = None  # fallback font
+        key = hashlib.sha1(json.dumps([spec, source], sort_keys=True).encode()).hexdigest()[:16]
+        _glyph_dirs[style] = os.path.join(CACHE_DIR, f"glyphs_{style}_{key}")
+    return _glyph_dirs[style]
+
+def render_glyph(style, char):
+    spec, f = STYLES[style], font(style)
+    pad = spec["stroke_width"]
+    if hasattr(f, "getmetrics"):
+        ascent, descent = f.getmetrics()
+        height = ascent + descent
+    else:
+        height = f.getbbox("Hg")[3]
+    advance = round(f.getlength(char))
+    tile = Image.new("RGBA", (advance + 2 * pad, height + 2 * pad))
+    ImageDraw.Draw(tile).text((pad, pad), char, font=f, fill=spec["fill"],
+                              stroke_width=pad, stroke_fill=spec["stroke"])
+    return tile
+
+def glyph(style, char):
+    """One stroked character as an RGBA tile and its advance; the fonts are
+    monospace. Tiles are cached on disk as <codepoint>.png"""
+    pad = STYLES[style]["stroke_width"]
+    path = os.path.join(glyph_dir(style), f"{ord(char):x}.png")
+    try:
+        with Image.open(path) as im:
+            tile = im.convert("RGBA")
+    except OSError:
+        tile = render_glyph(style, char)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            tile.save(tmp, format="PNG")
+            os.replace(tmp, path)
+        except OSError:
+            pass  # the cache is an optimisation only
+    return tile, tile.width - 2 * pad
+
+def draw_text(image, text, style):
+    """Draw `text` in the top right corner (gravity NorthEast)"""
+    spec = STYLES[style]
+    glyphs = [glyph(style, c) for c in text]
+    width = sum(advance for _, advance in glyphs)
+    x = image.width - spec["margin"] - width - spec["stroke_width"]
+    y = spec["margin"] - spec["stroke_width"]
+    for tile, advance in glyphs:
+        image.alpha_composite(tile, (x, y))
+        x += advance
+
+
+def apply(src, dest, style="map", text=None, logo=LOGO):
+    if text is None:
+        text = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+    with Image.open(src) as im:
+        opaque = "A" not in im.getbands()
+        image = im.convert("RGBA")
+    draw_text(image, text, style)
+    if os.path.exists(logo):
+        small = scaled_logo(logo)
+        # gravity SouthWest +5+5
+        image.alpha_composite(small, (LOGO_MARGIN, image.height - small.height - LOGO_MARGIN))
+    if opaque:
+        image = image.convert("RGB")
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    image.save(tmp, format="PNG")
+    os.replace(tmp, dest)
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add the timestamp and logo to a render")
+    parser.add_argument("src")
+    parser.add_argument("dest")
+    parser.add_argument("--style", choices=sorted(STYLES), default="map")
+    parser.add_argument("--text")
+    parser.add_argument("--logo", default=LOGO)
+    args = parser.parse_args()
+    print(apply(args.src, args.dest, args.style, args.text, args.logo))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,51 @@
 #!/usr/bin/env python3
-# Simple RCON client for Minecraft
-# Usage: rcon.py <command>
+# RCON client for Minecraft
+# Keeps one authenticated connection open and runs commands over it. Every
+# command gets its own request ID and is followed by a sentinel packet of an
+# unknown type; the server answers packets in order, so the reply to the
+# sentinel marks the end of a (possibly multi-packet) response.
+#
+# The vanilla server reads one packet per read() and drops the connection
+# when a read returns more than that, so nothing is pipelined: the sentinel
+# is only sent once the command's first reply is in (the server is done
+# reading it), and the next command once the sentinel's echo is in.
+#
+# Usage:
+#   rcon.py <command>      run one command
+#   rcon.py -              run commands from stdin, one per line, on one connection
 # Password is read from server.properties
+#
+# Library:
+#   with RconClient() as rcon:
+#       rcon.command("list")
+#       rcon.commands(["save-all flush", "tick query"])
+#   async with AsyncRconClient() as rcon:
+#       await rcon.command("list")
+
+import asyncio
+import itertools
+import os
+import socket
+import struct
+import sys
+import threading
+
+HOST = "127.0.0.1"
+PORT = 25575
+
+SERVERDATA_AUTH = 3
+SERVERDATA_EXECCOMMAND = 2
+SENTINEL_TYPE = 200         # unknown type; the server answers "Unknown request c8"
+MAX_COMMAND = 1446          # longest payload the server accepts
+MAX_PACKET = 4096 + 10      # responses are split into 4096 byte payloads
+
+
+class RconError(Exception):
+    pass
+
+class RconAuthError(RconError):
+    pass
 
-import socket, struct, sys, os
 
 def get_password():
     props_file = "/opt/minecraft/server.properties"
@@ -14,34 +56,230 @@ def get_password():
                     return line.split("=", 1)[1].strip()
     return os.environ.get("RCON_PASSWORD", "")
 
+def encode_packet(req_id, pkt_type, payload):
+    data = struct.pack("<ii", req_id, pkt_type) + payload + b"\x00\x00"
+    return struct.pack("<i", len(data)) + data
+
+def decode_packet(data):
+    """(request id, type, payload bytes) of a packet body without its length"""
+    req_id, pkt_type = struct.unpack_from("<ii", data)
+    return req_id, pkt_type, data[8:-2]
+
+def check_length(length):
+    if not 10 <= length <= MAX_PACKET:
+        raise RconError(f"Bad packet length {length}")
+
+def encode_command(command):
+    payload = command.encode()
+    if len(payload) > MAX_COMMAND:
+        raise ValueError(f"Command longer than {MAX_COMMAND} bytes")
+    return payload
+
+
+class _Ids:
+    """Distinct positive request IDs; -1 is the server's auth failure marker"""
+    def __init__(self):
+        self._counter = itertools.count(1)
+
+    def __call__(self):
+        return next(self._counter) % 0x7fffffff or next(self._counter)
+
+
+class RconClient:
+    def __init__(self, host=HOST, port=PORT, password=None, timeout=10):
+        self.host = host
+        self.port = port
+        self.password = get_password() if password is None else password
+        self.timeout = timeout
+        self._sock = None
+        self._ids = _Ids()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        try:
+            auth_id = self._ids()
+            sock.sendall(encode_packet(auth_id, SERVERDATA_AUTH, self.password.encode()))
+            while True:
+                req_id, _, _ = self._recv(sock)
+                if req_id == -1:
+                    raise RconAuthError("RCON authentication failed")
+                if req_id == auth_id:
+                    break
+        except BaseException:
+            sock.close()
+            raise
+        self._sock = sock
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def command(self, command):
+        return self.commands([command])[0]
+
+    def commands(self, commands):
+        """Run commands one after another on this connection and return their
+        responses in order"""
+        payloads = [encode_command(c) for c in commands]
+        with self._lock:
+            if self._sock is None:
+                self.connect()
+            try:
+                return [self._exchange(payload) for payload in payloads]
+            except (OSError, RconError):
+                # The stream position is unknown now; start over next time
+                self.close()
+                raise
+
+    def _exchange(self, payload):
+        cmd_id, sentinel_id = self._ids(), self._ids()
+        self._sock.sendall(encode_packet(cmd_id, SERVERDATA_EXECCOMMAND, payload))
+        parts = []
+        while not parts:
+            req_id, _, data = self._recv(self._sock)
+            if req_id == cmd_id:
+                parts.append(data)
+        self._sock.sendall(encode_packet(sentinel_id, SENTINEL_TYPE, b""))
+        while True:
+            req_id, _, data = self._recv(self._sock)
+            if req_id == sentinel_id:
+                return b"".join(parts).decode(errors="replace")
+            if req_id == cmd_id:
+                parts.append(data)
+
+    @staticmethod
+    def _recv(sock):
+        length = struct.unpack("<i", _recv_exact(sock, 4))[0]
+        check_length(length)
+        return decode_packet(_recv_exact(sock, length))
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise RconError("Connection closed by server")
+        buf += chunk
+    return bytes(buf)
+
+
+class AsyncRconClient:
+    """asyncio client; concurrent callers share the connection and take turns"""
+
+    def __init__(self, host=HOST, port=PORT, password=None, timeout=10):
+        self.host = host
+        self.port = port
+        self.password = get_password() if password is None else password
+        self.timeout = timeout
+        self._ids = _Ids()
+        self._reader = self._writer = None
+        self._lock = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def connect(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._connect()
+
+    async def _connect(self):
+        if self._writer is not None:
+            return
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        try:
+            auth_id = self._ids()
+            writer.write(encode_packet(auth_id, SERVERDATA_AUTH, self.password.encode()))
+            while True:
+                req_id, _, _ = await asyncio.wait_for(self._read(reader), self.timeout)
+                if req_id == -1:
+                    raise RconAuthError("RCON authentication failed")
+                if req_id == auth_id:
+                    break
+        except BaseException:
+            writer.close()
+            raise
+        self._reader, self._writer = reader, writer
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def command(self, command):
+        return (await self.commands([command]))[0]
+
+    async def commands(self, commands):
+        """Run commands one after another (see RconClient) and return their
+        responses in order"""
+        payloads = [encode_command(c) for c in commands]
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._connect()
+            try:
+                return [await asyncio.wait_for(self._exchange(payload), self.timeout) for payload in payloads]
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, RconError) as e:
+                await self.close()
+                if isinstance(e, RconError):
+                    raise
+                raise RconError(f"Connection lost: {e!r}") from e
+
+    async def _exchange(self, payload):
+        cmd_id, sentinel_id = self._ids(), self._ids()
+        self._writer.write(encode_packet(cmd_id, SERVERDATA_EXECCOMMAND, payload))
+        await self._writer.drain()
+        parts = []
+        while not parts:
+            req_id, _, data = await self._read(self._reader)
+            if req_id == cmd_id:
+                parts.append(data)
+        self._writer.write(encode_packet(sentinel_id, SENTINEL_TYPE, b""))
+        await self._writer.drain()
+        while True:
+            req_id, _, data = await self._read(self._reader)
+            if req_id == sentinel_id:
+                return b"".join(parts).decode(errors="replace")
+            if req_id == cmd_id:
+                parts.append(data)
+
+    @staticmethod
+    async def _read(reader):
+        length = struct.unpack("<i", await reader.readexactly(4))[0]
+        check_length(length)
+        return decode_packet(await reader.readexactly(length))
+
+
 def rcon(host, port, password, command):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((host, port))
-
-    def send(pkt_type, payload):
-        pkt_id = 0
-        data = struct.pack("<ii", pkt_id, pkt_type) + payload.encode() + b"\x00\x00"
-        sock.send(struct.pack("<i", len(data)) + data)
-
-    def recv():
-        length = struct.unpack("<i", sock.recv(4))[0]
-        data = sock.recv(length)
-        return data[8:-2].decode()
-
-    send(3, password)  # auth
-    recv()
-    send(2, command)   # command
-    result = recv()
-    sock.close()
-    return result
+    with RconClient(host, port, password) as client:
+        return client.command(command)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: rcon.py <command>")
+        print("Usage: rcon.py <command> | rcon.py -")
         sys.exit(1)
-    cmd = " ".join(sys.argv[1:])
     password = get_password()
     if not password:
         print("Error: Could not find RCON password")
         sys.exit(1)
-    print(rcon("127.0.0.1", 25575, password, cmd))
+    if sys.argv[1:] == ["-"]:
+        cmds = [line.strip() for line in sys.stdin if line.strip()]
+    else:
+        cmds = [" ".join(sys.argv[1:])]
+    with RconClient(HOST, PORT, password) as client:
+        for result in client.commands(cmds):
+            print(result)
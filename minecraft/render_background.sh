@@ -156,13 +156,12 @@ if [ -f "$TEMP" ] && [ $(stat -c%s "$TEMP" 2>/dev/null || echo 0) -gt 50000 ]; t
         \( +clone -fill black -colorize 100% -fill white -draw "ellipse 960,540 1200,800 0,360" -blur 0x40 \) \
         -compose multiply -composite \
         -quality 90 \
-        "$OUTPUT"
+        "jpg:$OUTPUT.tmp"
+    # Rename into place; the webapp's publisher picks it up from there
+    mv -f "$OUTPUT.tmp" "$OUTPUT"
 
     rm -f "$TEMP"
     echo "$(date): Cinematic background render complete"
-
-    # Signal webapp to refresh (touch a marker file)
-    touch /mnt/shared/.background_updated
 else
     echo "$(date): Background render failed"
 fi
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# Content-addressed cache for finished renders
+# The key covers the scene file (camera position, FOV, render settings and
+# chunk list) plus the headers of every region file the scene reads, so it
+# changes as soon as any chunk in view is saved. Entries are evicted least
+# recently used first once the cache exceeds its disk budget.
+#
+# Usage:
+#   render_cache.py key --scene FILE --chunks X0 X1 Z0 Z1 [--world DIR]
+#   render_cache.py get KEY DEST    (exit 0 on hit, 1 on miss)
+#   render_cache.py put KEY SRC
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+
+import anvil
+
+CACHE_DIR = os.environ.get("RENDER_CACHE_DIR", "/var/cache/jeebz-render")
+CACHE_BYTES = int(os.environ.get("RENDER_CACHE_BYTES", str(512 * 1024 * 1024)))
+
+
+def cache_key(scene, chunks, world=anvil.WORLD_DIR):
+    h = hashlib.sha256()
+    with open(scene, "rb") as f:
+        h.update(f.read())
+    cx0, cx1, cz0, cz1 = chunks
+    for rx, rz in anvil.regions_for_chunks(cx0, cx1, cz0, cz1):
+        header = anvil.read_header_bytes(anvil.region_path(world, rx, rz))
+        h.update(f"r.{rx}.{rz}:".encode())
+        h.update(hashlib.sha256(header).digest() if header else b"missing")
+    return h.hexdigest()[:32]
+
+def entry_path(key):
+    return os.path.join(CACHE_DIR, key + ".png")
+
+def copy_atomic(src, dest):
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+def get(key, dest):
+    path = entry_path(key)
+    if not os.path.exists(path):
+        return False
+    copy_atomic(path, dest)
+    os.utime(path)  # mtime doubles as the LRU clock
+    return True
+
+def put(key, src):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    copy_atomic(src, entry_path(key))
+    evict()
+
+def evict(budget=CACHE_BYTES):
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".png"):
+            continue
+        st = os.stat(os.path.join(CACHE_DIR, name))
+        entries.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= budget:
+            break
+        os.remove(os.path.join(CACHE_DIR, name))
+        total -= size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render cache")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("key")
+    p.add_argument("--scene", required=True)
+    p.add_argument("--chunks", type=int, nargs=4, required=True, metavar=("X0", "X1", "Z0", "Z1"))
+    p.add_argument("--world", default=anvil.WORLD_DIR)
+    p = sub.add_parser("get")
+    p.add_argument("key")
+    p.add_argument("dest")
+    p = sub.add_parser("put")
+    p.add_argument("key")
+    p.add_argument("src")
+    args = parser.parse_args()
+
+    if args.cmd == "key":
+        print(cache_key(args.scene, args.chunks, args.world))
+    elif args.cmd == "get":
+        sys.exit(0 if get(args.key, args.dest) else 1)
+    elif args.cmd == "put":
+        put(args.key, args.src)
+
+
+if __name__ == "__main__":
+    main()
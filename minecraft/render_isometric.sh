@@ -1,21 +1,52 @@
 #!/bin/bash
 # Render isometric 3D view of spawn area using Chunky
 # Path-traced rendering for high quality output
-# Usage: render_isometric.sh [n|s|e|w|in|out|reset]
+# Usage: render_isometric.sh [--if-changed] [--cam X Z FOV]
+#   --if-changed  skip the render when no chunk in view changed (cron)
+#   --cam         render from this camera and store it as the current state;
+#                 the webapp owns camera movement and passes absolute values
+# While Chunky works towards TARGET_SPP, the snapshots it saves at each
+# PREVIEW_SPP sample count are published as previews (the publisher pushes
+# them to open pages), so a camera move shows a first image long before the
+# final one.
 
 OUTPUT="/mnt/shared/spawn_detail.png"
 TEMP="/tmp/spawn_isometric.png"
 LOGO="/mnt/shared/jee.bz.png"
-LOGO_SMALL="/tmp/jee_logo_small_iso.png"
 SCENE_DIR="/opt/chunky/scenes"
 SCENE_NAME="spawn_isometric"
 STATE_FILE="/opt/chunky/camera_state"
+TARGET_SPP=16
+PREVIEW_SPP="${PREVIEW_SPP-1 4}"    # empty: no previews
 
 # Default camera position (looking at base at -29,415)
 DEFAULT_CAM_X=-29
 DEFAULT_CAM_Z=415
 DEFAULT_FOV=80
-MOVE_STEP=30
+
+IF_CHANGED=0
+NEW_CAM=""
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --if-changed) IF_CHANGED=1; shift ;;
+        --cam) NEW_CAM="$2 $3 $4"; shift 4 ;;
+        *) echo "Unknown argument: $1"; exit 1 ;;
+    esac
+done
+
+# Coalesce with a render that is already running (webapp job or cron): a
+# plain refresh waits for it and reuses its output, a new camera waits and
+# then renders
+LOCK_FILE="/tmp/render_isometric.lock"
+exec 201>"$LOCK_FILE"
+if ! flock -n 201; then
+    echo "Isometric render already running, waiting for it..."
+    flock 201
+    if [ -z "$NEW_CAM" ]; then
+        echo "Joined in-flight render, nothing left to do"
+        exit 0
+    fi
+fi
 
 # Load or initialize camera state
 if [ -f "$STATE_FILE" ]; then
@@ -26,23 +57,9 @@ else
     FOV=$DEFAULT_FOV
 fi
 
-# Handle camera movement arguments (can be comma-separated like "n,n,e,w")
-IFS=',' read -ra MOVES <<< "$1"
-for move in "${MOVES[@]}"; do
-    case "$move" in
-        n)  CAM_Z=$((CAM_Z - MOVE_STEP)) ;;
-        s)  CAM_Z=$((CAM_Z + MOVE_STEP)) ;;
-        e)  CAM_X=$((CAM_X + MOVE_STEP)) ;;
-        w)  CAM_X=$((CAM_X - MOVE_STEP)) ;;
-        in) FOV=$((FOV - 10)); [ $FOV -lt 30 ] && FOV=30 ;;
-        out) FOV=$((FOV + 10)); [ $FOV -gt 150 ] && FOV=150 ;;
-        reset)
-            CAM_X=$DEFAULT_CAM_X
-            CAM_Z=$DEFAULT_CAM_Z
-            FOV=$DEFAULT_FOV
-            ;;
-    esac
-done
+if [ -n "$NEW_CAM" ]; then
+    read -r CAM_X CAM_Z FOV <<< "$NEW_CAM"
+fi
 
 # Save camera state
 cat > "$STATE_FILE" << EOF
@@ -51,13 +68,6 @@ CAM_Z=$CAM_Z
 FOV=$FOV
 EOF
 
-# Create scene directory if needed
-mkdir -p "$SCENE_DIR"
-
-# Clear ALL old scene data to force completely fresh render
-rm -f "${SCENE_DIR}/${SCENE_NAME}"* 2>/dev/null
-rm -rf "${SCENE_DIR}/snapshots" 2>/dev/null
-
 # Calculate chunk range based on camera position and FOV
 # Higher FOV = larger area rendered, lower FOV = smaller area
 # Base range is 200 blocks at FOV 80, scales proportionally
@@ -67,6 +77,27 @@ CHUNK_X_MAX=$(( (CAM_X + RANGE) / 16 ))
 CHUNK_Z_MIN=$(( (CAM_Z - RANGE) / 16 ))
 CHUNK_Z_MAX=$(( (CAM_Z + RANGE) / 16 ))
 
+# Skip scheduled renders when no chunk in view was saved since the last one
+# (the digest also changes when the camera, and so the area, moves)
+AREA_DIGEST=$(python3 /opt/minecraft/chunk_changes.py check isometric \
+    --chunks $CHUNK_X_MIN $CHUNK_X_MAX $CHUNK_Z_MIN $CHUNK_Z_MAX)
+AREA_CHANGED=$?
+if [ $AREA_CHANGED -ne 0 ] && [ $AREA_CHANGED -ne 3 ]; then
+    echo "Error: chunk change check failed (exit $AREA_CHANGED)"
+    exit 1
+fi
+if [ $IF_CHANGED -eq 1 ] && [ $AREA_CHANGED -eq 3 ]; then
+    echo "No chunks changed in view since last render, skipping"
+    exit 0
+fi
+
+# Create scene directory if needed
+mkdir -p "$SCENE_DIR"
+
+# Clear ALL old scene data to force completely fresh render
+rm -f "${SCENE_DIR}/${SCENE_NAME}"* 2>/dev/null
+rm -rf "${SCENE_DIR}/snapshots" 2>/dev/null
+
 # Generate chunk list
 CHUNKS=""
 for cx in $(seq $CHUNK_X_MIN $CHUNK_X_MAX); do
@@ -76,6 +107,16 @@ for cx in $(seq $CHUNK_X_MIN $CHUNK_X_MAX); do
 done
 CHUNKS="${CHUNKS%,}"
 
+# Chunky only saves snapshots when it dumps the render, so previews need a
+# dump at every sample
+if [ -n "$PREVIEW_SPP" ]; then
+    DUMP_FREQUENCY=1
+    SAVE_SNAPSHOTS=true
+else
+    DUMP_FREQUENCY=50
+    SAVE_SNAPSHOTS=false
+fi
+
 # Create scene JSON with current camera position
 cat > "${SCENE_DIR}/${SCENE_NAME}.json" << EOF
 {
@@ -88,9 +129,9 @@ cat > "${SCENE_DIR}/${SCENE_NAME}.json" << EOF
   "outputMode": "PNG",
   "renderTime": 0,
   "spp": 0,
-  "sppTarget": 16,
-  "dumpFrequency": 50,
-  "saveSnapshots": false,
+  "sppTarget": ${TARGET_SPP},
+  "dumpFrequency": ${DUMP_FREQUENCY},
+  "saveSnapshots": ${SAVE_SNAPSHOTS},
   "rayDepth": 3,
   "pathTrace": true,
   "emittersEnabled": true,
@@ -164,6 +205,36 @@ cat > "${SCENE_DIR}/${SCENE_NAME}.json" << EOF
 }
 EOF
 
+# Serve repeat camera positions straight from the render cache
+RENDER_CACHE="python3 /opt/minecraft/render_cache.py"
+CACHE_KEY=$($RENDER_CACHE key --scene "${SCENE_DIR}/${SCENE_NAME}.json" \
+    --chunks $CHUNK_X_MIN $CHUNK_X_MAX $CHUNK_Z_MIN $CHUNK_Z_MAX 2>/dev/null)
+if [ -n "$CACHE_KEY" ] && $RENDER_CACHE get "$CACHE_KEY" "$OUTPUT"; then
+    echo "Served from render cache ($CACHE_KEY)"
+    [ -n "$AREA_DIGEST" ] && python3 /opt/minecraft/chunk_changes.py mark isometric "$AREA_DIGEST"
+    nohup /opt/minecraft/render_background.sh > /tmp/bg_render.log 2>&1 201>&- &
+    exit 0
+fi
+
+# Overlay and publish an image. Versions are whole-second mtimes and
+# versioned URLs are cached for good, so every image published by this run
+# gets a later second than the one before; the mtime is set before the
+# rename so the publisher never sees the file without it.
+TIMESTAMP=$(date -u '+%Y-%m-%d %H:%M UTC')
+LAST_PUBLISHED=0
+NEXT="${OUTPUT%.png}.next.png"
+publish() {
+    local mtime
+    python3 /opt/minecraft/overlay.py "$1" "$NEXT" --style map --logo "$LOGO" --text "$2" || return 1
+    mtime=$(stat -c %Y "$NEXT")
+    if [ "$mtime" -le "$LAST_PUBLISHED" ]; then
+        mtime=$((LAST_PUBLISHED + 1))
+        touch -d "@$mtime" "$NEXT"
+    fi
+    mv -f "$NEXT" "$OUTPUT"
+    LAST_PUBLISHED=$mtime
+}
+
 echo "Rendering isometric view (cam: $CAM_X,$CAM_Z fov: $FOV)..."
 
 # Run Chunky in headless mode (-f forces render even without octree file)
@@ -172,10 +243,27 @@ java -Dchunky.home=/opt/chunky \
      -jar ChunkyLauncher.jar \
      -scene-dir "$SCENE_DIR" \
      -render "$SCENE_NAME" \
-     -target 16 \
+     -target $TARGET_SPP \
      -threads 6 \
      -f \
-     2>&1 | grep -E "(Loading|Rendering|error|Error|SPP)"
+     2>&1 | grep -E "(Loading|Rendering|error|Error|SPP)" &
+CHUNKY_PID=$!
+
+# Publish each preview as soon as its snapshot can be read in full (a
+# snapshot still being written fails to load and is tried again)
+PENDING=" $PREVIEW_SPP "
+while [ -n "${PENDING// /}" ] && kill -0 $CHUNKY_PID 2>/dev/null; do
+    for spp in $PENDING; do
+        SNAPSHOT="${SCENE_DIR}/snapshots/${SCENE_NAME}-${spp}.png"
+        if [ -f "$SNAPSHOT" ] && publish "$SNAPSHOT" "$TIMESTAMP (preview)" 2>/dev/null; then
+            echo "Published ${spp} SPP preview"
+            PENDING="${PENDING/ $spp / }"
+        fi
+    done
+    sleep 0.5
+done
+wait $CHUNKY_PID
+rm -f "$NEXT"
 
 # Take snapshot
 java -Dchunky.home=/opt/chunky \
@@ -187,6 +275,7 @@ java -Dchunky.home=/opt/chunky \
 # Check if render succeeded (file should be > 10KB for a real render)
 if [ ! -f "$TEMP" ] || [ $(stat -c%s "$TEMP" 2>/dev/null || echo 0) -lt 10000 ]; then
     echo "Chunky render failed or too small, falling back to unmined"
+    CACHE_KEY=""  # never cache the fallback image
     # Fallback to unmined with 3D shadows (area matches FOV-based range)
     /opt/minecraft/unmined-cli_0.19.54-dev_linux-x64/unmined-cli image render \
         --world=/opt/minecraft/world \
@@ -197,24 +286,16 @@ if [ ! -f "$TEMP" ] || [ $(stat -c%s "$TEMP" 2>/dev/null || echo 0) -lt 10000 ];
         --trim 2>/dev/null
 fi
 
-# Create small version of logo (80px height)
-convert "$LOGO" -resize x80 "$LOGO_SMALL"
+# Add timestamp (top right) and logo (bottom left) in one pass
+publish "$TEMP" "$TIMESTAMP"
 
-# Add timestamp (top right) and logo (bottom left)
-TIMESTAMP=$(date -u '+%Y-%m-%d %H:%M UTC')
-convert "$TEMP" \
-    -gravity NorthEast \
-    -font DejaVu-Sans-Mono-Bold \
-    -pointsize 18 \
-    -fill white \
-    -stroke red \
-    -strokewidth 2 \
-    -annotate +8+8 "$TIMESTAMP" \
-    \( "$LOGO_SMALL" \) -gravity SouthWest -geometry +5+5 -composite \
-    "$OUTPUT"
-
-rm -f "$TEMP" "$LOGO_SMALL"
+rm -f "$TEMP"
 echo "Isometric render completed with timestamp: $TIMESTAMP"
 
+if [ -n "$CACHE_KEY" ]; then
+    $RENDER_CACHE put "$CACHE_KEY" "$OUTPUT"
+    [ -n "$AREA_DIGEST" ] && python3 /opt/minecraft/chunk_changes.py mark isometric "$AREA_DIGEST"
+fi
+
 # Trigger background render (runs in background at low priority)
-nohup /opt/minecraft/render_background.sh > /tmp/bg_render.log 2>&1 &
+nohup /opt/minecraft/render_background.sh > /tmp/bg_render.log 2>&1 201>&- &
@@ -1,34 +1,45 @@
 #!/bin/bash
 # Render spawn map with timestamp and logo overlay
+# Usage: render_map.sh [--if-changed]
+#   --if-changed  skip the render when no chunk in the area changed (cron)
 
 OUTPUT="/mnt/shared/spawn_map.png"
 TEMP="/tmp/spawn_map_raw.png"
 LOGO="/mnt/shared/jee.bz.png"
-LOGO_SMALL="/tmp/jee_logo_small.png"
 
-# Render the map
-/opt/minecraft/unmined-cli_0.19.54-dev_linux-x64/unmined-cli image render \
-    --world=/opt/minecraft/world \
-    --output="$TEMP" \
-    --area="b((-285,159),(227,671))" \
-    --zoom=0 \
-    --trim 2>/dev/null
+# Coalesce with a render that is already running (webapp job or cron):
+# wait for it and reuse its output instead of rendering the same area twice
+LOCK_FILE="/tmp/render_map.lock"
+exec 201>"$LOCK_FILE"
+if ! flock -n 201; then
+    echo "Map render already running, waiting for it..."
+    flock 201
+    echo "Joined in-flight render, nothing left to do"
+    exit 0
+fi
 
-# Create small version of logo (40px height)
-convert "$LOGO" -resize x80 "$LOGO_SMALL"
+# Re-render only the tiles whose chunks changed and reassemble the map
+# (exits 3 with --if-changed when no tile changed)
+python3 /opt/minecraft/map_tiles.py --output "$TEMP" $1
+RC=$?
+if [ $RC -eq 3 ]; then
+    echo "No chunks changed since last map render, skipping"
+    exit 0
+elif [ $RC -ne 0 ]; then
+    echo "Map render failed"
+    rm -f "$TEMP"
+    exit 1
+fi
 
-# Add timestamp (top right) and logo (bottom left)
+# Add timestamp (top right) and logo (bottom left) in one pass
 TIMESTAMP=$(date -u '+%Y-%m-%d %H:%M UTC')
-convert "$TEMP" \
-    -gravity NorthEast \
-    -font DejaVu-Sans-Mono-Bold \
-    -pointsize 18 \
-    -fill white \
-    -stroke red \
-    -strokewidth 2 \
-    -annotate +8+8 "$TIMESTAMP" \
-    \( "$LOGO_SMALL" \) -gravity SouthWest -geometry +5+5 -composite \
-    "$OUTPUT"
+if ! python3 /opt/minecraft/overlay.py "$TEMP" "$OUTPUT" --style map --logo "$LOGO" --text "$TIMESTAMP"; then
+    echo "Map overlay failed"
+    rm -f "$TEMP"
+    exit 1
+fi
+rm -f "$TEMP"
 
-rm -f "$TEMP" "$LOGO_SMALL"
+# Only now do the re-rendered tiles count as published
+python3 /opt/minecraft/map_tiles.py --commit
 echo "Map rendered with timestamp: $TIMESTAMP"
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# Server performance telemetry
+# Samples the running server every INTERVAL seconds and appends the sample
+# to the "server" series of a tsdb.py store in /mnt/shared/telemetry, where
+# the webapp serves it as JSON for charts. Game-side numbers (tick query,
+# list, entity counts) come from an RCON connection kept open between
+# samples; process numbers for the JVM and the container come from /proc, as
+# jstat cannot attach with -XX:+PerfDisableSharedMem.
+#
+# Usage:
+#   telemetry.py [--interval S]   collect until stopped (telemetry.service)
+#   telemetry.py --once           print one sample
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import tsdb
+from rcon import RconClient, RconError
+
+TELEMETRY_DIR = os.environ.get("TELEMETRY_DIR", "/mnt/shared/telemetry")
+INTERVAL = int(os.environ.get("TELEMETRY_INTERVAL", "10"))
+SERVER_JAR = b"fabric-server-launch.jar"
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE = os.sysconf("SC_PAGE_SIZE")
+
+FIELDS = ("online", "tps", "mspt", "mspt_p95", "mspt_p99", "players", "entities", "items",
+          "entities_overworld", "entities_nether", "entities_end", "rcon_ms",
+          "cpu", "rss_mb", "threads", "load1", "mem_available_mb")
+
+COMMANDS = (
+    "tick query",
+    "list",
+    "execute if entity @e",
+    "execute if entity @e[type=item]",
+    # Plain @e matches every dimension whatever `execute in` says; any
+    # distance limit restricts it to the dimension being executed in
+    "execute in minecraft:overworld if entity @e[distance=0..]",
+    "execute in minecraft:the_nether if entity @e[distance=0..]",
+    "execute in minecraft:the_end if entity @e[distance=0..]",
+)
+
+
+def parse_tick(text):
+    """Average and percentile tick times from `tick query` (1.20.3+)"""
+    sample = {}
+    m = re.search(r"Target tick rate: ([\d.]+)", text)
+    target = float(m.group(1)) if m else 20.0
+    m = re.search(r"Average time per tick: ([\d.]+)ms", text)
+    if m:
+        sample["mspt"] = float(m.group(1))
+        # A tick that finishes early still waits for the next one
+        sample["tps"] = min(target, 1000 / sample["mspt"]) if sample["mspt"] else target
+    for p in ("95", "99"):
+        m = re.search(rf"P{p}: ([\d.]+)ms", text)
+        if m:
+            sample[f"mspt_p{p}"] = float(m.group(1))
+    return sample
+
+def parse_count(text):
+    """Count from `execute if entity`: "Test passed, count: N" or "Test failed" """
+    m = re.search(r"count: (\d+)", text)
+    return int(m.group(1)) if m else 0
+
+def game_sample(rcon):
+    start = time.monotonic()
+    tick, players, entities, items, overworld, nether, end = rcon.commands(COMMANDS)
+    sample = {"online": 1, "rcon_ms": (time.monotonic() - start) * 1000}
+    sample.update(parse_tick(tick))
+    m = re.search(r"There are (\d+) of a max of (\d+)", players)
+    if m:
+        sample["players"] = int(m.group(1))
+    sample["entities"] = parse_count(entities)
+    sample["items"] = parse_count(items)
+    sample["entities_overworld"] = parse_count(overworld)
+    sample["entities_nether"] = parse_count(nether)
+    sample["entities_end"] = parse_count(end)
+    return sample
+
+
+class ProcessStats:
+    """CPU, memory and threads of the server JVM, from /proc"""
+
+    def __init__(self):
+        self.pid = None
+        self._last = None  # (monotonic time, cpu ticks)
+
+    def find(self):
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f"/proc/{pid}/cmdline", "rb") as f:
+                    cmdline = f.read()
+            except OSError:
+                continue
+            if cmdline.startswith(b"java\0") or b"/java\0" in cmdline:
+                if SERVER_JAR in cmdline:
+                    return int(pid)
+        return None
+
+    def sample(self):
+        if self.pid is None or not os.path.exists(f"/proc/{self.pid}"):
+            self.pid = self.find()
+            self._last = None
+        if self.pid is None:
+            return {}
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                # Fields after the parenthesised command name
+                stat = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            self.pid = None
+            return {}
+        ticks = int(stat[11]) + int(stat[12])  # utime + stime
+        sample = {"threads": int(stat[17]), "rss_mb": int(stat[21]) * PAGE / 1e6}
+        now = time.monotonic()
+        if self._last:
+            # 100 = one core fully busy
+            sample["cpu"] = (ticks - self._last[1]) / CLK_TCK / (now - self._last[0]) * 100
+        self._last = (now, ticks)
+        return sample
+
+
+def system_sample():
+    sample = {}
+    with open("/proc/loadavg") as f:
+        sample["load1"] = float(f.read().split()[0])
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemAvailable:"):
+                sample["mem_available_mb"] = int(line.split()[1]) / 1024
+                break
+    return sample
+
+
+def collect(rcon, proc):
+    sample = {}
+    try:
+        sample.update(game_sample(rcon))
+    except (OSError, RconError):
+        # Down or restarting; the connection is reopened on the next call
+        sample["online"] = 0
+    sample.update(proc.sample())
+    sample.update(system_sample())
+    return sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server performance telemetry")
+    parser.add_argument("--dir", default=TELEMETRY_DIR)
+    parser.add_argument("--interval", type=int, default=INTERVAL)
+    parser.add_argument("--once", action="store_true", help="print one sample and exit")
+    args = parser.parse_args()
+
+    rcon = RconClient(timeout=5)
+    proc = ProcessStats()
+    if args.once:
+        proc.sample()
+        time.sleep(1)
+        print(json.dumps(collect(rcon, proc), indent=2))
+        return
+
+    series = tsdb.Series(args.dir, "server", fields=FIELDS, step=args.interval)
+    if series.step != args.interval:
+        print(f"Series was created with a {series.step}s step, sampling every {series.step}s", file=sys.stderr)
+    while True:
+        # Sample on step boundaries so every slot gets exactly one sample
+        time.sleep(series.step - time.time() % series.step)
+        series.append(collect(rcon, proc))
+
+
+if __name__ == "__main__":
+    main()
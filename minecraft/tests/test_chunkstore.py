@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anvil
+from chunkstore import ChunkStore
+
+
+def chunk(payload):
+    """Length-prefixed chunk as it sits in a region file"""
+    body = b"\x02" + payload
+    return len(body).to_bytes(4, "big") + body
+
+
+def write(path, data, mtime=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+class ChunkStoreTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.world = os.path.join(tmp.name, "world")
+        self.store = ChunkStore(os.path.join(tmp.name, "store"))
+        self.chunks = {0: (100, chunk(b"a" * 5000)), 1: (100, chunk(b"b" * 300)), 33: (100, chunk(b"c" * 9000))}
+        self.write_region()
+        write(os.path.join(self.world, "level.dat"), os.urandom(3 * (1 << 20) // 2), mtime=1_700_000_000)
+        write(os.path.join(self.world, "session.lock"), b"lock")
+        os.makedirs(os.path.join(self.world, "DIM-1", "region"))
+
+    def write_region(self):
+        data = anvil.pack_region((i, ts, c) for i, (ts, c) in self.chunks.items())
+        write(os.path.join(self.world, "region", "r.0.0.mca"), data)
+
+    def read(self, root, rel):
+        with open(os.path.join(root, rel), "rb") as f:
+            return f.read()
+
+    def restore(self, name, prefix=""):
+        dest = tempfile.mkdtemp(dir=self.tmp)
+        return dest, self.store.restore(name, dest, prefix)
+
+    def test_restore_round_trip(self):
+        self.store.backup(self.world, "one")
+        dest, restored = self.restore("one")
+        self.assertEqual(restored, 2)
+        for rel in ("region/r.0.0.mca", "level.dat"):
+            self.assertEqual(self.read(dest, rel), self.read(self.world, rel), rel)
+        self.assertEqual(os.stat(os.path.join(dest, "level.dat")).st_mtime, 1_700_000_000)
+        self.assertFalse(os.path.exists(os.path.join(dest, "session.lock")))
+        self.assertTrue(os.path.isdir(os.path.join(dest, "DIM-1", "region")))
+
+    def test_restore_prefix(self):
+        self.store.backup(self.world, "one")
+        dest, restored = self.restore("one", "region")
+        self.assertEqual(restored, 1)
+        self.assertEqual(sorted(os.listdir(dest)), ["region"])
+
+    def test_second_backup_writes_only_changed_chunks(self):
+        first = self.store.backup(self.world, "one")["stats"]
+        self.assertEqual((first["chunks_new"], first["blocks_new"]), (3, 2))
+        unchanged = self.store.backup(self.world, "two")["stats"]
+        self.assertEqual(unchanged.get("bytes_written", 0), 0)
+        self.assertEqual(unchanged["files_unchanged"], 2)
+
+        time.sleep(0.01)
+        self.chunks[1] = (int(time.time()) + 10, chunk(b"B" * 300))
+        self.write_region()
+        changed = self.store.backup(self.world, "three")["stats"]
+        self.assertEqual(changed["chunks_new"], 1)
+        self.assertEqual(changed["chunks_reused"], 2)
+
+        dest, _ = self.restore("one")
+        self.assertEqual(dict((i, (ts, c)) for i, ts, c in anvil.chunk_slices(self.read(dest, "region/r.0.0.mca")))[1],
+                         (100, chunk(b"b" * 300)))
+        dest, _ = self.restore("three")
+        self.assertEqual(self.read(dest, "region/r.0.0.mca"), self.read(self.world, "region/r.0.0.mca"))
+
+    def test_verify_reports_damaged_objects(self):
+        manifest = self.store.backup(self.world, "one")
+        self.assertEqual(self.store.verify("one"), [])
+        digest = manifest["files"]["level.dat"]["blocks"][0]
+        with open(self.store.object_path(digest), "r+b") as f:
+            f.seek(10)
+            f.write(b"\xff\xff")
+        self.assertEqual(self.store.verify("one"), [digest])
+
+    def test_prune_keeps_objects_of_surviving_snapshots(self):
+        self.store.backup(self.world, "one")
+        time.sleep(0.01)
+        self.chunks[0] = (int(time.time()) + 10, chunk(b"A" * 5000))
+        self.write_region()
+        self.store.backup(self.world, "two")
+        removed, _ = self.store.prune(keep=1)
+        self.assertEqual(removed, 1)  # the old version of chunk 0
+        self.assertEqual(self.store.names(), ["two"])
+        self.assertEqual(self.store.verify("two"), [])
+        dest, _ = self.restore("two")
+        self.assertEqual(self.read(dest, "region/r.0.0.mca"), self.read(self.world, "region/r.0.0.mca"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import datetime
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_index import LineParser
+
+DAY = datetime.date(2024, 5, 1)
+
+
+def at(hms):
+    return datetime.datetime.combine(DAY, datetime.time.fromisoformat(hms)).timestamp()
+
+
+class LineParserTest(unittest.TestCase):
+    def parse(self, *lines):
+        parser = LineParser(DAY)
+        return [e for e in map(parser.parse, lines) if e]
+
+    def test_console_save(self):
+        events = self.parse(
+            "[03:00:01] [Server thread/INFO]: Saving the game (this may take a moment!)",
+            "[03:00:04] [Server thread/INFO]: Saved the game",
+        )
+        self.assertEqual(events, [(at("03:00:04"), "save", None, 3.0, None)])
+
+    def test_rcon_save(self):
+        events = self.parse(
+            "[03:00:01] [Server thread/INFO]: [Rcon: Saving the game (this may take a moment!)]",
+            "[03:00:02] [Server thread/INFO]: [Rcon: Saved the game]",
+        )
+        self.assertEqual(events, [(at("03:00:02"), "save", None, 1.0, None)])
+
+    def test_stop(self):
+        for line in ("[23:59:00] [Server thread/INFO]: Stopping the server",
+                     "[23:59:00] [Server thread/INFO]: [Rcon: Stopping the server]",
+                     "[23:59:00] [Server thread/INFO]: Stopping server"):
+            self.assertEqual(self.parse(line), [(at("23:59:00"), "stop", None, None, None)], line)
+
+    def test_chat_is_not_an_event(self):
+        self.assertEqual(self.parse("[12:00:00] [Server thread/INFO]: <Steve> Saving the game now"), [])
+
+    def test_lag_join_leave_start(self):
+        events = self.parse(
+            "[10:00:00] [Server thread/INFO]: Done (12.345s)! For help, type \"help\"",
+            "[10:05:00] [Server thread/INFO]: Steve joined the game",
+            "[10:06:00] [Server thread/WARN]: Can't keep up! Is the server overloaded? Running 2500ms or 50 ticks behind",
+            "[10:07:00] [Server thread/INFO]: Steve left the game",
+        )
+        self.assertEqual(events, [
+            (at("10:00:00"), "start", None, 12.345, None),
+            (at("10:05:00"), "join", "Steve", None, None),
+            (at("10:06:00"), "lag", None, 2500, "50 ticks behind"),
+            (at("10:07:00"), "leave", "Steve", None, None),
+        ])
+
+    def test_error_and_continuation(self):
+        events = self.parse(
+            "[10:00:00] [Server thread/ERROR]: Encountered an unexpected exception",
+            "java.lang.NullPointerException: null",
+            "\tat net.minecraft.server.MinecraftServer.tick(MinecraftServer.java:1)",
+        )
+        self.assertEqual(events, [(at("10:00:00"), "error", None, None,
+                                   "[Server thread] Encountered an unexpected exception")])
+
+    def test_midnight_rollover(self):
+        events = self.parse(
+            "[23:59:59] [Server thread/INFO]: Steve joined the game",
+            "[00:00:01] [Server thread/INFO]: Steve left the game",
+        )
+        self.assertEqual([t for t, *_ in events], [at("23:59:59"), at("23:59:59") + 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
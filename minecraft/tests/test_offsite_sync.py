@@ -0,0 +1,177 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import offsite_sync
+from chunkstore import ChunkStore
+from offsite_sync import LocalRemote, RcloneRemote, SyncError
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class ChunkSyncTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.world = os.path.join(tmp.name, "world")
+        self.store = ChunkStore(os.path.join(tmp.name, "store"))
+        self.remote = LocalRemote(os.path.join(tmp.name, "remote"))
+
+    # Snapshot names are dated like backup.sh's: the remote orders them by name
+    def snapshot(self, name, files):
+        for rel, data in files.items():
+            write(os.path.join(self.world, rel), data)
+        self.store.backup(self.world, name)
+        time.sleep(0.01)  # snapshots are ordered by manifest mtime
+
+    def remote_objects(self):
+        """digest -> pack of every object listed in a remote pack index"""
+        found = {}
+        for rel in self.remote.list("packs"):
+            if rel.endswith(".idx"):
+                for digest, _, _ in json.loads(self.remote.get(rel))["objects"]:
+                    found[digest] = rel
+        return found
+
+    def shipped(self):
+        return offsite_sync.load_shipped(self.store, self.remote)
+
+    def pull(self, name):
+        other = ChunkStore(os.path.join(self.tmp, "pulled"))
+        offsite_sync.pull_chunks(other, self.remote, name)
+        dest = os.path.join(self.tmp, "restored-" + name)
+        other.restore(name, dest)
+        return dest
+
+    def test_push_pull_round_trip(self):
+        self.snapshot("world_2024-05-01", {"level.dat": os.urandom(1000), "data/raids.dat": os.urandom(200)})
+        first = offsite_sync.push_chunks(self.store, self.remote, keep=5)
+        self.assertEqual(first.files, 3)  # pack, index, manifest
+        again = offsite_sync.push_chunks(self.store, self.remote, keep=5)
+        self.assertEqual((again.files, again.skipped), (0, 2))
+        dest = self.pull("world_2024-05-01")
+        for rel in ("level.dat", "data/raids.dat"):
+            with open(os.path.join(dest, rel), "rb") as a, open(os.path.join(self.world, rel), "rb") as b:
+                self.assertEqual(a.read(), b.read())
+
+    def test_dead_packs_are_removed(self):
+        self.snapshot("world_2024-05-01", {"level.dat": b"old" * 1000})
+        offsite_sync.push_chunks(self.store, self.remote, keep=1)
+        old = self.store.load("world_2024-05-01")["files"]["level.dat"]["blocks"][0]
+        self.snapshot("world_2024-05-02", {"level.dat": b"new" * 1000})
+        result = offsite_sync.push_chunks(self.store, self.remote, keep=1)
+        self.assertEqual(result.packs_removed, 1)
+        self.assertEqual(sorted(self.remote.list("snapshots")), ["snapshots/world_2024-05-02.json.gz"])
+        self.assertNotIn(old, self.remote_objects())
+        self.assertNotIn(old, self.shipped())
+        self.assertEqual(len([r for r in self.remote.list("packs") if r.endswith(".pack")]), 1)
+        self.pull("world_2024-05-02")
+
+    def test_mostly_dead_packs_are_repacked(self):
+        small, big = os.urandom(100), os.urandom(5000)
+        self.snapshot("world_2024-05-01", {"small.dat": small, "big.dat": big})
+        offsite_sync.push_chunks(self.store, self.remote, keep=1)
+        files = self.store.load("world_2024-05-01")["files"]
+        small_digest, big_digest = files["small.dat"]["blocks"][0], files["big.dat"]["blocks"][0]
+        os.remove(os.path.join(self.world, "big.dat"))
+        self.snapshot("world_2024-05-02", {"small.dat": small})
+        offsite_sync.push_chunks(self.store, self.remote, keep=1)
+        objects = self.remote_objects()
+        self.assertIn(small_digest, objects)
+        self.assertNotIn(big_digest, objects)
+        self.assertEqual(self.shipped(), {small_digest})
+        self.pull("world_2024-05-02")
+
+    def test_dead_object_is_shipped_again_when_needed(self):
+        content = os.urandom(2000)
+        self.snapshot("world_2024-05-01", {"level.dat": content})
+        offsite_sync.push_chunks(self.store, self.remote, keep=1)
+        self.snapshot("world_2024-05-02", {"level.dat": os.urandom(2000)})
+        offsite_sync.push_chunks(self.store, self.remote, keep=1)
+        self.snapshot("world_2024-05-03", {"level.dat": content})
+        offsite_sync.push_chunks(self.store, self.remote, keep=1)
+        dest = self.pull("world_2024-05-03")
+        with open(os.path.join(dest, "level.dat"), "rb") as f:
+            self.assertEqual(f.read(), content)
+
+    def test_shipped_record_is_rebuilt_from_the_remote(self):
+        self.snapshot("world_2024-05-01", {"level.dat": os.urandom(1000)})
+        offsite_sync.push_chunks(self.store, self.remote, keep=5)
+        expected = self.shipped()
+        os.remove(offsite_sync.shipped_path(self.store, self.remote))
+        self.assertEqual(self.shipped(), expected)
+
+
+class ArchiveSyncTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.remote = LocalRemote(os.path.join(tmp.name, "remote"))
+        patcher = mock.patch.object(offsite_sync, "PART_SIZE", 1000)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def archive(self, name, size):
+        path = os.path.join(self.tmp, name)
+        write(path, os.urandom(size))
+        return path
+
+    def test_push_resume_and_pull(self):
+        path = self.archive("world_2024-05-01_0300.tar.gz", 3500)
+        with open(path, "rb") as f:
+            data = f.read()
+        # An interrupted run left the first two parts behind
+        for i in range(2):
+            write(os.path.join(self.remote.root, f"archives/{os.path.basename(path)}/part-{i:05d}"),
+                  data[i * 1000:(i + 1) * 1000])
+        result = offsite_sync.push_archive(path, self.remote, keep=4)
+        self.assertEqual((result.skipped, result.files), (2, 3))  # two parts and the part list
+        dest = offsite_sync.pull_archive(self.remote, os.path.basename(path), os.path.join(self.tmp, "out"))
+        with open(dest, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_keep_drops_old_archives(self):
+        for day in range(1, 4):
+            offsite_sync.push_archive(self.archive(f"world_2024-05-0{day}_0300.tar.gz", 1500), self.remote, keep=2)
+        names = sorted({rel.split("/")[1] for rel in self.remote.list("archives")})
+        self.assertEqual(names, ["world_2024-05-02_0300.tar.gz", "world_2024-05-03_0300.tar.gz"])
+
+
+class RcloneListTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.stderr = os.path.join(tmp.name, "stderr")
+        write(os.path.join(tmp.name, "bin", "rclone"), f"#!/bin/sh\ncat {self.stderr} >&2\nexit 3\n".encode())
+        os.chmod(os.path.join(tmp.name, "bin", "rclone"), 0o755)
+        patcher = mock.patch.dict(os.environ, {"PATH": os.path.join(tmp.name, "bin") + os.pathsep + os.environ["PATH"]})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fail_with(self, message):
+        write(self.stderr, message.encode())
+
+    def test_missing_directory_is_empty(self):
+        self.fail_with("ERROR : packs: error listing: directory not found\n")
+        self.assertEqual(RcloneRemote("gdrive:backups").list("packs"), {})
+
+    def test_other_errors_propagate(self):
+        self.fail_with("Failed to create file system: didn't find section in config file\n")
+        with self.assertRaises(SyncError):
+            RcloneRemote("gdrive:backups").list("packs")
+
+
+if __name__ == "__main__":
+    unittest.main()
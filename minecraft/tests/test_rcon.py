@@ -0,0 +1,105 @@
+import asyncio
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rcon
+
+PASSWORD = "hunter2"
+
+
+class VanillaServer:
+    """Behaves like the vanilla RCON thread: one recv() of up to 1460 bytes
+    per packet, and the connection is dropped when that read holds anything
+    but exactly one packet"""
+
+    def __init__(self):
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.commands = []
+        self.dropped = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        self.listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            while True:
+                # Give a client that writes ahead the chance to fill the buffer
+                time.sleep(0.02)
+                data = conn.recv(1460)
+                if len(data) < 14:
+                    return
+                length, req_id, pkt_type = struct.unpack_from("<iii", data)
+                if length != len(data) - 4:
+                    self.dropped += 1
+                    return
+                payload = data[12:-2].decode()
+                if pkt_type == rcon.SERVERDATA_AUTH:
+                    ok = payload == PASSWORD
+                    conn.sendall(rcon.encode_packet(req_id if ok else -1, 2, b""))
+                elif pkt_type == rcon.SERVERDATA_EXECCOMMAND:
+                    self.commands.append(payload)
+                    conn.sendall(rcon.encode_packet(req_id, 0, f"ran {payload}".encode()))
+                else:
+                    conn.sendall(rcon.encode_packet(req_id, 0, f"Unknown request {pkt_type:x}".encode()))
+
+
+class RconClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = VanillaServer()
+        self.addCleanup(self.server.close)
+
+    def client(self, password=PASSWORD):
+        return rcon.RconClient("127.0.0.1", self.server.port, password, timeout=5)
+
+    def test_single_command(self):
+        with self.client() as client:
+            self.assertEqual(client.command("list"), "ran list")
+
+    def test_batch_is_sent_one_packet_per_read(self):
+        commands = ["tick query", "list", "execute if entity @e"]
+        with self.client() as client:
+            self.assertEqual(client.commands(commands), [f"ran {c}" for c in commands])
+            self.assertEqual(client.command("save-all"), "ran save-all")
+        self.assertEqual(self.server.commands, commands + ["save-all"])
+        self.assertEqual(self.server.dropped, 0)
+
+    def test_bad_password(self):
+        with self.assertRaises(rcon.RconAuthError):
+            self.client("wrong").command("list")
+
+
+class AsyncRconClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = VanillaServer()
+        self.addCleanup(self.server.close)
+
+    def test_concurrent_callers(self):
+        async def run():
+            async with rcon.AsyncRconClient("127.0.0.1", self.server.port, PASSWORD, timeout=5) as client:
+                return await asyncio.gather(client.commands(["list", "seed"]), client.command("time query daytime"))
+
+        batch, single = asyncio.run(run())
+        self.assertEqual(batch, ["ran list", "ran seed"])
+        self.assertEqual(single, "ran time query daytime")
+        self.assertEqual(self.server.dropped, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
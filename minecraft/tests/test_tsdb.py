@@ -0,0 +1,93 @@
+import math
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tsdb
+
+# 10s raw for 1 minute, 1m rollups for 5 minutes, 1h rollups for 3 hours
+LEVELS = (("1m", 60, 5), ("1h", 3600, 3))
+
+
+class SeriesTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        self.series = tsdb.Series(self.root, "server", fields=("tps", "players"), step=10, raw_slots=6, levels=LEVELS)
+        # An hour boundary a little in the past, so every level still holds it
+        self.t0 = (int(time.time()) // 3600 - 1) * 3600
+
+    def fill(self, samples):
+        for offset, values in samples:
+            self.series.append(values, t=self.t0 + offset)
+
+    def test_raw_round_trip(self):
+        self.fill([(0, {"tps": 20, "players": 1}), (10, {"tps": 19.5}), (20, {"tps": 18, "players": 3})])
+        data = self.series.query(self.t0, self.t0 + 30, level="raw")
+        self.assertEqual(data["time"], [self.t0, self.t0 + 10, self.t0 + 20])
+        self.assertEqual(data["values"]["tps"]["mean"], [20, 19.5, 18])
+        self.assertEqual(data["values"]["players"]["mean"], [1, None, 3])
+        self.assertEqual(data["values"]["players"]["min"], data["values"]["players"]["mean"])
+
+    def test_rollups(self):
+        self.fill([(0, {"tps": 20, "players": 1}), (10, {"tps": 10}), (20, {"tps": 15, "players": 5}),
+                   (60, {"tps": 12, "players": 2})])
+        minutes = self.series.query(self.t0, self.t0 + 120, level="1m")
+        self.assertEqual(minutes["time"], [self.t0, self.t0 + 60])
+        self.assertEqual(minutes["values"]["tps"], {"mean": [15, 12], "min": [10, 12], "max": [20, 12]})
+        self.assertEqual(minutes["values"]["players"], {"mean": [3, 2], "min": [1, 2], "max": [5, 2]})
+        # The hour is weighted by sample count, not by minute
+        hour = self.series.query(self.t0, self.t0 + 3600, level="1h")
+        self.assertEqual(hour["time"], [self.t0])
+        self.assertAlmostEqual(hour["values"]["tps"]["mean"][0], 57 / 4)
+        self.assertEqual(hour["values"]["tps"]["min"], [10])
+        self.assertEqual(hour["values"]["players"]["max"], [5])
+
+    def test_ring_drops_overwritten_samples(self):
+        self.fill([(i * 10, {"tps": i}) for i in range(9)])
+        data = self.series.query(self.t0, self.t0 + 90, level="raw")
+        self.assertEqual(data["time"], [self.t0 + i * 10 for i in range(3, 9)])
+        self.assertEqual(data["values"]["tps"]["mean"], [3, 4, 5, 6, 7, 8])
+        # A range in the overwritten past finds nothing rather than newer data
+        self.assertEqual(self.series.query(self.t0, self.t0 + 20, level="raw")["time"], [])
+
+    def test_range_longer_than_retention(self):
+        self.fill([(0, {"tps": 20}), (3600, {"tps": 19})])
+        now = self.t0 + 3600 + 10
+        years = self.series.query(now - 10 * 365 * 86400, now, level="1h")
+        self.assertEqual(years["time"], [self.t0, self.t0 + 3600])
+        raw = self.series.query(now - 86400, now, level="raw")
+        self.assertEqual(raw["time"], [self.t0 + 3600])
+
+    def test_pick_level(self):
+        now = self.t0 + 600
+        self.assertEqual(self.series.pick_level(now - 50, now, now=now).name, "raw")
+        self.assertEqual(self.series.pick_level(now - 50, now, points=2, now=now).name, "1m")
+        self.assertEqual(self.series.pick_level(now - 200, now, now=now).name, "1m")
+        self.assertEqual(self.series.pick_level(now - 3 * 3600, now, now=now).name, "1h")
+        self.assertEqual(self.series.pick_level(now - 86400, now, now=now).name, "1h")
+
+    def test_reopen_and_latest(self):
+        self.assertIsNone(self.series.latest())
+        self.series.append({"tps": 20, "players": 4})
+        reopened = tsdb.Series(self.root, "server")
+        self.assertEqual((reopened.fields, reopened.step), (["tps", "players"], 10))
+        latest = reopened.latest()
+        self.assertEqual((latest["tps"], latest["players"]), (20, 4))
+        with self.assertRaises(KeyError):
+            tsdb.Series(self.root, "missing")
+
+    def test_missing_level_file(self):
+        empty = tsdb.Series(self.root, "empty", fields=("x",), step=10, raw_slots=6, levels=LEVELS)
+        data = empty.query(self.t0, self.t0 + 60, level="raw")
+        self.assertEqual((data["time"], data["values"]["x"]["mean"]), ([], []))
+        self.assertTrue(math.isnan(tsdb._float(None)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anvil
+import world_archive
+from world_archive import IndexedArchive
+
+
+def chunk(payload):
+    body = b"\x02" + payload
+    return len(body).to_bytes(4, "big") + body
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class WorldArchiveTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        # Small pieces, so files span several gzip members
+        patcher = mock.patch.object(world_archive, "PIECE", 8192)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.world = os.path.join(tmp.name, "src", "world")
+        # Block (100, 700) is chunk (6, 43) in region r.0.1
+        self.chunks = {anvil.chunk_index(6, 43): (1234, chunk(os.urandom(20000))),
+                       anvil.chunk_index(7, 43): (1235, chunk(b"x" * 100))}
+        self.region = anvil.pack_region((i, ts, c) for i, (ts, c) in self.chunks.items())
+        write(os.path.join(self.world, "region", "r.0.1.mca"), self.region)
+        write(os.path.join(self.world, "level.dat"), os.urandom(30000))
+        write(os.path.join(self.world, "session.lock"), b"lock")
+        os.makedirs(os.path.join(self.world, "DIM1", "region"))
+        self.archive = os.path.join(tmp.name, "world.tar.gz")
+
+    def create(self, threads=1):
+        world_archive.create(os.path.dirname(self.world), self.archive, threads=threads)
+        archive = IndexedArchive(self.archive)
+        self.addCleanup(archive.close)
+        return archive
+
+    def test_plain_tar_extracts(self):
+        self.create(threads=3)
+        dest = os.path.join(self.tmp, "out")
+        with tarfile.open(self.archive, "r:gz") as tar:
+            names = tar.getnames()
+            tar.extractall(dest, filter="data")
+        self.assertNotIn("world/session.lock", names)
+        self.assertTrue(os.path.isdir(os.path.join(dest, "world", "DIM1", "region")))
+        for rel in ("region/r.0.1.mca", "level.dat"):
+            with open(os.path.join(dest, "world", rel), "rb") as a, open(os.path.join(self.world, rel), "rb") as b:
+                self.assertEqual(a.read(), b.read())
+
+    def test_output_does_not_depend_on_threads(self):
+        self.create(threads=1)
+        with open(self.archive, "rb") as f:
+            single = f.read()
+        self.create(threads=4)
+        with open(self.archive, "rb") as f:
+            self.assertEqual(f.read(), single)
+
+    def test_read_file_and_chunk(self):
+        archive = self.create()
+        self.assertGreater(len(archive.members), 8)
+        with open(os.path.join(self.world, "level.dat"), "rb") as f:
+            self.assertEqual(archive.read_file("world/level.dat"), f.read())
+        self.assertEqual(archive.read_file("world/region/r.0.1.mca"), self.region)
+        name = world_archive.region_name(100, 700)
+        self.assertEqual(name, "world/region/r.0.1.mca")
+        found, timestamp = archive.read_chunk(name, 6, 43)
+        self.assertEqual((found, timestamp), (self.chunks[anvil.chunk_index(6, 43)][1], 1234))
+        self.assertIsNone(archive.read_chunk(name, 8, 43))
+        with self.assertRaises(KeyError):
+            archive.read_file("world/region/r.5.5.mca")
+
+    def test_restore_chunk(self):
+        archive = self.create()
+        # The chunk changed after the backup; its neighbour must survive the restore
+        changed = dict(self.chunks)
+        changed[anvil.chunk_index(6, 43)] = (9999, chunk(b"griefed"))
+        changed[anvil.chunk_index(7, 43)] = (9999, chunk(b"newer"))
+        region = anvil.pack_region((i, ts, c) for i, (ts, c) in changed.items())
+        write(os.path.join(self.world, "region", "r.0.1.mca"), region)
+
+        target = world_archive.restore_chunk(archive, 100, 700, "overworld", "region", self.world)
+        with open(target, "rb") as f:
+            restored = {i: (ts, c) for i, ts, c in anvil.chunk_slices(f.read())}
+        self.assertEqual(restored[anvil.chunk_index(6, 43)], self.chunks[anvil.chunk_index(6, 43)])
+        self.assertEqual(restored[anvil.chunk_index(7, 43)], (9999, chunk(b"newer")))
+        with open(target + ".before-restore", "rb") as f:
+            self.assertEqual(f.read(), region)
+        self.assertIsNone(world_archive.restore_chunk(archive, 200, 700, "overworld", "region", self.world))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# Compact time-series store
+# A series is a directory with a schema and one fixed-size ring file per
+# resolution. Every record is a row of float64 (array 'd'), so a sample's
+# position follows from its time alone and files never grow: raw samples
+# land in slot (t // step) % slots, and each rollup level keeps the mean,
+# min and max of its bucket, recomputed from the level below whenever a
+# sample comes in. Queries read only the slots in range and pick the finest
+# level that still covers the range and stays within the point budget.
+#
+# Also used by the webapp to serve charts: webapp/tsdb.py is a symlink to
+# this file, copied to /opt/webapp on deploy.
+#
+# Usage:
+#   tsdb.py show DIR SERIES [--range SECONDS] [--points N]
+#   tsdb.py info DIR SERIES
+
+import argparse
+import array
+import fcntl
+import json
+import math
+import os
+import time
+
+NAN = float("nan")
+ITEM = array.array("d").itemsize
+
+# (name, step in seconds, slots) of the rollups: with a 10s raw step that is
+# 1 day of raw samples, 7 days of minutes, 90 days of hours, 5 years of days
+DEFAULT_LEVELS = (("1m", 60, 10080), ("1h", 3600, 2160), ("1d", 86400, 1830))
+DEFAULT_RAW_SLOTS = 8640
+
+
+class Level:
+    def __init__(self, series, name, step, slots, raw):
+        self.name = name
+        self.step = step
+        self.slots = slots
+        self.raw = raw
+        n = len(series.fields)
+        # raw: [time, value...]; rollup: [time, samples, mean..., min..., max...]
+        self.width = 1 + n if raw else 2 + 3 * n
+        self.path = os.path.join(series.dir, f"{name}.ring")
+
+    @property
+    def retention(self):
+        return self.step * self.slots
+
+    def bucket(self, t):
+        return int(t // self.step) * self.step
+
+    def write(self, fd, record):
+        slot = int(record[0] // self.step) % self.slots
+        os.pwrite(fd, array.array("d", record).tobytes(), slot * self.width * ITEM)
+
+    def read(self, fd, start, end):
+        """Records for the buckets in [start, end), oldest first; empty or
+        overwritten slots are left out"""
+        first = int(start // self.step)
+        count = min(max(0, math.ceil(end / self.step) - first), self.slots)
+        data = array.array("d")
+        slot = first % self.slots
+        while count:
+            n = min(count, self.slots - slot)
+            data.frombytes(os.pread(fd, n * self.width * ITEM, slot * self.width * ITEM))
+            count -= n
+            slot = 0
+        records = []
+        for i in range(0, len(data) - self.width + 1, self.width):
+            t = data[i]
+            # A range longer than the ring reads every slot once, and each
+            # holds whichever bucket landed there last: keep it if it is in
+            # range (zeroed slots never are) and belongs to this slot
+            if start <= t < end and t and t % self.step == 0 and \
+                    int(t // self.step) % self.slots == (first + i // self.width) % self.slots:
+                records.append(data[i:i + self.width])
+        records.sort(key=lambda r: r[0])
+        return records
+
+
+class Series:
+    """One named series in a store directory. Pass fields (and optionally
+    step/levels) to create it on first use; without them an existing series
+    is opened."""
+
+    def __init__(self, root, name, fields=None, step=10, raw_slots=DEFAULT_RAW_SLOTS, levels=DEFAULT_LEVELS):
+        self.dir = os.path.join(root, name)
+        self.name = name
+        schema_path = os.path.join(self.dir, "schema.json")
+        try:
+            with open(schema_path) as f:
+                schema = json.load(f)
+        except FileNotFoundError:
+            if fields is None:
+                raise KeyError(f"No series {name} in {root}") from None
+            schema = {"fields": list(fields), "levels": [["raw", step, raw_slots]] + [list(l) for l in levels]}
+            os.makedirs(self.dir, exist_ok=True)
+            tmp = f"{schema_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(schema, f)
+            os.replace(tmp, schema_path)
+        self.fields = schema["fields"]
+        self.levels = [Level(self, name, step, slots, i == 0) for i, (name, step, slots) in enumerate(schema["levels"])]
+        self.lock_path = os.path.join(self.dir, ".lock")
+
+    @property
+    def step(self):
+        return self.levels[0].step
+
+    def _open(self, level, write=False):
+        if not write:
+            return os.open(level.path, os.O_RDONLY)
+        fd = os.open(level.path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = level.slots * level.width * ITEM
+        if os.fstat(fd).st_size != size:
+            os.ftruncate(fd, size)  # sparse; zeroed slots never match a bucket time
+        return fd
+
+    def append(self, values, t=None):
+        """Record one sample ({field: value}, missing fields are NaN) and
+        refresh the rollup buckets it falls into"""
+        t = time.time() if t is None else t
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            fds = [self._open(level, write=True) for level in self.levels]
+            try:
+                raw = self.levels[0]
+                raw.write(fds[0], [raw.bucket(t)] + [_float(values.get(f)) for f in self.fields])
+                for i, level in enumerate(self.levels[1:], 1):
+                    start = level.bucket(t)
+                    below = self.levels[i - 1]
+                    level.write(fds[i], self._rollup(start, below.read(fds[i - 1], start, start + level.step), below.raw))
+            finally:
+                for fd in fds:
+                    os.close(fd)
+
+    def _rollup(self, start, records, from_raw):
+        n = len(self.fields)
+        if from_raw:
+            weights = [1] * len(records)
+            means = mins = maxes = [r[1:1 + n] for r in records]
+        else:
+            weights = [r[1] for r in records]
+            means = [r[2:2 + n] for r in records]
+            mins = [r[2 + n:2 + 2 * n] for r in records]
+            maxes = [r[2 + 2 * n:] for r in records]
+        out_mean, out_min, out_max = [], [], []
+        for j in range(n):
+            total = weight = 0
+            lo, hi = math.inf, -math.inf
+            for w, mean, mn, mx in zip(weights, means, mins, maxes):
+                if math.isnan(mean[j]):
+                    continue
+                total += mean[j] * w
+                weight += w
+                lo, hi = min(lo, mn[j]), max(hi, mx[j])
+            out_mean.append(total / weight if weight else NAN)
+            out_min.append(lo if weight else NAN)
+            out_max.append(hi if weight else NAN)
+        return [start, sum(weights)] + out_mean + out_min + out_max
+
+    def pick_level(self, start, end, points=None, now=None):
+        """Finest level still holding `start` whose bucket count for the
+        range fits in `points`; the coarsest one otherwise"""
+        now = time.time() if now is None else now
+        for level in self.levels:
+            if start < now - level.retention:
+                continue
+            if points and (end - start) / level.step > points:
+                continue
+            return level
+        return self.levels[-1]
+
+    def query(self, start, end, points=None, level=None):
+        """Columnar data for charts: times plus mean/min/max per field
+        (identical lists at the raw level); missing values are None"""
+        level = self.pick_level(start, end, points) if level is None else \
+            next(l for l in self.levels if l.name == level)
+        try:
+            fd = self._open(level)
+        except FileNotFoundError:
+            records = []
+        else:
+            try:
+                records = level.read(fd, level.bucket(start), end)
+            finally:
+                os.close(fd)
+        n = len(self.fields)
+        values = {}
+        for j, field in enumerate(self.fields):
+            if level.raw:
+                column = [_json(r[1 + j]) for r in records]
+                values[field] = {"mean": column, "min": column, "max": column}
+            else:
+                values[field] = {"mean": [_json(r[2 + j]) for r in records],
+                                 "min": [_json(r[2 + n + j]) for r in records],
+                                 "max": [_json(r[2 + 2 * n + j]) for r in records]}
+        return {"series": self.name, "level": level.name, "step": level.step,
+                "start": start, "end": end, "time": [int(r[0]) for r in records], "values": values}
+
+    def latest(self):
+        """Newest raw sample as {field: value}, or None"""
+        now = time.time()
+        data = self.query(now - 4 * self.step, now + self.step, level=self.levels[0].name)
+        if not data["time"]:
+            return None
+        sample = {f: v["mean"][-1] for f, v in data["values"].items()}
+        sample["time"] = data["time"][-1]
+        return sample
+
+
+def _float(value):
+    return NAN if value is None else float(value)
+
+def _json(value):
+    return None if math.isnan(value) else round(value, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact time-series store")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("show")
+    p.add_argument("dir")
+    p.add_argument("series")
+    p.add_argument("--range", type=int, default=3600, help="seconds back from now")
+    p.add_argument("--points", type=int, default=60)
+    p = sub.add_parser("info")
+    p.add_argument("dir")
+    p.add_argument("series")
+    args = parser.parse_args()
+
+    series = Series(args.dir, args.series)
+    if args.cmd == "info":
+        print(f"{series.name}: {', '.join(series.fields)}")
+        for level in series.levels:
+            size = level.slots * level.width * ITEM
+            print(f"  {level.name:>4}  step {level.step}s  {level.retention / 86400:.1f} days  {size / 1e6:.1f} MB")
+    elif args.cmd == "show":
+        now = time.time()
+        data = series.query(now - args.range, now, args.points)
+        print(f"level {data['level']} ({data['step']}s)")
+        print("time                 " + "  ".join(f"{f:>10}" for f in series.fields))
+        for i, t in enumerate(data["time"]):
+            row = (data["values"][f]["mean"][i] for f in series.fields)
+            print(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) + "  " +
+                  "  ".join(f"{'-' if v is None else v:>10}" for v in row))
+
+
+if __name__ == "__main__":
+    main()
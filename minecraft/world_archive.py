@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# Indexed, seekable world archives
+# The archive is an ordinary .tar.gz (tar -xzf works) written as a series of
+# independent gzip members: a new member starts at every file and every
+# PIECE bytes inside a file. A sidecar index (<archive>.idx) records where
+# each member starts in both the compressed and the tar stream, and where
+# each file's data lies in the tar stream. Restoring one region then means
+# inflating a few members instead of the whole archive, and one chunk only
+# needs the region header and the pieces holding that chunk.
+#
+# Usage:
+#   world_archive.py create PARENT OUT.tar.gz [--threads N] [--level L]
+#       archives PARENT/world (the directory name is kept, as with tar -C)
+#   world_archive.py list ARCHIVE
+#   world_archive.py restore-region ARCHIVE --block X Z [--dim D] [--kind K] DEST
+#   world_archive.py restore-chunk ARCHIVE --block X Z [--dim D] [--kind K] [--world DIR]
+
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import gzip
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import zlib
+
+import anvil
+
+PIECE = 1 << 20
+BLOCK = tarfile.BLOCKSIZE
+DIMENSIONS = {"overworld": "", "nether": "DIM-1", "end": "DIM1"}
+
+
+class MemberWriter:
+    """Compresses a byte stream into independent gzip members in parallel"""
+
+    def __init__(self, out, threads, level):
+        self.out = out
+        self.level = level
+        self.pool = concurrent.futures.ThreadPoolExecutor(max(1, threads))
+        self.queue = collections.deque()
+        self.limit = 2 * max(1, threads)
+        self.buf = bytearray()
+        self.offset = 0     # tar stream offset of the buffered data
+        self.members = []   # [compressed offset, tar offset]
+        self.written = 0
+
+    def write(self, data):
+        self.buf += data
+
+    def cut(self):
+        """End the current member here"""
+        if not self.buf:
+            return
+        data, self.buf = bytes(self.buf), bytearray()
+        self.queue.append((self.offset, self.pool.submit(gzip.compress, data, self.level, mtime=0)))
+        self.offset += len(data)
+        while len(self.queue) >= self.limit:
+            self._drain_one()
+
+    def close(self):
+        self.cut()
+        while self.queue:
+            self._drain_one()
+        self.pool.shutdown()
+
+    def _drain_one(self):
+        offset, future = self.queue.popleft()
+        member = future.result()
+        self.members.append([self.written, offset])
+        self.out.write(member)
+        self.written += len(member)
+
+
+def create(parent, out_path, threads=1, level=6):
+    files = {}
+    tmp = out_path + ".partial"
+    tar = tarfile.TarFile(fileobj=io.BytesIO(), mode="w")  # only used for gettarinfo
+    with open(tmp, "wb") as out:
+        writer = MemberWriter(out, threads, level)
+        for directory, dirs, names in os.walk(os.path.join(parent, "world")):
+            dirs.sort()
+            for name in [None] + sorted(names):
+                path = directory if name is None else os.path.join(directory, name)
+                arcname = os.path.relpath(path, parent)
+                info = tar.gettarinfo(path, arcname)
+                if info is None or name == "session.lock":
+                    continue
+                writer.cut()
+                writer.write(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+                if not info.isreg():
+                    continue
+                files[arcname] = [writer.offset + len(writer.buf), info.size]
+                with open(path, "rb") as f:
+                    remaining = info.size
+                    while remaining > 0:
+                        piece = f.read(min(PIECE, remaining))
+                        if not piece:
+                            raise OSError(f"{path} shrank while archiving")
+                        writer.write(piece)
+                        remaining -= len(piece)
+                        if remaining:
+                            writer.cut()
+                writer.write(b"\0" * (-info.size % BLOCK))
+        writer.cut()
+        writer.write(b"\0" * (2 * BLOCK))  # end of archive
+        writer.close()
+    index = {"piece": PIECE, "size": writer.written, "tar_size": writer.offset,
+             "members": writer.members, "files": files}
+    with gzip.open(out_path + ".idx.partial", "wt") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp, out_path)
+    os.replace(out_path + ".idx.partial", out_path + ".idx")
+    return index
+
+
+class IndexedArchive:
+    def __init__(self, path):
+        self.path = path
+        with gzip.open(path + ".idx", "rt") as f:
+            self.index = json.load(f)
+        self.members = self.index["members"]
+        self.starts = [tar_offset for _, tar_offset in self.members]
+        self.f = open(path, "rb")
+
+    def close(self):
+        self.f.close()
+
+    def _member(self, i):
+        start = self.members[i][0]
+        end = self.members[i + 1][0] if i + 1 < len(self.members) else self.index["size"]
+        self.f.seek(start)
+        return zlib.decompress(self.f.read(end - start), 31)
+
+    def read(self, offset, length):
+        """`length` bytes of the tar stream at `offset`, inflating only the
+        members that overlap it"""
+        i = bisect.bisect_right(self.starts, offset) - 1
+        out = bytearray()
+        while len(out) < length and i < len(self.members):
+            data = self._member(i)
+            skip = offset + len(out) - self.starts[i]
+            out += data[skip:skip + length - len(out)]
+            i += 1
+        return bytes(out)
+
+    def file_info(self, name):
+        if name not in self.index["files"]:
+            raise KeyError(f"{name} is not in {self.path}")
+        return self.index["files"][name]
+
+    def read_file(self, name):
+        offset, size = self.file_info(name)
+        return self.read(offset, size)
+
+    def read_chunk(self, name, cx, cz):
+        """Length-prefixed chunk bytes and timestamp, or None if not generated"""
+        offset, size = self.file_info(name)
+        if size < anvil.HEADER:
+            return None
+        locations, timestamps = anvil.parse_header(self.read(offset, anvil.HEADER))
+        i = anvil.chunk_index(cx, cz)
+        sector, count = locations[i]
+        if sector < 2 or count == 0:
+            return None
+        data = self.read(offset + sector * anvil.SECTOR, count * anvil.SECTOR)
+        length = int.from_bytes(data[:4], "big")
+        return (data[:4 + length] if 0 < length <= len(data) - 4 else data), timestamps[i]
+
+
+def region_name(bx, bz, dim="overworld", kind="region"):
+    rel = os.path.join("world", DIMENSIONS[dim], kind, f"r.{bx >> 9}.{bz >> 9}.mca")
+    return os.path.normpath(rel)
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def restore_chunk(archive, bx, bz, dim, kind, world):
+    """Put one chunk from the archive back into the world's region file;
+    the previous region file is kept next to it as .before-restore"""
+    name = region_name(bx, bz, dim, kind)
+    found = archive.read_chunk(name, bx >> 4, bz >> 4)
+    if found is None:
+        return None
+    chunk, timestamp = found
+    target = os.path.join(world, os.path.relpath(name, "world"))
+    chunks = {}
+    if os.path.exists(target):
+        with open(target, "rb") as f:
+            current = f.read()
+        write_atomic(target + ".before-restore", current)
+        chunks = {i: (i, ts, data) for i, ts, data in anvil.chunk_slices(current)}
+    i = anvil.chunk_index(bx >> 4, bz >> 4)
+    chunks[i] = (i, timestamp, chunk)
+    write_atomic(target, anvil.pack_region(chunks.values()))
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexed, seekable world archives")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("create")
+    p.add_argument("parent")
+    p.add_argument("out")
+    p.add_argument("--threads", type=int, default=os.cpu_count())
+    p.add_argument("--level", type=int, default=6)
+    p = sub.add_parser("list")
+    p.add_argument("archive")
+    for cmd in ("restore-region", "restore-chunk"):
+        p = sub.add_parser(cmd)
+        p.add_argument("archive")
+        p.add_argument("--block", type=int, nargs=2, metavar=("X", "Z"), required=True)
+        p.add_argument("--dim", choices=sorted(DIMENSIONS), default="overworld")
+        p.add_argument("--kind", choices=("region", "entities", "poi"), default="region")
+        if cmd == "restore-region":
+            p.add_argument("dest", help="directory to write the region file to")
+        else:
+            p.add_argument("--world", default=anvil.WORLD_DIR)
+    args = parser.parse_args()
+
+    if args.cmd == "create":
+        start = time.time()
+        index = create(args.parent, args.out, args.threads, args.level)
+        elapsed = max(time.time() - start, 1e-3)
+        print(f"Archive: {index['tar_size'] / 1e6:.1f} MB -> {index['size'] / 1e6:.1f} MB in {elapsed:.1f}s, "
+              f"{index['tar_size'] / 1e6 / elapsed:.1f} MB/s (indexed gzip, {args.threads} threads, "
+              f"level {args.level}, {len(index['members'])} members)")
+        return
+
+    archive = IndexedArchive(args.archive)
+    try:
+        if args.cmd == "list":
+            for name, (_, size) in sorted(archive.index["files"].items()):
+                print(f"{size:>12}  {name}")
+        elif args.cmd == "restore-region":
+            name = region_name(*args.block, args.dim, args.kind)
+            dest = os.path.join(args.dest, os.path.basename(name))
+            write_atomic(dest, archive.read_file(name))
+            print(f"Restored {name} to {dest}")
+        elif args.cmd == "restore-chunk":
+            target = restore_chunk(archive, *args.block, args.dim, args.kind, args.world)
+            if target is None:
+                print("Chunk is not in the archive")
+                sys.exit(1)
+            print(f"Restored chunk {args.block[0] >> 4},{args.block[1] >> 4} into {target}")
+    except KeyError as e:
+        print(e.args[0])
+        sys.exit(1)
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
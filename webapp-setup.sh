@@ -20,12 +20,14 @@ mkdir -p /opt/webapp/static
 # Create virtual environment and install Flask
 cd /opt/webapp
 python3 -m venv venv
-./venv/bin/pip install flask gunicorn
+./venv/bin/pip install flask gunicorn pillow
 
-# Copy app files (assumes they're in /tmp)
-cp /tmp/app.py /opt/webapp/
+# Copy app files (assumes they're in /tmp). tsdb.py and log_index.py are
+# symlinks in webapp/ to the ones in minecraft/; copy what they point to
+# (scp and cp follow them), so both sides always run the same code
+cp /tmp/app.py /tmp/status_cache.py /tmp/remote.py /tmp/jobs.py /tmp/render_worker.py /tmp/events.py /tmp/camera.py /tmp/variants.py /tmp/publisher.py /tmp/metrics.py /tmp/tsdb.py /tmp/log_index.py /opt/webapp/
 cp /tmp/Caddyfile /etc/caddy/
-cp /tmp/webapp.service /etc/systemd/system/
+cp /tmp/webapp.service /tmp/render-worker.service /tmp/publisher.service /etc/systemd/system/
 
 # Copy static assets if provided
 [ -f /tmp/jee.bz.png ] && cp /tmp/jee.bz.png /opt/webapp/static/
@@ -37,8 +39,8 @@ chown -R webapp:webapp /opt/webapp
 
 # Enable and start services
 systemctl daemon-reload
-systemctl enable webapp caddy
-systemctl start webapp caddy
+systemctl enable webapp render-worker publisher caddy
+systemctl start webapp render-worker publisher caddy
 
 echo "=== Webapp setup complete ==="
 echo "Configure Caddyfile with your domain and container IPs"
@@ -1,15 +1,64 @@
-import subprocess
-from flask import Flask, render_template_string, jsonify, send_from_directory
-import socket
-import struct
-import json
+from flask import Flask, Response, g, jsonify, request, send_from_directory, stream_with_context
+import hashlib
+import math
 import os
-
-app = Flask(__name__)
+import sqlite3
+import threading
+import time
+
+import metrics
+import tsdb
+from camera import MOVES as CAMERA_MOVES, CameraStore
+from events import EventBus, format_event
+from jobs import JobQueue, QueueFull
+from log_index import EventLog
+from publisher import load_state
+from status_cache import StatusCache
+from variants import load_manifest
+
+app = Flask(__name__, static_folder=None)  # /static/ is served by static_files()
 
 MC_HOST = "192.168.0.165"
 MC_PORT = 25565
 
+# Status is probed by one background poller and shared by all workers; every
+# sample is also kept as player-count history (/api/mc/history)
+MC_STATUS_TTL = float(os.environ.get("MC_STATUS_TTL", "10"))
+MC_HISTORY_DIR = os.environ.get("MC_HISTORY_DIR", "/opt/webapp/history")
+status_cache = StatusCache(MC_HOST, MC_PORT, ttl=MC_STATUS_TTL, history_dir=MC_HISTORY_DIR)
+
+# Renders are run by render_worker.py; endpoints only enqueue jobs
+jobs = JobQueue()
+
+# The webapp owns the camera; render jobs carry it to the render host
+camera = CameraStore()
+
+# Status changes, finished jobs and background updates are pushed to
+# browsers over /api/events. Each stream holds a gunicorn thread, so they
+# are capped per worker and recycled periodically.
+events = EventBus()
+EVENT_STREAMS_MAX = int(os.environ.get("EVENT_STREAMS_MAX", "24"))
+EVENT_STREAM_LIFETIME = 300
+_streams = 0
+_streams_lock = threading.Lock()
+
+# Server telemetry is collected on the Minecraft container (telemetry.py)
+# into a tsdb store on the shared mount
+TELEMETRY_DIR = os.environ.get("TELEMETRY_DIR", "/mnt/shared/telemetry")
+TELEMETRY_MAX_POINTS = 2000
+
+# Lag spikes, joins/leaves, saves and errors indexed from the server log by
+# log_index.py on the Minecraft container
+server_log = EventLog(os.environ.get("LOG_EVENTS_DB", "/mnt/shared/telemetry/events.db"), readonly=True)
+LOG_EVENTS_MAX = 1000
+
+# Prometheus metrics for this worker; /metrics merges all processes (see
+# metrics.py). Caddy only lets the local network scrape it.
+@metrics.REGISTRY.collector("render_jobs", "Render jobs in the queue, by state", ("state",))
+def queue_depth():
+    counts = jobs.status(recent=0)
+    return {("queued",): counts["queued"], ("running",): counts["running"]}
+
 HTML_TEMPLATE = """
 <!DOCTYPE html>
 <html>
@@ -32,19 +81,30 @@ HTML_TEMPLATE = """
         .bg-cinematic {
             position: fixed;
             top: 0; left: 0; right: 0; bottom: 0;
-            background: linear-gradient(rgba(5, 5, 10, 0.25), rgba(5, 5, 10, 0.35)), url('/static/site_background.jpg');
+            background: linear-gradient(rgba(5, 5, 10, 0.25), rgba(5, 5, 10, 0.35)), url('/static/site_background.jpg?v={{ bg_version }}');
             background-size: cover;
             background-position: center;
             z-index: 0;
             transition: opacity 1s ease-in-out;
         }
+        {% if bg_variants %}
+        {% for width in (None, 1280, 640) %}
+        {% if width %}@media (max-width: {{ width }}px) { {% endif %}
+        .bg-cinematic {
+            background-image: linear-gradient(rgba(5, 5, 10, 0.25), rgba(5, 5, 10, 0.35)), image-set(
+                {% for fmt in bg_variants.variants %}url('{{ srcset(bg_variants, fmt, bg_version, width or bg_variants.width) }}') type('image/{{ fmt }}'),
+                {% endfor %}url('/static/site_background.jpg?v={{ bg_version }}') type('image/jpeg'));
+        }
+        {% if width %}}{% endif %}
+        {% endfor %}
+        {% endif %}
 
         .bg-cinematic.loading {
             opacity: 0;
         }
 
         .bg-cinematic.peek {
-            background: url('/static/site_background.jpg');
+            background: url('/static/site_background.jpg?v={{ bg_version }}');
             background-size: cover;
             background-position: center;
             z-index: 9999;
@@ -544,7 +604,12 @@ HTML_TEMPLATE = """
                 <button class="refresh-btn" id="refresh-map-btn" onclick="refreshMap()">Refresh</button>
             </div>
             <div class="map-container">
-                <img id="spawn-map-img" src="/static/spawn_map.png?v={{ cache_bust }}" alt="Spawn Area Map" title="512x512 blocks around spawn">
+                <picture>
+                    {% for fmt in (map_variants.variants if map_variants else ()) %}
+                    <source type="image/{{ fmt }}" srcset="{{ srcset(map_variants, fmt, cache_bust) }}">
+                    {% endfor %}
+                    <img id="spawn-map-img" src="/static/spawn_map.png?v={{ cache_bust }}" alt="Spawn Area Map" title="512x512 blocks around spawn">
+                </picture>
             </div>
             <div class="map-legend">
                 <div class="legend-item"><span class="legend-color spawn-marker"></span> Spawn</div>
@@ -562,7 +627,12 @@ HTML_TEMPLATE = """
                 <button class="refresh-btn" id="refresh-detail-btn" onclick="refreshDetail()">Refresh</button>
             </div>
             <div class="map-container">
-                <img id="detail-map-img" src="/static/spawn_detail.png?v={{ cache_bust_detail }}" alt="Isometric 3D View" title="Chunky path-traced render">
+                <picture>
+                    {% for fmt in (detail_variants.variants if detail_variants else ()) %}
+                    <source type="image/{{ fmt }}" sizes="(max-width: 600px) 100vw, 540px" srcset="{{ srcset(detail_variants, fmt, cache_bust_detail) }}">
+                    {% endfor %}
+                    <img id="detail-map-img" src="/static/spawn_detail.png?v={{ cache_bust_detail }}" alt="Isometric 3D View" title="Chunky path-traced render">
+                </picture>
             </div>
             <div class="camera-panel">
                 <div class="camera-controls">
@@ -583,9 +653,9 @@ HTML_TEMPLATE = """
                     </div>
                 </div>
                 <div class="cam-stats" id="cam-stats">
-                    <div id="cam-x">---</div>
-                    <div id="cam-z">---</div>
-                    <div id="cam-fov">--</div>
+                    <div id="cam-x">{{ cam.x }}</div>
+                    <div id="cam-z">{{ cam.z }}</div>
+                    <div id="cam-fov">{{ cam.fov }}</div>
                 </div>
             </div>
         </div>
@@ -595,48 +665,102 @@ HTML_TEMPLATE = """
     <script>
         let lastOnline = {{ 'true' if mc.online else 'false' }};
         
+        // Live updates are pushed over /api/events; polling is only a fallback
+        // for when the event stream is unavailable
+        let eventsOpen = false;
+        const jobWaiters = {};
+
         async function updateStatus() {
             try {
                 const response = await fetch('/api/mc');
-                const data = await response.json();
-                
-                const statusIndicator = document.getElementById('status-indicator');
-                const statusDot = document.getElementById('status-dot');
-                const statusText = document.getElementById('status-text');
-                const versionIndicator = document.getElementById('version-indicator');
-                const version = document.getElementById('version');
-                const statsGrid = document.getElementById('stats-grid');
-                const playersOnline = document.getElementById('players-online');
-                const playersMax = document.getElementById('players-max');
-                const motd = document.getElementById('motd');
-                
-                if (data.online) {
-                    statusIndicator.className = 'status-indicator online';
-                    statusDot.className = 'dot online';
-                    statusText.textContent = 'ONLINE';
-                    versionIndicator.style.display = '';
-                    version.textContent = data.version;
-                    statsGrid.style.display = '';
-                    playersOnline.textContent = data.players_online;
-                    playersMax.textContent = data.players_max;
-                    motd.textContent = data.motd;
-                } else {
-                    statusIndicator.className = 'status-indicator offline';
-                    statusDot.className = 'dot offline';
-                    statusText.textContent = 'OFFLINE';
-                    versionIndicator.style.display = 'none';
-                    statsGrid.style.display = 'none';
-                    motd.textContent = '';
-                }
-                
-                lastOnline = data.online;
+                applyStatus(await response.json());
             } catch (e) {
                 console.error('Failed to fetch status:', e);
             }
         }
-        
-        // Update every 10 seconds
-        setInterval(updateStatus, 10000);
+
+        function applyStatus(data) {
+            const statusIndicator = document.getElementById('status-indicator');
+            const statusDot = document.getElementById('status-dot');
+            const statusText = document.getElementById('status-text');
+            const versionIndicator = document.getElementById('version-indicator');
+            const version = document.getElementById('version');
+            const statsGrid = document.getElementById('stats-grid');
+            const playersOnline = document.getElementById('players-online');
+            const playersMax = document.getElementById('players-max');
+            const motd = document.getElementById('motd');
+            
+            if (data.online) {
+                statusIndicator.className = 'status-indicator online';
+                statusDot.className = 'dot online';
+                statusText.textContent = 'ONLINE';
+                versionIndicator.style.display = '';
+                version.textContent = data.version;
+                statsGrid.style.display = '';
+                playersOnline.textContent = data.players_online;
+                playersMax.textContent = data.players_max;
+                motd.textContent = data.motd;
+            } else {
+                statusIndicator.className = 'status-indicator offline';
+                statusDot.className = 'dot offline';
+                statusText.textContent = 'OFFLINE';
+                versionIndicator.style.display = 'none';
+                statsGrid.style.display = 'none';
+                motd.textContent = '';
+            }
+            
+            lastOnline = data.online;
+        }
+
+        // Update every 10 seconds when not receiving events
+        setInterval(() => { if (!eventsOpen) updateStatus(); }, 10000);
+
+        // Resolves with the job on its completion event, or polls it when no
+        // event arrives in time
+        function nextJobUpdate(id) {
+            return new Promise(resolve => {
+                const timer = setTimeout(async () => {
+                    delete jobWaiters[id];
+                    try {
+                        const response = await fetch('/api/jobs/' + id);
+                        resolve(await response.json());
+                    } catch (e) {
+                        resolve({ id: id, state: 'queued' });
+                    }
+                }, eventsOpen ? 10000 : 1500);
+                jobWaiters[id] = job => { clearTimeout(timer); delete jobWaiters[id]; resolve(job); };
+            });
+        }
+
+        // Renders run in a job queue; wait for the job to finish
+        async function waitForJob(data) {
+            if (!data.success || !data.job) return data;
+            let job = data.job;
+            while (job.state !== 'done' && job.state !== 'failed') {
+                if (job.state === 'superseded') {
+                    // Merged into a newer job: follow it
+                    const response = await fetch('/api/jobs/' + job.superseded_by);
+                    job = await response.json();
+                } else {
+                    job = await nextJobUpdate(job.id);
+                }
+            }
+            return {
+                success: job.state === 'done',
+                message: job.message,
+                cam: job.result ? job.result.cam : null,
+                version: (job.result && job.result.version) || Date.now()
+            };
+        }
+
+        // <source> candidates win over img.src, so bump their versions too
+        function setImageVersion(img, version) {
+            if (img.src.endsWith('?v=' + version)) return;
+            img.parentNode.querySelectorAll('source').forEach(source => {
+                source.srcset = source.srcset.replace(/\?v=\d+/g, '?v=' + version);
+            });
+            img.src = img.src.replace(/\?v=\d+/, '?v=' + version);
+        }
 
         async function refreshMap() {
             const btn = document.getElementById('refresh-map-btn');
@@ -648,10 +772,10 @@ HTML_TEMPLATE = """
 
             try {
                 const response = await fetch('/api/render-map', { method: 'POST' });
-                const data = await response.json();
+                const data = await waitForJob(await response.json());
 
                 if (data.success) {
-                    mapImg.src = '/static/spawn_map.png?v=' + Date.now();
+                    setImageVersion(mapImg, data.version);
                     btn.textContent = 'Done!';
                     setTimeout(() => { btn.textContent = 'Refresh'; }, 2000);
                 } else {
@@ -680,10 +804,10 @@ HTML_TEMPLATE = """
 
             try {
                 const response = await fetch('/api/render-detail', { method: 'POST' });
-                const data = await response.json();
+                const data = await waitForJob(await response.json());
 
                 if (data.success) {
-                    detailImg.src = '/static/spawn_detail.png?v=' + Date.now();
+                    setImageVersion(detailImg, data.version);
                     if (data.cam) updateCamStats(data.cam);
                     btn.textContent = 'Done!';
                     setTimeout(() => { btn.textContent = 'Refresh'; }, 2000);
@@ -703,31 +827,18 @@ HTML_TEMPLATE = """
         }
 
         let renderTimeout = null;
-        let pendingMoves = [];
 
         async function moveCamera(direction) {
-            // Queue the move
-            pendingMoves.push(direction);
-
-            // Update stats immediately (optimistic)
-            const cam = {
-                x: parseInt(document.getElementById('cam-x').textContent) || -100,
-                z: parseInt(document.getElementById('cam-z').textContent) || -270,
-                fov: parseInt(document.getElementById('cam-fov').textContent) || 80
-            };
-
-            if (direction === 'n') cam.z -= 30;
-            else if (direction === 's') cam.z += 30;
-            else if (direction === 'e') cam.x += 30;
-            else if (direction === 'w') cam.x -= 30;
-            else if (direction === 'in') cam.fov = Math.max(30, cam.fov - 10);
-            else if (direction === 'out') cam.fov = Math.min(150, cam.fov + 10);
-            else if (direction === 'reset') { cam.x = -100; cam.z = -270; cam.fov = 80; }
-
-            updateCamStats(cam);
+            // Movement is applied server-side; the response is the new camera
             document.getElementById('cam-stats').classList.add('updating');
+            try {
+                const response = await fetch('/api/camera/move?moves=' + direction, { method: 'POST' });
+                updateCamStats(await response.json());
+            } catch (e) {
+                console.error('Failed to move camera:', e);
+            }
 
-            // Clear previous timeout and set new one
+            // Render once the moves stop coming in
             if (renderTimeout) clearTimeout(renderTimeout);
             renderTimeout = setTimeout(triggerRender, 1000);
         }
@@ -737,18 +848,14 @@ HTML_TEMPLATE = """
             const detailImg = document.getElementById('detail-map-img');
             const stats = document.getElementById('cam-stats');
 
-            // Get all pending moves
-            const moves = pendingMoves.join(',');
-            pendingMoves = [];
-
             btns.forEach(b => { b.disabled = true; b.classList.add('loading'); });
 
             try {
-                const response = await fetch('/api/render-detail?moves=' + moves, { method: 'POST' });
-                const data = await response.json();
+                const response = await fetch('/api/render-detail', { method: 'POST' });
+                const data = await waitForJob(await response.json());
 
                 if (data.success) {
-                    detailImg.src = '/static/spawn_detail.png?v=' + Date.now();
+                    setImageVersion(detailImg, data.version);
                     if (data.cam) updateCamStats(data.cam);
                 }
             } catch (e) {
@@ -765,30 +872,66 @@ HTML_TEMPLATE = """
             document.getElementById('cam-fov').textContent = cam.fov;
         }
 
-        // Load camera stats on page load
-        fetch('/api/cam-stats').then(r => r.json()).then(updateCamStats).catch(() => {});
-
         // Check for background image updates
-        let lastBgUpdate = 0;
+        let lastBgUpdate = {{ bg_version }};
         async function checkBackground() {
             try {
                 const response = await fetch('/api/background-status');
-                const data = await response.json();
-                if (data.updated > lastBgUpdate && data.exists) {
-                    lastBgUpdate = data.updated;
-                    const bg = document.getElementById('bg-cinematic');
-                    bg.classList.add('loading');
-                    const img = new Image();
-                    img.onload = () => {
-                        bg.style.backgroundImage = 'url(/static/site_background.jpg?v=' + data.updated + ')';
-                        setTimeout(() => bg.classList.remove('loading'), 100);
-                    };
-                    img.src = '/static/site_background.jpg?v=' + data.updated;
-                }
+                applyBackground(await response.json());
             } catch (e) {}
         }
-        checkBackground();
-        setInterval(checkBackground, 30000);
+
+        function applyBackground(data) {
+            if (data.updated > lastBgUpdate && data.exists) {
+                lastBgUpdate = data.updated;
+                const bg = document.getElementById('bg-cinematic');
+                bg.classList.add('loading');
+                const v = '?v=' + data.updated;
+                const formats = data.formats || [];
+                const img = new Image();
+                img.onload = () => {
+                    bg.style.backgroundImage = formats.length
+                        ? 'image-set(' + formats.map(f => "url('/static/site_background." + f + v + "') type('image/" + f + "')").join(', ')
+                          + ", url('/static/site_background.jpg" + v + "') type('image/jpeg'))"
+                        : "url('/static/site_background.jpg" + v + "')";
+                    setTimeout(() => bg.classList.remove('loading'), 100);
+                };
+                img.src = '/static/site_background.' + (formats.includes('webp') ? 'webp' : 'jpg') + v;
+            }
+        }
+        setInterval(() => { if (!eventsOpen) checkBackground(); }, 30000);
+
+        // A finished render refreshes the image in every open tab, not just
+        // the one that asked for it
+        function applyJob(job) {
+            if (jobWaiters[job.id]) jobWaiters[job.id](job);
+            if (job.state !== 'done') return;
+            const version = (job.result && job.result.version) || Math.floor(job.finished);
+            if (job.kind === 'map') {
+                applyImage({ name: 'spawn_map.png', version: version });
+            } else if (job.kind === 'detail') {
+                applyImage({ name: 'spawn_detail.png', version: version });
+                if (job.result && job.result.cam) updateCamStats(job.result.cam);
+            }
+        }
+
+        function applyImage(data) {
+            const img = document.getElementById(data.name === 'spawn_map.png' ? 'spawn-map-img' : 'detail-map-img');
+            if (img) setImageVersion(img, data.version);
+        }
+
+        if (window.EventSource) {
+            const events = new EventSource('/api/events');
+            events.onopen = () => { eventsOpen = true; };
+            events.onerror = () => { eventsOpen = false; };
+            events.addEventListener('status', e => applyStatus(JSON.parse(e.data)));
+            events.addEventListener('background', e => applyBackground(JSON.parse(e.data)));
+            events.addEventListener('job', e => applyJob(JSON.parse(e.data)));
+            events.addEventListener('image', e => applyImage(JSON.parse(e.data)));
+            events.addEventListener('camera', e => updateCamStats(JSON.parse(e.data)));
+        } else {
+            checkBackground();
+        }
 
         // Peek at background without filters on click-hold
         const bgEl = document.getElementById('bg-cinematic');
@@ -803,133 +946,140 @@ HTML_TEMPLATE = """
 </html>
 """
 
-def write_varint(val):
-    result = b""
-    while True:
-        b = val & 0x7F
-        val >>= 7
-        if val:
-            result += bytes([b | 0x80])
-        else:
-            result += bytes([b])
-            break
-    return result
-
-def read_varint(sock):
-    val = 0
-    for i in range(5):
-        b = sock.recv(1)
-        if not b:
-            raise Exception("No data")
-        b = b[0]
-        val |= (b & 0x7F) << (7 * i)
-        if not (b & 0x80):
-            break
-    return val
+@app.before_request
+def start_timer():
+    metrics.REGISTRY.start("web")
+    g.started = time.monotonic()
+    # Event streams are long-lived by design and have their own gauge
+    g.in_flight = request.endpoint != "event_stream"
+    if g.in_flight:
+        metrics.REQUESTS_IN_FLIGHT.inc()
+
+@app.after_request
+def record_status(response):
+    g.status = response.status_code
+    return response
+
+@app.teardown_request
+def end_request(exc):
+    # Recorded here rather than in after_request, which is skipped when a
+    # view raises and the exception propagates
+    if "started" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.REQUEST_DURATION.observe(time.monotonic() - g.started,
+                                         (route, request.method, str(g.get("status", 500))))
+    if g.pop("in_flight", False):
+        metrics.REQUESTS_IN_FLIGHT.dec()
 
 def mc_status():
+    return status_cache.get()
+
+def static_version(path):
+    """mtime used as cache-buster, or 0 if the file does not exist"""
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(5)
-        sock.connect((MC_HOST, MC_PORT))
-        
-        host = MC_HOST.encode("utf-8")
-        packet = write_varint(0)
-        packet += write_varint(0)
-        packet += write_varint(len(host)) + host
-        packet += struct.pack(">H", MC_PORT)
-        packet += write_varint(1)
-        sock.send(write_varint(len(packet)) + packet)
-        
-        status_request = write_varint(0)
-        sock.send(write_varint(len(status_request)) + status_request)
-        
-        length = read_varint(sock)
-        packet_id = read_varint(sock)
-        json_length = read_varint(sock)
-        
-        response = b""
-        while len(response) < json_length:
-            response += sock.recv(json_length - len(response))
-        
-        sock.close()
-        data = json.loads(response.decode("utf-8"))
-        
-        motd = data.get("description", "")
-        if isinstance(motd, dict):
-            motd = motd.get("text", "")
-        
-        return {
-            "online": True,
-            "players_online": data.get("players", {}).get("online", 0),
-            "players_max": data.get("players", {}).get("max", 0),
-            "version": data.get("version", {}).get("name", "Unknown"),
-            "motd": motd
-        }
-    except:
-        return {"online": False, "players_online": 0, "players_max": 0, "version": "", "motd": ""}
+        return int(os.stat(path).st_mtime)
+    except OSError:
+        return 0
+
+def current_variants(path, version):
+    """Variant manifest of a static image, or None if it predates the image"""
+    manifest = load_manifest(path)
+    if manifest and manifest["version"] == version:
+        return manifest
+    return None
+
+def srcset(manifest, fmt, version, width=None):
+    """srcset for one format; with width, only the best single candidate"""
+    entries = manifest["variants"][fmt]
+    if width:
+        fitting = [e for e in entries if e[0] >= width]
+        entries = [min(fitting) if fitting else max(entries)]
+        return f"/static/{entries[0][1]}?v={version}"
+    return ", ".join(f"/static/{name}?v={version} {w}w" for w, name in entries)
+
+# The template is compiled once; the rendered page is cached until one of
+# its inputs changes
+app.jinja_env.globals["srcset"] = srcset
+index_template = app.jinja_env.from_string(HTML_TEMPLATE)
+_page = (None, None, None)  # key, body, etag
 
 @app.route("/")
 def index():
+    global _page
     mc = mc_status()
-    map_exists = os.path.exists("/opt/webapp/static/spawn_map.png")
-    cache_bust = int(os.path.getmtime("/opt/webapp/static/spawn_map.png")) if map_exists else 0
-    detail_exists = os.path.exists("/opt/webapp/static/spawn_detail.png")
-    cache_bust_detail = int(os.path.getmtime("/opt/webapp/static/spawn_detail.png")) if detail_exists else 0
-    return render_template_string(HTML_TEMPLATE, mc=mc, map_exists=map_exists, cache_bust=cache_bust, detail_exists=detail_exists, cache_bust_detail=cache_bust_detail)
+    cam = camera.get()
+    cache_bust = static_version("/opt/webapp/static/spawn_map.png")
+    cache_bust_detail = static_version("/opt/webapp/static/spawn_detail.png")
+    bg_version = static_version("/opt/webapp/static/site_background.jpg")
+    map_variants = current_variants("/opt/webapp/static/spawn_map.png", cache_bust)
+    detail_variants = current_variants("/opt/webapp/static/spawn_detail.png", cache_bust_detail)
+    bg_variants = current_variants("/opt/webapp/static/site_background.jpg", bg_version)
+    key = (tuple(sorted(mc.items())), tuple(sorted(cam.items())), cache_bust, cache_bust_detail, bg_version,
+           bool(map_variants), bool(detail_variants), bool(bg_variants))
+    page_key, body, etag = _page
+    if page_key != key:
+        body = index_template.render(mc=mc, cam=cam, map_exists=bool(cache_bust), cache_bust=cache_bust,
+                                     detail_exists=bool(cache_bust_detail), cache_bust_detail=cache_bust_detail,
+                                     bg_version=bg_version, map_variants=map_variants,
+                                     detail_variants=detail_variants, bg_variants=bg_variants).encode()
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        _page = (key, body, etag)
+    response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+# Caddy serves /static/ straight from disk in production (see Caddyfile);
+# this route is the fallback for running the app on its own
+STATIC_MAX_AGE = 300
+STATIC_IMMUTABLE_MAX_AGE = 31536000
 
 @app.route("/static/<path:filename>")
 def static_files(filename):
-    return send_from_directory("/opt/webapp/static", filename)
+    # ?v=<mtime> URLs never change content, so they can be cached for good
+    versioned = "v" in request.args
+    response = send_from_directory("/opt/webapp/static", filename,
+                                   max_age=STATIC_IMMUTABLE_MAX_AGE if versioned else STATIC_MAX_AGE)
+    if versioned:
+        response.headers["Cache-Control"] += ", immutable"
+    return response
+
+def enqueue_render(kind, args=None):
+    try:
+        job = jobs.enqueue(kind, args)
+    except QueueFull as e:
+        return jsonify({"success": False, "message": str(e)}), 503
+    return jsonify({"success": True, "message": "Render queued", "job": job}), 202
 
 @app.route("/api/render-map", methods=["POST"])
 def render_map():
-    try:
-        cmd = 'pct exec 100 -- /opt/minecraft/render_map.sh'
-        result = subprocess.run(["/bin/ssh", "-o", "StrictHostKeyChecking=no", "root@192.168.0.124", cmd], capture_output=True, timeout=90)
-        if result.returncode != 0:
-            return jsonify({"success": False, "message": f"SSH failed: {result.stderr.decode()[-500:]}"}), 500
-        subprocess.run(["/bin/cp", "/mnt/shared/spawn_map.png", "/opt/webapp/static/"], timeout=10)
-        return jsonify({"success": True, "message": "Map updated"})
-    except subprocess.TimeoutExpired:
-        return jsonify({"success": False, "message": "Render timed out"}), 500
-    except Exception as e:
-        return jsonify({"success": False, "message": str(e)}), 500
+    return enqueue_render("map")
+
+def requested_moves():
+    # Camera movements can be comma-separated for batched moves
+    moves = request.args.get('moves', '') or request.args.get('move', '')
+    return [m for m in moves.split(',') if m in CAMERA_MOVES]
 
 @app.route("/api/render-detail", methods=["POST"])
 def render_detail():
-    from flask import request
-    try:
-        # Get camera movements (can be comma-separated for batched moves)
-        moves = request.args.get('moves', '') or request.args.get('move', '')
-        valid_moves = ['n', 's', 'e', 'w', 'in', 'out', 'reset']
-        move_list = [m for m in moves.split(',') if m in valid_moves]
-
-        if move_list:
-            # Pass comma-separated moves to script (it handles them internally)
-            move_str = ','.join(move_list)
-            cmd = f'pct exec 100 -- /opt/minecraft/render_isometric.sh {move_str}'
-        else:
-            cmd = 'pct exec 100 -- /opt/minecraft/render_isometric.sh'
-        result = subprocess.run(["/bin/ssh", "-o", "StrictHostKeyChecking=no", "root@192.168.0.124", cmd], capture_output=True, timeout=300)
-        if result.returncode != 0:
-            return jsonify({"success": False, "message": f"SSH failed: {result.stderr.decode()[-500:]}"}), 500
-        subprocess.run(["/bin/cp", "/mnt/shared/spawn_detail.png", "/opt/webapp/static/"], timeout=10)
-        # Read camera state
-        cam = {"x": -100, "z": -270, "fov": 80}
-        try:
-            state = subprocess.run(["/bin/ssh", "-o", "StrictHostKeyChecking=no", "root@192.168.0.124",
-                "pct exec 100 -- cat /opt/chunky/camera_state"], capture_output=True, timeout=10)
-            for line in state.stdout.decode().split('\n'):
-                if line.startswith('CAM_X='): cam['x'] = int(line.split('=')[1])
-                elif line.startswith('CAM_Z='): cam['z'] = int(line.split('=')[1])
-                elif line.startswith('FOV='): cam['fov'] = int(line.split('=')[1])
-        except: pass
-        return jsonify({"success": True, "message": "Detail updated", "cam": cam})
-    except subprocess.TimeoutExpired:
-        return jsonify({"success": False, "message": "Render timed out"}), 500
-    except Exception as e:
-        return jsonify({"success": False, "message": str(e)}), 500
+    move_list = requested_moves()
+    cam = camera.move(move_list) if move_list else camera.get()
+    return enqueue_render("detail", {"cam": cam})
+
+@app.route("/api/camera/move", methods=["POST"])
+def camera_move():
+    return jsonify(camera.move(requested_moves()))
+
+@app.route("/api/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Unknown job"}), 404
+    return jsonify(job)
+
+@app.route("/api/queue")
+def queue_status():
+    return jsonify(jobs.status())
 
 @app.route("/api/mc")
 def api_mc():
@@ -937,43 +1087,151 @@ def api_mc():
 
 @app.route("/api/cam-stats")
 def cam_stats():
-    cam = {"x": -100, "z": -270, "fov": 80}
-    try:
-        result = subprocess.run(["/bin/ssh", "-o", "StrictHostKeyChecking=no", "root@192.168.0.124",
-            "pct exec 100 -- cat /opt/chunky/camera_state"], capture_output=True, timeout=10)
-        for line in result.stdout.decode().split('\n'):
-            if line.startswith('CAM_X='): cam['x'] = int(line.split('=')[1])
-            elif line.startswith('CAM_Z='): cam['z'] = int(line.split('=')[1])
-            elif line.startswith('FOV='): cam['fov'] = int(line.split('=')[1])
-    except: pass
-    return jsonify(cam)
+    return jsonify(camera.get())
+
+def background_state():
+    # publisher.py copies new backgrounds into the web root and records them
+    entry = load_state().get("site_background.jpg")
+    if entry is None:
+        return {"exists": False, "updated": 0, "formats": []}
+    return {"exists": True, "updated": entry["version"], "formats": entry["formats"]}
 
 @app.route("/api/background-status")
 def background_status():
-    bg_path = "/opt/webapp/static/site_background.jpg"
-    shared_path = "/mnt/shared/site_background.jpg"
-    exists = os.path.exists(bg_path)
-    updated = int(os.path.getmtime(bg_path)) if exists else 0
-    # Check if shared has newer version and copy it
-    if os.path.exists(shared_path):
-        shared_time = int(os.path.getmtime(shared_path))
-        if shared_time > updated:
-            try:
-                subprocess.run(["/bin/cp", shared_path, bg_path], timeout=10)
-                updated = shared_time
-                exists = True
-            except: pass
-    return jsonify({"exists": exists, "updated": updated})
+    return jsonify(background_state())
 
 @app.route("/api/render-background", methods=["POST"])
 def render_background():
+    return enqueue_render("background")
+
+def time_range():
+    """start, end and point budget of a chart request: ?range=SECONDS back
+    from now, or ?start=&end= as Unix times; ?points= caps the resolution"""
+    try:
+        end = float(request.args.get("end", time.time()))
+        start = float(request.args.get("start", end - float(request.args.get("range", 3600))))
+        points = min(int(request.args.get("points", 500)), TELEMETRY_MAX_POINTS)
+    except ValueError:
+        return None
+    # float() accepts "nan" and "inf"; neither is a usable bound
+    if not (math.isfinite(start) and math.isfinite(end)) or start >= end or points < 1:
+        return None
+    return start, end, points
+
+def series_response(series, missing):
+    span = time_range()
+    if span is None:
+        return jsonify({"success": False, "message": "Bad time range"}), 400
+    if series is None:
+        return jsonify({"success": False, "message": missing}), 404
+    data = series.query(*span)
+    response = jsonify(data)
+    # Stale by at most one step (a minute at the coarser levels)
+    response.headers["Cache-Control"] = f"max-age={min(data['step'], 60)}"
+    return response
+
+@app.route("/api/telemetry")
+def telemetry():
     try:
-        # Run background render in background (non-blocking)
-        cmd = 'pct exec 100 -- nohup /opt/minecraft/render_background.sh > /tmp/bg_render.log 2>&1 &'
-        subprocess.run(["/bin/ssh", "-o", "StrictHostKeyChecking=no", "root@192.168.0.124", cmd], capture_output=True, timeout=10)
-        return jsonify({"success": True, "message": "Background render started"})
-    except Exception as e:
-        return jsonify({"success": False, "message": str(e)}), 500
+        series = tsdb.Series(TELEMETRY_DIR, "server")
+    except KeyError:
+        series = None
+    return series_response(series, "No telemetry yet")
+
+@app.route("/api/mc/history")
+def mc_history():
+    return series_response(status_cache.history(), "No player history yet")
+
+@app.route("/api/mc/events")
+def mc_events():
+    span = time_range()
+    if span is None:
+        return jsonify({"success": False, "message": "Bad time range"}), 400
+    start, end, _ = span
+    try:
+        limit = min(int(request.args.get("limit", LOG_EVENTS_MAX)), LOG_EVENTS_MAX)
+    except ValueError:
+        return jsonify({"success": False, "message": "Bad limit"}), 400
+    try:
+        return jsonify(server_log.query(start, end, request.args.getlist("kind"), limit))
+    except sqlite3.OperationalError:
+        return jsonify({"success": False, "message": "No log index yet"}), 404
+
+@events.watch
+def watch_status(bus, last):
+    status = mc_status()
+    if status != last.get("status"):
+        last["status"] = status
+        bus.publish("status", status)
+
+@events.watch
+def watch_jobs(bus, last):
+    since = last.setdefault("since", time.time())
+    for job in jobs.finished_since(since):
+        last["since"] = max(last["since"], job["finished"])
+        bus.publish("job", job)
+
+@events.watch
+def watch_camera(bus, last):
+    cam = camera.get()
+    if cam != last.get("cam"):
+        last["cam"] = cam
+        bus.publish("camera", cam)
+
+@events.watch
+def watch_background(bus, last):
+    state = background_state()
+    if state != last.get("state"):
+        last["state"] = state
+        bus.publish("background", state)
+
+@events.watch
+def watch_images(bus, last):
+    # Renders published outside a job (cron) reach open pages this way too
+    state = load_state()
+    for name in ("spawn_map.png", "spawn_detail.png"):
+        version = state.get(name, {}).get("version")
+        if version and version != last.get(name):
+            if name in last:
+                bus.publish("image", {"name": name, "version": version})
+            last[name] = version
+
+@app.route("/api/events")
+def event_stream():
+    global _streams
+    with _streams_lock:
+        if _streams >= EVENT_STREAMS_MAX:
+            return jsonify({"success": False, "message": "Too many event streams"}), 503
+        _streams += 1
+        metrics.EVENT_STREAMS.set(_streams)
+    events.start()
+
+    def stream():
+        global _streams
+        try:
+            # Current state first, then only changes
+            seq = events.seq
+            yield "retry: 5000\n\n"
+            yield format_event(seq, "status", mc_status())
+            yield format_event(seq, "background", background_state())
+            deadline = time.monotonic() + EVENT_STREAM_LIFETIME
+            while time.monotonic() < deadline:
+                new = events.wait(seq, timeout=15)
+                if not new:
+                    yield ": keepalive\n\n"
+                for seq, event, data in new:
+                    yield format_event(seq, event, data)
+        finally:
+            with _streams_lock:
+                _streams -= 1
+                metrics.EVENT_STREAMS.set(_streams)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.expose(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
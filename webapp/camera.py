@@ -0,0 +1,104 @@
+# Camera state for the isometric render
+# The webapp owns the camera. State lives in a small JSON file shared by the
+# gunicorn workers and the render worker; reads come from memory and are only
+# reloaded when the file changes. Moves are applied here, and every detail
+# render job carries the absolute position to the render host, which stores
+# it in /opt/chunky/camera_state for cron and background renders.
+
+import fcntl
+import json
+import os
+
+CAMERA_PATH = os.environ.get("CAMERA_STATE", "/opt/webapp/camera_state.json")
+
+# Must match render_isometric.sh
+DEFAULT = {"x": -29, "z": 415, "fov": 80}
+MOVE_STEP = 30
+FOV_STEP = 10
+FOV_MIN, FOV_MAX = 30, 150
+MOVES = ('n', 's', 'e', 'w', 'in', 'out', 'reset')
+
+
+def apply_moves(cam, moves):
+    cam = dict(cam)
+    for move in moves:
+        if move == 'n': cam['z'] -= MOVE_STEP
+        elif move == 's': cam['z'] += MOVE_STEP
+        elif move == 'e': cam['x'] += MOVE_STEP
+        elif move == 'w': cam['x'] -= MOVE_STEP
+        elif move == 'in': cam['fov'] = max(FOV_MIN, cam['fov'] - FOV_STEP)
+        elif move == 'out': cam['fov'] = min(FOV_MAX, cam['fov'] + FOV_STEP)
+        elif move == 'reset': cam = dict(DEFAULT)
+    return cam
+
+def parse_state_file(text):
+    """Parse the shell-style /opt/chunky/camera_state written by the render script"""
+    cam = dict(DEFAULT)
+    for line in text.split('\n'):
+        if line.startswith('CAM_X='): cam['x'] = int(line.split('=')[1])
+        elif line.startswith('CAM_Z='): cam['z'] = int(line.split('=')[1])
+        elif line.startswith('FOV='): cam['fov'] = int(line.split('=')[1])
+    return cam
+
+
+class CameraStore:
+    def __init__(self, path=CAMERA_PATH):
+        self.path = path
+        self._cam = dict(DEFAULT)
+        self._mtime = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def get(self):
+        self._load()
+        return dict(self._cam)
+
+    def move(self, moves):
+        """Apply moves atomically across processes and return the new camera"""
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Re-read even if the mtime looks unchanged: two writes can
+                # share a timestamp tick, and a lost move is not acceptable
+                self._load(force=True)
+                cam = apply_moves(self._cam, moves)
+                if cam != self._cam:
+                    self._write(cam)
+                return dict(cam)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def bootstrap(self, remote):
+        """Seed the store from the render host the first time it is used"""
+        if self.exists():
+            return
+        try:
+            result = remote.pct('cat /opt/chunky/camera_state', timeout=10, label="camera_state")
+            cam = parse_state_file(result.stdout.decode()) if result.ok else dict(DEFAULT)
+        except Exception:
+            cam = dict(DEFAULT)
+        self._write(cam)
+
+    def _load(self, force=False):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime and not force:
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self._cam = {k: int(data.get(k, v)) for k, v in DEFAULT.items()}
+            self._mtime = mtime
+        except (OSError, ValueError):
+            pass
+
+    def _write(self, cam):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(cam, f)
+        os.replace(tmp, self.path)
+        self._cam = dict(cam)
+        self._mtime = os.stat(self.path).st_mtime_ns
@@ -0,0 +1,68 @@
+# Server-sent events
+# One EventBus per worker process. Watcher functions run on a background
+# thread and publish an event only when something they watch changed; every
+# open /api/events stream waits on the bus and forwards new events, so idle
+# browser tabs make no requests at all.
+
+import collections
+import json
+import os
+import threading
+import time
+
+
+class EventBus:
+    def __init__(self, interval=1.0, backlog=256):
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._events = collections.deque(maxlen=backlog)
+        self._seq = 0
+        self._watchers = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def watch(self, fn):
+        """Register fn(bus, last), called every interval on the watcher
+        thread; `last` is a dict the watcher keeps its state in between
+        calls, one per bus"""
+        self._watchers.append((fn, {}))
+        return fn
+
+    def start(self):
+        # Started lazily so it also works when gunicorn forks after import;
+        # the first requests of a fresh worker race to get here
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="events", daemon=True).start()
+
+    def publish(self, event, data):
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, event, data))
+            self._cond.notify_all()
+
+    def wait(self, after, timeout):
+        """Events newer than sequence number `after`, waiting up to timeout"""
+        with self._cond:
+            if self._seq <= after:
+                self._cond.wait(timeout)
+            return [e for e in self._events if e[0] > after]
+
+    def _run(self):
+        while True:
+            for fn, last in self._watchers:
+                try:
+                    fn(self, last)
+                except Exception:
+                    pass
+            time.sleep(self.interval)
+
+
+def format_event(seq, event, data):
+    return f"id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,190 @@
+# Render job queue
+# Jobs live in a small SQLite database shared by the gunicorn workers (which
+# only enqueue and read) and render_worker.py (which claims and runs them).
+# The number of queued jobs is bounded so a burst of clicks cannot pile up
+# hours of rendering, and requests for the same target are coalesced into a
+# single job that every caller waits on.
+
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+DB_PATH = os.environ.get("JOBS_DB", "/opt/webapp/jobs.db")
+MAX_QUEUED = int(os.environ.get("JOBS_MAX_QUEUED", "8"))
+
+QUEUED, RUNNING, DONE, FAILED, SUPERSEDED = "queued", "running", "done", "failed", "superseded"
+FINISHED = (DONE, FAILED, SUPERSEDED)
+
+# Kinds whose queued job is replaced rather than joined by a different request
+SUPERSEDABLE = ("detail",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    args TEXT NOT NULL,
+    state TEXT NOT NULL,
+    message TEXT NOT NULL DEFAULT '',
+    result TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    superseded_by TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created);
+"""
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, path=DB_PATH, max_queued=MAX_QUEUED):
+        self.path = path
+        self.max_queued = max_queued
+        db = self._connect()
+        try:
+            db.executescript(SCHEMA)
+            columns = [r["name"] for r in db.execute("PRAGMA table_info(jobs)")]
+            if "superseded_by" not in columns:
+                db.execute("ALTER TABLE jobs ADD COLUMN superseded_by TEXT")
+        finally:
+            db.close()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def enqueue(self, kind, args=None):
+        """Queue a job, or return the pending job that already covers it"""
+        args = args or {}
+        job_id = uuid.uuid4().hex[:12]
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            pending = db.execute("SELECT * FROM jobs WHERE kind = ? AND state IN (?, ?) ORDER BY created",
+                                 (kind, QUEUED, RUNNING)).fetchall()
+            queued = [r for r in pending if r["state"] == QUEUED]
+            running = [r for r in pending if r["state"] == RUNNING]
+
+            # Identical requests join the pending run that already covers them.
+            # Moving the camera back to a view being rendered also makes any
+            # queued render of another view out of date
+            for row in queued + running:
+                if json.loads(row["args"]) == args:
+                    if kind in SUPERSEDABLE:
+                        for other in queued:
+                            if other["id"] != row["id"]:
+                                self._supersede(db, other["id"], row["id"])
+                    db.execute("COMMIT")
+                    return _job(row)
+
+            # A camera move makes a queued detail render out of date: replace
+            # it and point its waiters at the new job
+            superseded = queued[-1] if kind in SUPERSEDABLE and queued else None
+
+            if superseded is None:
+                count = db.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()[0]
+                if count >= self.max_queued:
+                    db.execute("ROLLBACK")
+                    raise QueueFull(f"Render queue is full ({count} jobs waiting)")
+            db.execute("INSERT INTO jobs (id, kind, args, state, created) VALUES (?, ?, ?, ?, ?)",
+                       (job_id, kind, json.dumps(args), QUEUED, time.time()))
+            if superseded is not None:
+                self._supersede(db, superseded["id"], job_id)
+            db.execute("COMMIT")
+        finally:
+            db.close()
+        return self.get(job_id)
+
+    def _supersede(self, db, job_id, by):
+        db.execute("UPDATE jobs SET state = ?, superseded_by = ?, message = ?, finished = ? WHERE id = ?",
+                   (SUPERSEDED, by, "Superseded by a newer camera move", time.time(), job_id))
+
+    def get(self, job_id):
+        db = self._connect()
+        try:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            db.close()
+        return _job(row) if row else None
+
+    def claim(self, kinds=None):
+        """Atomically take the oldest queued job, or None"""
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            query = "SELECT * FROM jobs WHERE state = ?"
+            params = [QUEUED]
+            if kinds:
+                query += " AND kind IN (%s)" % ",".join("?" * len(kinds))
+                params += list(kinds)
+            row = db.execute(query + " ORDER BY created LIMIT 1", params).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute("UPDATE jobs SET state = ?, started = ? WHERE id = ?", (RUNNING, time.time(), row["id"]))
+            db.execute("COMMIT")
+        finally:
+            db.close()
+        return self.get(row["id"])
+
+    def finish(self, job_id, success, message="", result=None):
+        db = self._connect()
+        try:
+            db.execute("UPDATE jobs SET state = ?, message = ?, result = ?, finished = ? WHERE id = ?",
+                       (DONE if success else FAILED, message, json.dumps(result) if result is not None else None,
+                        time.time(), job_id))
+        finally:
+            db.close()
+
+    def finished_since(self, since):
+        """Jobs that finished (or were superseded) after `since`"""
+        db = self._connect()
+        try:
+            rows = db.execute("SELECT * FROM jobs WHERE finished > ? ORDER BY finished", (since,)).fetchall()
+        finally:
+            db.close()
+        return [_job(r) for r in rows]
+
+    def recover(self):
+        """Fail jobs left running by a worker that died"""
+        db = self._connect()
+        try:
+            db.execute("UPDATE jobs SET state = ?, message = ?, finished = ? WHERE state = ?",
+                       (FAILED, "Render worker restarted", time.time(), RUNNING))
+        finally:
+            db.close()
+
+    def prune(self, max_age=86400):
+        db = self._connect()
+        try:
+            db.execute("DELETE FROM jobs WHERE state IN (?, ?, ?) AND finished < ?", (*FINISHED, time.time() - max_age))
+        finally:
+            db.close()
+
+    def status(self, recent=10):
+        db = self._connect()
+        try:
+            counts = dict(db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            rows = db.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (recent,)).fetchall()
+        finally:
+            db.close()
+        return {
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "max_queued": self.max_queued,
+            "jobs": [_job(r) for r in rows],
+        }
+
+
+def _job(row):
+    job = dict(row)
+    job["args"] = json.loads(job["args"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
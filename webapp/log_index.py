@@ -0,0 +1 @@
+../minecraft/log_index.py
\ No newline at end of file
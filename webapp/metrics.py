@@ -0,0 +1,306 @@
+# Prometheus metrics
+# Every process (both gunicorn workers, the render worker) records into its
+# own in-memory registry: one dict update under a lock per observation, no
+# I/O. A background thread writes the registry to a per-process snapshot
+# file every few seconds when it changed, and /metrics merges the snapshots
+# of all live processes into the text exposition format. Counters and
+# histograms are summed across processes; gauges keep a worker label. When a
+# process exits (gunicorn recycles workers), its counters and histograms are
+# folded into a retired snapshot, so the sums never go backwards.
+
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+
+METRICS_DIR = os.environ.get("METRICS_DIR", "/tmp/jeebz-metrics")
+RETIRED = "retired.json"
+FLUSH_INTERVAL = 5
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RENDER_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def snapshot(self):
+        return {"type": self.kind, "help": self.help, "labels": self.labels,
+                "values": [[list(k), v] for k, v in self.values.items()]}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), n=1):
+        with self.registry.lock:
+            self.values[labels] = self.values.get(labels, 0) + n
+            self.registry.dirty = True
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, labels=()):
+        with self.registry.lock:
+            self.values[labels] = value
+            self.registry.dirty = True
+
+    def inc(self, labels=(), n=1):
+        with self.registry.lock:
+            self.values[labels] = self.values.get(labels, 0) + n
+            self.registry.dirty = True
+
+    def dec(self, labels=(), n=1):
+        self.inc(labels, -n)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            v = self.values.get(labels)
+            if v is None:
+                # per-bucket counts (not cumulative), then +Inf, sum
+                v = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            v[i] += 1
+            v[-1] += value
+            self.registry.dirty = True
+
+    def snapshot(self):
+        data = super().snapshot()
+        data["values"] = [[k, list(v)] for k, v in data["values"]]
+        data["buckets"] = self.buckets
+        return data
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+        self.dirty = True
+        self.role = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def counter(self, name, help, labels=()):
+        return self.metrics.setdefault(name, Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.metrics.setdefault(name, Gauge(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(self, name, help, labels, buckets))
+
+    def collector(self, name, help, labels=()):
+        """Gauge computed at scrape time by fn() -> {label values: value};
+        for state every process can see (the job queue), so no worker label"""
+        def register(fn):
+            self.collectors.append((name, help, tuple(labels), fn))
+            return fn
+        return register
+
+    def start(self, role):
+        # Started lazily so it also works when gunicorn forks after import;
+        # the first requests of a fresh worker race to get here
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.role = role
+            # Values inherited from the parent across fork belong to the parent
+            with self.lock:
+                for metric in self.metrics.values():
+                    metric.values.clear()
+            threading.Thread(target=self._run, name="metrics", daemon=True).start()
+
+    @property
+    def worker(self):
+        return f"{self.role}-{self._pid}"
+
+    def snapshot(self):
+        with self.lock:
+            self.dirty = False
+            metrics = {name: m.snapshot() for name, m in self.metrics.items()}
+        return {"pid": self._pid, "worker": self.worker, "time": time.time(), "metrics": metrics}
+
+    def path(self):
+        return os.path.join(METRICS_DIR, f"{self._pid}.json")
+
+    def flush(self):
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        tmp = self.path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self.path())
+
+    def _run(self):
+        while True:
+            try:
+                if self.dirty:
+                    self.flush()
+            except OSError:
+                pass
+            time.sleep(FLUSH_INTERVAL)
+
+    def expose(self):
+        """Text exposition of all live processes, this one included"""
+        snapshots = [self.snapshot()]
+        try:
+            files = os.listdir(METRICS_DIR)
+        except FileNotFoundError:
+            files = []
+        for f in files:
+            if not f.endswith(".json") or not f[:-len(".json")].isdigit() or f == f"{self._pid}.json":
+                continue
+            if not _alive(int(f[:-len(".json")])):
+                retire(os.path.join(METRICS_DIR, f))
+                continue
+            snapshot = _load(os.path.join(METRICS_DIR, f))
+            if snapshot:
+                snapshots.append(snapshot)
+        retired = _load(os.path.join(METRICS_DIR, RETIRED))
+        if retired:
+            snapshots.append(retired)
+        merged = merge(snapshots)
+        for name, help, labels, fn in self.collectors:
+            try:
+                values = fn()
+            except Exception:
+                continue
+            merged[name] = {"type": "gauge", "help": help, "labels": list(labels), "buckets": None,
+                            "values": {tuple(k): v for k, v in values.items()}, "scraped": True}
+        return render(merged)
+
+
+def retire(path):
+    """Fold the counters and histograms of an exited process into the
+    retired snapshot and remove its file; gauges die with the process"""
+    with open(os.path.join(METRICS_DIR, ".retire.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = _load(path)
+        if dead is None:
+            _remove(path)  # unreadable, or already folded by another worker
+            return
+        retired_path = os.path.join(METRICS_DIR, RETIRED)
+        retired = _load(retired_path) or {"worker": "retired", "metrics": {}}
+        merged = merge([retired, {"worker": dead["worker"], "metrics": {
+            name: m for name, m in dead["metrics"].items() if m["type"] != "gauge"}}])
+        retired["metrics"] = {name: {"type": m["type"], "help": m["help"], "labels": m["labels"],
+                                     "buckets": m["buckets"], "values": [[list(k), v] for k, v in m["values"].items()]}
+                              for name, m in merged.items()}
+        tmp = retired_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(retired, f)
+        os.replace(tmp, retired_path)
+        _remove(path)
+
+def merge(snapshots):
+    merged = {}
+    for snap in snapshots:
+        for name, m in snap["metrics"].items():
+            out = merged.setdefault(name, {"type": m["type"], "help": m["help"], "labels": list(m["labels"]),
+                                           "buckets": m.get("buckets"), "values": {}})
+            for labels, value in m["values"]:
+                if m["type"] == "gauge":
+                    key = tuple(labels) + (snap["worker"],)
+                    out["values"][key] = value
+                elif m["type"] == "counter":
+                    key = tuple(labels)
+                    out["values"][key] = out["values"].get(key, 0) + value
+                else:
+                    key = tuple(labels)
+                    prev = out["values"].get(key)
+                    out["values"][key] = value if prev is None else [a + b for a, b in zip(prev, value)]
+    return merged
+
+def render(merged):
+    lines = []
+    for name in sorted(merged):
+        m = merged[name]
+        names = m["labels"] + (["worker"] if m["type"] == "gauge" and not m.get("scraped") else [])
+        lines.append(f"# HELP {name} {m['help']}")
+        lines.append(f"# TYPE {name} {m['type']}")
+        for key in sorted(m["values"]):
+            value = m["values"][key]
+            if m["type"] != "histogram":
+                lines.append(f"{name}{_labels(names, key)} {_num(value)}")
+                continue
+            cumulative = 0
+            for le, count in zip(list(m["buckets"]) + ["+Inf"], value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(names + ['le'], key + (_num(le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, key)} {_num(value[-1])}")
+            lines.append(f"{name}_count{_labels(names, key)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+def _num(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+REGISTRY = Registry()
+
+# Shared metric definitions, so every process exposes the same names
+REQUEST_DURATION = REGISTRY.histogram(
+    "webapp_request_duration_seconds", "Time to produce a response, by route", ("route", "method", "status"))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "webapp_requests_in_flight", "Requests being handled by a worker (event streams excluded)")
+EVENT_STREAMS = REGISTRY.gauge(
+    "webapp_event_streams", "Open /api/events streams, each holding a worker thread")
+STATUS_PROBE_DURATION = REGISTRY.histogram(
+    "mc_status_probe_duration_seconds", "Minecraft status probe latency", ("outcome",))
+STATUS_PROBE_FAILURES = REGISTRY.counter(
+    "mc_status_probe_failures_total", "Status probes that timed out or failed", ("reason",))
+REMOTE_DURATION = REGISTRY.histogram(
+    "remote_command_duration_seconds", "Remote (SSH/pct) command time, by command label",
+    ("label", "outcome"), buckets=RENDER_BUCKETS)
+RENDER_DURATION = REGISTRY.histogram(
+    "render_job_duration_seconds", "Render job time from claim to finish, by render type",
+    ("kind", "outcome"), buckets=RENDER_BUCKETS)
+RENDER_WORKER_BUSY = REGISTRY.gauge(
+    "render_worker_busy", "1 while a render lane is running a job", ("lane",))
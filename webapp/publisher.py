@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# Render publisher
+# Watches /mnt/shared with inotify and publishes finished renders into the
+# web root: each file is copied to a temporary name next to its destination
+# and renamed over it, so Caddy and the page never see a half-written image.
+# Variants (variants.py) are encoded before the new version is announced in
+# a small JSON state file, which the webapp reads to push updates to the
+# browsers. HTTP requests and render jobs no longer copy anything.
+
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import shutil
+import struct
+import time
+
+from variants import formats as variant_formats, load_manifest, publish_variants
+
+log = logging.getLogger("publisher")
+
+SHARED_DIR = os.environ.get("SHARED_DIR", "/mnt/shared")
+STATIC_DIR = os.environ.get("STATIC_DIR", "/opt/webapp/static")
+STATE_PATH = os.environ.get("PUBLISH_STATE", "/opt/webapp/published.json")
+FILES = ("spawn_map.png", "spawn_detail.png", "site_background.jpg")
+RESCAN_INTERVAL = 60  # safety net for missed events
+SETTLE = 0.2          # let a burst of events for one file coalesce
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class Inotify:
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        return wd
+
+    def read(self, timeout):
+        """(mask, name) pairs, waiting up to timeout seconds for the first one"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events, pos = [], 0
+        while pos < len(buf):
+            _, mask, _, length = EVENT_HEADER.unpack_from(buf, pos)
+            pos += EVENT_HEADER.size
+            name = buf[pos:pos + length].rstrip(b"\0").decode(errors="replace")
+            pos += length
+            events.append((mask, name))
+        return events
+
+
+_states = {}
+
+def load_state(path=STATE_PATH):
+    """{filename: {"version", "formats"}}, reloaded when the file changes"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _states.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    _states[path] = (mtime, state)
+    return state
+
+def write_state(state, path=STATE_PATH):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def wait_published(name, timeout=15):
+    """Published version of `name` once it has caught up with the shared copy,
+    or None if the publisher did not get there within timeout"""
+    try:
+        target = int(os.stat(os.path.join(SHARED_DIR, name)).st_mtime)
+    except OSError:
+        return None
+    deadline = time.monotonic() + timeout
+    while True:
+        entry = load_state().get(name)
+        if entry and entry["version"] >= target:
+            return entry["version"]
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.2)
+
+
+def publish(name, state):
+    src = os.path.join(SHARED_DIR, name)
+    dest = os.path.join(STATIC_DIR, name)
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    try:
+        shutil.copy2(src, tmp)  # keeps the render's mtime, which is the version
+    except FileNotFoundError:
+        return
+    os.replace(tmp, dest)
+    version = int(os.stat(dest).st_mtime)
+    manifest = publish_variants(dest) if variant_formats() else None
+    state[name] = {"version": version, "formats": list(manifest["variants"]) if manifest else []}
+    write_state(state)
+    log.info("published %s (v=%s, formats=%s)", name, version, state[name]["formats"])
+
+def stale(name, state):
+    try:
+        shared = int(os.stat(os.path.join(SHARED_DIR, name)).st_mtime)
+    except OSError:
+        return False
+    entry = state.get(name)
+    return entry is None or shared > entry["version"]
+
+def rescan(state):
+    for name in FILES:
+        if stale(name, state):
+            publish(name, state)
+
+def initial_state():
+    """State of what is already in the web root, so a restart republishes nothing"""
+    state = {}
+    for name in FILES:
+        try:
+            version = int(os.stat(os.path.join(STATIC_DIR, name)).st_mtime)
+        except OSError:
+            continue
+        manifest = load_manifest(os.path.join(STATIC_DIR, name))
+        current = manifest and manifest["version"] == version
+        state[name] = {"version": version, "formats": list(manifest["variants"]) if current else []}
+    return state
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    inotify = Inotify()
+    inotify.watch(SHARED_DIR, IN_CLOSE_WRITE | IN_MOVED_TO)
+    state = initial_state()
+    write_state(state)
+    rescan(state)
+    last_scan = time.monotonic()
+    while True:
+        events = inotify.read(RESCAN_INTERVAL)
+        if any(mask & IN_Q_OVERFLOW for mask, _ in events) or time.monotonic() - last_scan >= RESCAN_INTERVAL:
+            rescan(state)
+            last_scan = time.monotonic()
+            continue
+        names = {name for _, name in events if name in FILES}
+        if not names:
+            continue
+        time.sleep(SETTLE)
+        names.update(name for _, name in inotify.read(0) if name in FILES)
+        for name in sorted(names):
+            publish(name, state)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Remote command execution on the Proxmox host
+# Commands are sent over persistent, multiplexed OpenSSH connections
+# (ControlMaster/ControlPersist), so only the first call per pool slot pays
+# for the TCP + key exchange handshake. LocalExecutor runs the same commands
+# on this machine and can be plugged in for tests or local development.
+
+import itertools
+import logging
+import os
+import subprocess
+import threading
+import time
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+PROXMOX_HOST = os.environ.get("PROXMOX_HOST", "root@192.168.0.124")
+MC_CTID = 100
+
+
+class Result:
+    def __init__(self, command, returncode, stdout, stderr, elapsed):
+        self.command = command
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
+class Executor:
+    """Base class: subclasses implement _argv()"""
+
+    def __init__(self):
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def run(self, command, timeout=None, label=None):
+        argv = self._argv(command)
+        start = time.monotonic()
+        try:
+            proc = subprocess.run(argv, capture_output=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self._record(label or command, time.monotonic() - start, failed=True)
+            metrics.REMOTE_DURATION.observe(time.monotonic() - start, (label or "other", "timeout"))
+            raise
+        elapsed = time.monotonic() - start
+        self._record(label or command, elapsed, failed=proc.returncode != 0)
+        metrics.REMOTE_DURATION.observe(elapsed, (label or "other", "ok" if proc.returncode == 0 else "failed"))
+        log.info("remote %r rc=%d in %.3fs", label or command, proc.returncode, elapsed)
+        return Result(command, proc.returncode, proc.stdout, proc.stderr, elapsed)
+
+    def pct(self, command, timeout=None, label=None, ctid=MC_CTID):
+        """Run a command inside an LXC container on the host"""
+        return self.run(f"pct exec {ctid} -- {command}", timeout=timeout, label=label)
+
+    def stats(self):
+        with self._stats_lock:
+            return {k: dict(v) for k, v in self._stats.items()}
+
+    def close(self):
+        pass
+
+    def _record(self, label, elapsed, failed=False):
+        with self._stats_lock:
+            s = self._stats.setdefault(label, {"count": 0, "failed": 0, "total": 0.0, "max": 0.0, "last": 0.0})
+            s["count"] += 1
+            s["failed"] += int(failed)
+            s["total"] += elapsed
+            s["max"] = max(s["max"], elapsed)
+            s["last"] = elapsed
+
+    def _argv(self, command):
+        raise NotImplementedError
+
+
+class SSHExecutor(Executor):
+    def __init__(self, host=PROXMOX_HOST, pool_size=2, persist="10m", control_dir="/tmp"):
+        super().__init__()
+        self.host = host
+        self.persist = persist
+        self.control_paths = [os.path.join(control_dir, f"jeebz-ssh-{i}-%C") for i in range(pool_size)]
+        self._next = itertools.cycle(range(pool_size))
+        self._lock = threading.Lock()
+
+    def _options(self, control_path):
+        return [
+            "-o", "StrictHostKeyChecking=no",
+            "-o", "BatchMode=yes",
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={control_path}",
+            "-o", f"ControlPersist={self.persist}",
+            "-o", "ServerAliveInterval=30",
+        ]
+
+    def _argv(self, command):
+        # Spread concurrent commands over the pool of master connections
+        with self._lock:
+            control_path = self.control_paths[next(self._next)]
+        return ["/bin/ssh", *self._options(control_path), self.host, command]
+
+    def close(self):
+        for control_path in self.control_paths:
+            subprocess.run(["/bin/ssh", *self._options(control_path), "-O", "exit", self.host],
+                           capture_output=True, timeout=10)
+
+
+class LocalExecutor(Executor):
+    """Stand-in that runs commands locally; `pct exec` is stripped off"""
+
+    def pct(self, command, timeout=None, label=None, ctid=MC_CTID):
+        return self.run(command, timeout=timeout, label=label)
+
+    def _argv(self, command):
+        return ["/bin/sh", "-c", command]
+
+
+def get_executor():
+    if os.environ.get("REMOTE_EXECUTOR", "ssh") == "local":
+        return LocalExecutor()
+    return SSHExecutor()
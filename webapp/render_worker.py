@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Render worker
+# Claims jobs from the queue (jobs.py) and runs the render scripts on the
+# Minecraft container, so HTTP workers never wait on a render. One thread per
+# lane: map renders (unmined) do not have to wait behind a Chunky render.
+
+import logging
+import subprocess
+import threading
+import time
+
+import metrics
+from camera import CameraStore
+from jobs import JobQueue
+from publisher import wait_published
+from remote import get_executor
+
+log = logging.getLogger("render_worker")
+
+LANES = {
+    "map": ("map",),
+    "detail": ("detail", "background"),
+}
+IDLE_SLEEP = 0.5
+
+
+def run_map(remote, args):
+    result = remote.pct('/opt/minecraft/render_map.sh', timeout=90, label="render_map")
+    if result.returncode != 0:
+        return False, f"SSH failed: {result.stderr.decode()[-500:]}", None
+    # publisher.py copies the new map into the web root; wait for it so the
+    # browser is told about a version that is actually being served
+    return True, "Map updated", {"version": wait_published("spawn_map.png")}
+
+def run_detail(remote, args):
+    # The render host stores the absolute camera it is given (write-through)
+    cam = args["cam"]
+    cmd = f'/opt/minecraft/render_isometric.sh --cam {int(cam["x"])} {int(cam["z"])} {int(cam["fov"])}'
+    result = remote.pct(cmd, timeout=300, label="render_detail")
+    if result.returncode != 0:
+        return False, f"SSH failed: {result.stderr.decode()[-500:]}", None
+    cached = b"Served from render cache" in result.stdout
+    return True, "Detail updated", {"cam": cam, "cached": cached, "version": wait_published("spawn_detail.png")}
+
+def run_background(remote, args):
+    # The script takes its own lock and renders at low priority; just start it
+    cmd = 'nohup /opt/minecraft/render_background.sh > /tmp/bg_render.log 2>&1 &'
+    remote.pct(cmd, timeout=10, label="render_background")
+    return True, "Background render started", None
+
+HANDLERS = {
+    "map": run_map,
+    "detail": run_detail,
+    "background": run_background,
+}
+
+
+def work(queue, remote, lane, kinds):
+    metrics.RENDER_WORKER_BUSY.set(0, (lane,))
+    while True:
+        job = queue.claim(kinds)
+        if job is None:
+            time.sleep(IDLE_SLEEP)
+            continue
+        log.info("job %s (%s) started", job["id"], job["kind"])
+        metrics.RENDER_WORKER_BUSY.set(1, (lane,))
+        start = time.monotonic()
+        try:
+            success, message, result = HANDLERS[job["kind"]](remote, job["args"])
+            outcome = "ok" if success else "failed"
+        except subprocess.TimeoutExpired:
+            success, message, result = False, "Render timed out", None
+            outcome = "timeout"
+        except Exception as e:
+            success, message, result = False, str(e), None
+            outcome = "failed"
+        metrics.RENDER_DURATION.observe(time.monotonic() - start, (job["kind"], outcome))
+        metrics.RENDER_WORKER_BUSY.set(0, (lane,))
+        queue.finish(job["id"], success, message, result)
+        log.info("job %s finished: %s", job["id"], message)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    metrics.REGISTRY.start("render-worker")
+    queue = JobQueue()
+    queue.recover()
+    remote = get_executor()
+    CameraStore().bootstrap(remote)
+    for lane, kinds in LANES.items():
+        threading.Thread(target=work, args=(queue, remote, lane, kinds), name=lane, daemon=True).start()
+    while True:
+        queue.prune()
+        time.sleep(3600)
+
+
+if __name__ == "__main__":
+    main()
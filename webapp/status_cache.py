@@ -0,0 +1,213 @@
+# Shared Minecraft server status cache
+# Every gunicorn worker runs a small poller thread. A file lock makes sure only
+# one of them probes the server per interval; the result is written atomically
+# to a JSON file that all workers load into memory, so requests never block on
+# the network. With a history directory, the probing worker also appends each
+# sample to a tsdb series ("players") for the player-count history.
+
+import fcntl
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+import metrics
+import tsdb
+
+OFFLINE = {"online": False, "players_online": 0, "players_max": 0, "version": "", "motd": ""}
+HISTORY_FIELDS = ("players_online", "players_max", "online")
+
+
+def write_varint(val):
+    result = b""
+    while True:
+        b = val & 0x7F
+        val >>= 7
+        if val:
+            result += bytes([b | 0x80])
+        else:
+            result += bytes([b])
+            break
+    return result
+
+def read_varint(sock):
+    val = 0
+    for i in range(5):
+        b = sock.recv(1)
+        if not b:
+            raise Exception("No data")
+        b = b[0]
+        val |= (b & 0x7F) << (7 * i)
+        if not (b & 0x80):
+            break
+    return val
+
+def probe(host, port, timeout=5):
+    """Ping the server once using the status protocol"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            host_bytes = host.encode("utf-8")
+            packet = write_varint(0)
+            packet += write_varint(0)
+            packet += write_varint(len(host_bytes)) + host_bytes
+            packet += struct.pack(">H", port)
+            packet += write_varint(1)
+            sock.send(write_varint(len(packet)) + packet)
+
+            status_request = write_varint(0)
+            sock.send(write_varint(len(status_request)) + status_request)
+
+            length = read_varint(sock)
+            packet_id = read_varint(sock)
+            json_length = read_varint(sock)
+
+            response = b""
+            while len(response) < json_length:
+                chunk = sock.recv(json_length - len(response))
+                if not chunk:
+                    raise Exception("Connection closed")
+                response += chunk
+
+        data = json.loads(response.decode("utf-8"))
+
+        motd = data.get("description", "")
+        if isinstance(motd, dict):
+            motd = motd.get("text", "")
+
+        return {
+            "online": True,
+            "players_online": data.get("players", {}).get("online", 0),
+            "players_max": data.get("players", {}).get("max", 0),
+            "version": data.get("version", {}).get("name", "Unknown"),
+            "motd": motd
+        }
+    except:
+        return dict(OFFLINE)
+
+
+class StatusCache:
+    def __init__(self, host, port, ttl=10, timeout=5, path="/tmp/jeebz_mc_status.json", history_dir=None):
+        self.host = host
+        self.port = port
+        self.ttl = ttl
+        self.timeout = timeout
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.interval = max(0.5, min(ttl / 4.0, 2.0))
+        self.history_dir = history_dir
+        self._history = None
+        self._status = None
+        self._checked = 0
+        self._mtime = 0
+        self._ready = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def get(self):
+        """Latest status snapshot; never touches the network"""
+        if self._pid != os.getpid():
+            self.start()
+        if self._status is None:
+            # Only right after startup: wait for the first probe at most once
+            self._ready.wait(self.timeout + 1)
+        return self._status or OFFLINE
+
+    @property
+    def checked(self):
+        return self._checked
+
+    def start(self):
+        # Started lazily so it also works when gunicorn forks after import;
+        # the first requests of a fresh worker race to get here
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._ready = threading.Event()
+            self._load()
+            self._thread = threading.Thread(target=self._run, name="mc-status", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            try:
+                self._refresh()
+            except Exception:
+                pass
+            time.sleep(self.interval)
+
+    def _load(self):
+        # Pick up a snapshot written by whichever worker probed last
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._mtime = mtime
+        self._checked = data.get("checked", 0)
+        self._status = data.get("status", OFFLINE)
+        self._ready.set()
+
+    def _record(self, status, checked):
+        if self.history_dir is None:
+            return
+        if self._history is None:
+            self._history = tsdb.Series(self.history_dir, "players", fields=HISTORY_FIELDS, step=max(1, int(self.ttl)))
+        self._history.append({"players_online": status["players_online"], "players_max": status["players_max"],
+                              "online": int(status["online"])}, t=checked)
+
+    def history(self):
+        """The player-count series, or None before the first sample"""
+        if self.history_dir is None:
+            return None
+        try:
+            return tsdb.Series(self.history_dir, "players")
+        except KeyError:
+            return None
+
+    def _stale(self):
+        return time.time() - self._checked >= self.ttl
+
+    def _refresh(self):
+        self._load()
+        if not self._stale():
+            return
+        with open(self.lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # another worker is probing right now
+            try:
+                self._load()
+                if not self._stale():
+                    return
+                start = time.monotonic()
+                status = probe(self.host, self.port, self.timeout)
+                elapsed = time.monotonic() - start
+                # probe() reports any failure as offline; a failure that took
+                # the whole timeout is a timeout
+                outcome = "ok" if status["online"] else "timeout" if elapsed >= self.timeout else "error"
+                metrics.STATUS_PROBE_DURATION.observe(elapsed, (outcome,))
+                if outcome != "ok":
+                    metrics.STATUS_PROBE_FAILURES.inc((outcome,))
+                checked = time.time()
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump({"checked": checked, "status": status}, f)
+                os.replace(tmp, self.path)
+                self._status = status
+                self._checked = checked
+                self._mtime = os.stat(self.path).st_mtime
+                self._ready.set()
+                self._record(status, checked)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
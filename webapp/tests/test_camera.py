@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from camera import DEFAULT, FOV_MAX, FOV_MIN, CameraStore, apply_moves, parse_state_file
+
+
+class FakeResult:
+    def __init__(self, ok, stdout=b""):
+        self.ok = ok
+        self.stdout = stdout
+
+
+class FakeRemote:
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+
+    def pct(self, command, timeout=None, label=None):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class MovesTest(unittest.TestCase):
+    def test_moves(self):
+        cam = {"x": 0, "z": 0, "fov": 80}
+        self.assertEqual(apply_moves(cam, ["n", "e", "e"]), {"x": 60, "z": -30, "fov": 80})
+        self.assertEqual(apply_moves(cam, ["in"] * 10)["fov"], FOV_MIN)
+        self.assertEqual(apply_moves(cam, ["out"] * 10)["fov"], FOV_MAX)
+        self.assertEqual(apply_moves(cam, ["w", "reset", "s"]), dict(DEFAULT, z=DEFAULT["z"] + 30))
+        self.assertEqual(cam, {"x": 0, "z": 0, "fov": 80})
+
+    def test_parse_state_file(self):
+        self.assertEqual(parse_state_file("CAM_X=10\nCAM_Z=-20\nFOV=60\n"), {"x": 10, "z": -20, "fov": 60})
+        self.assertEqual(parse_state_file("CAM_X=5\n"), dict(DEFAULT, x=5))
+
+
+class CameraStoreTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "camera_state.json")
+
+    def test_default_until_moved(self):
+        store = CameraStore(self.path)
+        self.assertFalse(store.exists())
+        self.assertEqual(store.get(), DEFAULT)
+        self.assertEqual(store.move(["e"]), dict(DEFAULT, x=DEFAULT["x"] + 30))
+        self.assertTrue(store.exists())
+
+    def test_other_workers_see_moves(self):
+        a, b = CameraStore(self.path), CameraStore(self.path)
+        a.move(["n"])
+        self.assertEqual(b.get(), dict(DEFAULT, z=DEFAULT["z"] - 30))
+        b.move(["n"])
+        self.assertEqual(a.get(), dict(DEFAULT, z=DEFAULT["z"] - 60))
+
+    def test_concurrent_moves_are_not_lost(self):
+        stores = [CameraStore(self.path) for _ in range(4)]
+        def move(store):
+            for _ in range(10):
+                store.move(["e"])
+        threads = [threading.Thread(target=move, args=(s,)) for s in stores]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(CameraStore(self.path).get()["x"], DEFAULT["x"] + 40 * 30)
+
+    def test_bootstrap_from_render_host(self):
+        remote = FakeRemote(FakeResult(True, b"CAM_X=1\nCAM_Z=2\nFOV=90\n"))
+        store = CameraStore(self.path)
+        store.bootstrap(remote)
+        self.assertEqual(CameraStore(self.path).get(), {"x": 1, "z": 2, "fov": 90})
+        store.bootstrap(remote)
+        self.assertEqual(remote.calls, 1)
+
+    def test_bootstrap_falls_back_to_default(self):
+        for remote in (FakeRemote(FakeResult(False)), FakeRemote(error=OSError("ssh failed"))):
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            store = CameraStore(self.path)
+            store.bootstrap(remote)
+            self.assertEqual(CameraStore(self.path).get(), DEFAULT)
+
+
+if __name__ == "__main__":
+    unittest.main()
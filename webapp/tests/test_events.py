@@ -0,0 +1,51 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from events import EventBus, format_event
+
+
+class EventBusTest(unittest.TestCase):
+    def test_publish_and_wait(self):
+        bus = EventBus()
+        bus.publish("status", {"online": True})
+        bus.publish("job", {"id": "a"})
+        self.assertEqual(bus.wait(0, 0), [(1, "status", {"online": True}), (2, "job", {"id": "a"})])
+        self.assertEqual(bus.wait(1, 0), [(2, "job", {"id": "a"})])
+        self.assertEqual(bus.wait(2, 0.01), [])
+
+    def test_concurrent_start_runs_one_watcher(self):
+        bus = EventBus(interval=0.01)
+        calls = []
+        changed = threading.Event()
+
+        @bus.watch
+        def watch_counter(bus, last):
+            calls.append(1)
+            if "seen" not in last:
+                last["seen"] = True
+                bus.publish("counter", len(calls))
+                changed.set()
+
+        barrier = threading.Barrier(16)
+        def start():
+            barrier.wait()
+            bus.start()
+        threads = [threading.Thread(target=start) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertTrue(changed.wait(1))
+        self.assertEqual(len([t for t in threading.enumerate() if t.name == "events"]), 1)
+        self.assertEqual([e[1] for e in bus.wait(0, 0.05)], ["counter"])
+
+    def test_format_event(self):
+        self.assertEqual(format_event(3, "job", {"id": "a"}), 'id: 3\nevent: job\ndata: {"id": "a"}\n\n')
+
+
+if __name__ == "__main__":
+    unittest.main()
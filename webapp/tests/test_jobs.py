@@ -0,0 +1,82 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import DONE, FAILED, QUEUED, RUNNING, SUPERSEDED, JobQueue, QueueFull
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.jobs = JobQueue(os.path.join(tmp.name, "jobs.db"), max_queued=2)
+
+    def test_claim_and_finish(self):
+        job = self.jobs.enqueue("map")
+        self.assertEqual(job["state"], QUEUED)
+        claimed = self.jobs.claim()
+        self.assertEqual((claimed["id"], claimed["state"]), (job["id"], RUNNING))
+        self.assertIsNone(self.jobs.claim())
+        self.jobs.finish(job["id"], True, "ok", {"file": "spawn_map.png"})
+        done = self.jobs.get(job["id"])
+        self.assertEqual((done["state"], done["result"]), (DONE, {"file": "spawn_map.png"}))
+        self.assertEqual([j["id"] for j in self.jobs.finished_since(0)], [job["id"]])
+
+    def test_claim_by_kind(self):
+        self.jobs.enqueue("map")
+        detail = self.jobs.enqueue("detail", {"x": 1})
+        self.assertEqual(self.jobs.claim(["detail"])["id"], detail["id"])
+
+    def test_identical_requests_coalesce(self):
+        first = self.jobs.enqueue("map")
+        self.assertEqual(self.jobs.enqueue("map")["id"], first["id"])
+        self.jobs.claim()
+        self.assertEqual(self.jobs.enqueue("map")["id"], first["id"])
+
+    def test_queue_bound(self):
+        self.jobs.enqueue("map")
+        self.jobs.enqueue("background")
+        with self.assertRaises(QueueFull):
+            self.jobs.enqueue("isometric", {"preset": "spawn"})
+
+    def test_queued_detail_is_superseded(self):
+        a = self.jobs.enqueue("detail", {"x": 1})
+        b = self.jobs.enqueue("detail", {"x": 2})
+        a = self.jobs.get(a["id"])
+        self.assertEqual((a["state"], a["superseded_by"]), (SUPERSEDED, b["id"]))
+        self.assertEqual(self.jobs.claim()["id"], b["id"])
+
+    def test_moving_back_to_running_view_supersedes_queued(self):
+        a = self.jobs.enqueue("detail", {"x": 1})
+        self.jobs.claim()
+        b = self.jobs.enqueue("detail", {"x": 2})
+        self.assertEqual(self.jobs.get(b["id"])["state"], QUEUED)
+        # Camera moved back to A's view: join A, and B must not run after it
+        again = self.jobs.enqueue("detail", {"x": 1})
+        self.assertEqual(again["id"], a["id"])
+        b = self.jobs.get(b["id"])
+        self.assertEqual((b["state"], b["superseded_by"]), (SUPERSEDED, a["id"]))
+        self.assertIsNone(self.jobs.claim())
+
+    def test_recover_fails_running_jobs(self):
+        job = self.jobs.enqueue("map")
+        self.jobs.claim()
+        self.jobs.recover()
+        self.assertEqual(self.jobs.get(job["id"])["state"], FAILED)
+        # A failed job no longer covers new requests
+        self.assertNotEqual(self.jobs.enqueue("map")["id"], job["id"])
+
+    def test_status(self):
+        self.jobs.enqueue("map")
+        self.jobs.enqueue("background")
+        self.jobs.claim()
+        status = self.jobs.status()
+        self.assertEqual((status["queued"], status["running"], status["max_queued"]), (1, 1, 2))
+        self.assertEqual(len(status["jobs"]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", ""])
+    proc.wait()
+    return proc.pid
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        patcher = mock.patch.object(metrics, "METRICS_DIR", tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registry = metrics.Registry()
+        self.registry._pid, self.registry.role = os.getpid(), "web"
+        self.requests = self.registry.counter("requests_total", "Requests", ("route",))
+        self.busy = self.registry.gauge("busy", "Busy lanes")
+        self.duration = self.registry.histogram("duration_seconds", "Durations", buckets=(0.1, 1))
+
+    def other_process(self, pid, requests, busy=1):
+        snapshot = {"pid": pid, "worker": f"web-{pid}", "time": 0, "metrics": {
+            "requests_total": {"type": "counter", "help": "Requests", "labels": ["route"],
+                               "values": [[["/"], requests]]},
+            "busy": {"type": "gauge", "help": "Busy lanes", "labels": [], "values": [[[], busy]]},
+            "duration_seconds": {"type": "histogram", "help": "Durations", "labels": [], "buckets": [0.1, 1],
+                                 "values": [[[], [1, 0, 0, 0.05]]]},
+        }}
+        with open(os.path.join(self.dir, f"{pid}.json"), "w") as f:
+            json.dump(snapshot, f)
+
+    def lines(self):
+        return set(self.registry.expose().splitlines())
+
+    def test_exposition(self):
+        self.requests.inc(("/",))
+        self.requests.inc(("/",))
+        self.busy.set(1)
+        self.duration.observe(0.5)
+        self.duration.observe(5)
+        lines = self.lines()
+        self.assertIn('requests_total{route="/"} 2', lines)
+        self.assertIn(f'busy{{worker="web-{os.getpid()}"}} 1', lines)
+        self.assertIn('duration_seconds_bucket{le="0.1"} 0', lines)
+        self.assertIn('duration_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('duration_seconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn("duration_seconds_sum 5.5", lines)
+        self.assertIn("duration_seconds_count 2", lines)
+        self.assertIn("# TYPE duration_seconds histogram", lines)
+
+    def test_live_processes_are_summed(self):
+        self.requests.inc(("/",))
+        self.other_process(os.getppid(), 4)
+        lines = self.lines()
+        self.assertIn('requests_total{route="/"} 5', lines)
+        self.assertIn(f'busy{{worker="web-{os.getppid()}"}} 1', lines)
+        self.assertIn('duration_seconds_count 1', lines)
+
+    def test_exited_process_counters_are_kept(self):
+        self.requests.inc(("/",))
+        pid = dead_pid()
+        self.other_process(pid, 4)
+        lines = self.lines()
+        self.assertIn('requests_total{route="/"} 5', lines)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, f"{pid}.json")))
+        # Gauges go with the process; counters and histograms stay
+        self.assertNotIn(f'busy{{worker="web-{pid}"}} 1', lines)
+        self.assertIn('duration_seconds_count 1', lines)
+        self.assertIn('requests_total{route="/"} 5', self.lines())
+
+        self.other_process(dead_pid(), 3)
+        self.assertIn('requests_total{route="/"} 8', self.lines())
+
+
+class RequestMetricsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        env = {"JOBS_DB": os.path.join(tmp.name, "jobs.db"), "MC_HISTORY_DIR": os.path.join(tmp.name, "history"),
+               "TELEMETRY_DIR": os.path.join(tmp.name, "telemetry"),
+               "LOG_EVENTS_DB": os.path.join(tmp.name, "events.db"),
+               "CAMERA_STATE": os.path.join(tmp.name, "camera_state.json")}
+        # Fresh imports, so the module-level paths come from env
+        with mock.patch.dict(os.environ, env), mock.patch.dict(sys.modules):
+            for name in ("app", "jobs", "camera"):
+                sys.modules.pop(name, None)
+            import app
+        self.app = app.app
+        self.jobs = app.jobs
+        patcher = mock.patch.object(metrics, "METRICS_DIR", tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def count(self, route, status):
+        value = metrics.REQUEST_DURATION.values.get((route, "GET", status))
+        return sum(value[:-1]) if value else 0
+
+    def test_failed_requests_are_counted(self):
+        client = self.app.test_client()
+        before = self.count("/api/queue", "500")
+        with mock.patch.object(self.jobs, "status", side_effect=RuntimeError("boom")):
+            self.app.testing = False
+            self.assertEqual(client.get("/api/queue").status_code, 500)
+            self.assertEqual(self.count("/api/queue", "500"), before + 1)
+
+            self.app.testing = True  # the exception propagates: only teardown runs
+            with self.assertRaises(RuntimeError):
+                client.get("/api/queue")
+            self.assertEqual(self.count("/api/queue", "500"), before + 2)
+        self.assertEqual(sum(metrics.REQUESTS_IN_FLIGHT.values.values()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class PublisherTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.shared = os.path.join(tmp.name, "shared")
+        self.static = os.path.join(tmp.name, "static")
+        os.makedirs(self.shared)
+        os.makedirs(self.static)
+        env = {"SHARED_DIR": self.shared, "STATIC_DIR": self.static,
+               "PUBLISH_STATE": os.path.join(tmp.name, "published.json")}
+        # Fresh import, so the module-level paths come from env
+        with mock.patch.dict(os.environ, env), mock.patch.dict(sys.modules):
+            sys.modules.pop("publisher", None)
+            import publisher
+        self.publisher = publisher
+        # Variant encoding has its own tests
+        patcher = mock.patch.object(publisher, "variant_formats", return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def render(self, name, data, mtime):
+        path = os.path.join(self.shared, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        os.utime(path, (mtime, mtime))
+
+    def read_static(self, name):
+        with open(os.path.join(self.static, name), "rb") as f:
+            return f.read()
+
+    def test_rescan_publishes_new_renders(self):
+        self.render("spawn_map.png", b"map v1", 1_700_000_000)
+        state = {}
+        self.publisher.rescan(state)
+        self.assertEqual(self.read_static("spawn_map.png"), b"map v1")
+        self.assertEqual(state, {"spawn_map.png": {"version": 1_700_000_000, "formats": []}})
+        self.assertEqual(self.publisher.load_state(), state)
+        self.assertEqual(os.listdir(self.static), ["spawn_map.png"])  # no temporary files left
+
+        self.assertFalse(self.publisher.stale("spawn_map.png", state))
+        self.render("spawn_map.png", b"map v2", 1_700_000_600)
+        self.assertTrue(self.publisher.stale("spawn_map.png", state))
+        self.publisher.rescan(state)
+        self.assertEqual(self.read_static("spawn_map.png"), b"map v2")
+        self.assertEqual(self.publisher.load_state()["spawn_map.png"]["version"], 1_700_000_600)
+
+    def test_restart_republishes_nothing(self):
+        self.render("spawn_detail.png", b"detail", 1_700_000_000)
+        self.publisher.rescan({})
+        state = self.publisher.initial_state()
+        self.assertEqual(state, {"spawn_detail.png": {"version": 1_700_000_000, "formats": []}})
+        with mock.patch.object(self.publisher, "publish") as publish:
+            self.publisher.rescan(state)
+        publish.assert_not_called()
+
+    def test_missing_render_is_skipped(self):
+        state = {}
+        self.publisher.publish("spawn_map.png", state)
+        self.assertEqual(state, {})
+        self.assertFalse(self.publisher.stale("spawn_map.png", state))
+
+    def test_wait_published(self):
+        self.render("spawn_map.png", b"map", 1_700_000_000)
+        self.assertIsNone(self.publisher.wait_published("spawn_map.png", timeout=0))
+        self.publisher.rescan({})
+        self.assertEqual(self.publisher.wait_published("spawn_map.png", timeout=0), 1_700_000_000)
+
+
+if __name__ == "__main__":
+    unittest.main()
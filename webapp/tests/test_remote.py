@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import remote
+
+
+class LocalExecutorTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = remote.LocalExecutor()
+
+    def test_run_captures_output(self):
+        result = self.executor.run("echo out; echo err >&2; exit 3", label="probe")
+        self.assertFalse(result.ok)
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(result.stdout, b"out\n")
+        self.assertEqual(result.stderr, b"err\n")
+        self.assertGreaterEqual(result.elapsed, 0)
+
+    def test_pct_runs_without_container(self):
+        self.assertEqual(self.executor.pct("echo hi").stdout, b"hi\n")
+
+    def test_stats_per_label(self):
+        self.executor.run("true", label="ok")
+        self.executor.run("true", label="ok")
+        self.executor.run("false", label="bad")
+        stats = self.executor.stats()
+        self.assertEqual(stats["ok"]["count"], 2)
+        self.assertEqual(stats["ok"]["failed"], 0)
+        self.assertEqual(stats["bad"]["count"], 1)
+        self.assertEqual(stats["bad"]["failed"], 1)
+        self.assertGreaterEqual(stats["ok"]["max"], stats["ok"]["last"])
+
+    def test_timeout_is_recorded(self):
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.executor.run("sleep 5", timeout=0.1, label="slow")
+        self.assertEqual(self.executor.stats()["slow"]["failed"], 1)
+
+
+class SSHExecutorTest(unittest.TestCase):
+    def test_commands_spread_over_pool(self):
+        executor = remote.SSHExecutor(host="root@host", pool_size=2, control_dir="/run/test")
+        paths = [next(o for o in executor._argv("uptime") if o.startswith("ControlPath="))
+                 for _ in range(4)]
+        self.assertEqual(paths[0], paths[2])
+        self.assertNotEqual(paths[0], paths[1])
+        argv = executor._argv("uptime")
+        self.assertEqual(argv[-2:], ["root@host", "uptime"])
+        self.assertIn("ControlMaster=auto", argv)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import variants
+
+try:
+    from PIL import Image, ImageChops
+except ImportError:
+    Image = None
+
+
+def pixel_art(width, height):
+    """Blocky image with few colours, like the unmined map"""
+    rng = random.Random(1)
+    palette = [(34, 139, 34), (30, 144, 255), (128, 128, 128), (240, 230, 140), (200, 50, 50)]
+    image = Image.new("RGB", (width, height))
+    px = image.load()
+    for y in range(height):
+        for x in range(width):
+            px[x, y] = palette[(x // 4 + y // 3 + rng.randint(0, 1)) % len(palette)]
+    return image
+
+
+@unittest.skipIf(Image is None or not variants.formats(), "Pillow with WebP/AVIF is not installed")
+class VariantsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def publish(self, filename, image):
+        path = os.path.join(self.dir, filename)
+        image.save(path)
+        manifest = variants.publish_variants(path)
+        self.assertEqual(manifest, variants.load_manifest(path))
+        return manifest
+
+    def test_lossless_profile_round_trips_exactly(self):
+        source = pixel_art(160, 96)
+        manifest = self.publish("spawn_map.png", source)
+        self.assertNotIn("avif", manifest["variants"])
+        for fmt, entries in manifest["variants"].items():
+            self.assertEqual([width for width, _ in entries], [160])
+            with Image.open(os.path.join(self.dir, entries[0][1])) as decoded:
+                diff = ImageChops.difference(source, decoded.convert("RGB"))
+            self.assertIsNone(diff.getbbox(), f"{fmt} variant differs from the source")
+
+    def test_lossy_profile_has_scaled_variants(self):
+        manifest = self.publish("spawn_detail.png", pixel_art(640, 360))
+        self.assertEqual((manifest["width"], manifest["height"]), (640, 360))
+        for fmt in variants.formats():
+            entries = manifest["variants"][fmt]
+            self.assertEqual([width for width, _ in entries], [640, 320])
+            with Image.open(os.path.join(self.dir, entries[1][1])) as scaled:
+                self.assertEqual(scaled.size, (320, 180))
+
+
+if __name__ == "__main__":
+    unittest.main()
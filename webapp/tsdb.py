@@ -0,0 +1 @@
+../minecraft/tsdb.py
\ No newline at end of file
@@ -0,0 +1,107 @@
+# Modern-format and responsive variants of published images
+# Encoding happens once, when a new render is published, never per request:
+# WebP (and AVIF when the installed Pillow supports it) at full size plus a
+# few smaller widths. A JSON manifest next to the source lists what exists so
+# the page can offer it through <picture>/srcset and CSS image-set().
+# Pillow is optional; without it only the original files are served.
+
+import fcntl
+import json
+import os
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+PROFILES = {
+    # Pixel-art map: lossless and never scaled
+    "spawn_map.png": {"widths": (), "lossless": True},
+    "spawn_detail.png": {"widths": (320,), "quality": 85},
+    "site_background.jpg": {"widths": (640, 1280), "quality": 75},
+}
+DEFAULT_PROFILE = {"widths": (), "quality": 80}
+# Formats Pillow can encode without loss. Its AVIF encoder ignores
+# lossless=True and, even at quality 100 with 4:4:4 chroma, goes through
+# YUV, so lossless profiles get no AVIF variant
+LOSSLESS_FORMATS = ("webp",)
+
+
+def formats():
+    if Image is None:
+        return []
+    return [fmt for fmt in ("avif", "webp") if features.check(fmt)]
+
+def variant_name(filename, fmt, width=None):
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}.{width}w.{fmt}" if width else f"{stem}.{fmt}"
+
+def manifest_path(path):
+    return os.path.splitext(path)[0] + ".variants.json"
+
+def publish_variants(path):
+    """Encode all variants of `path` and write its manifest; returns the manifest"""
+    fmts = formats()
+    if not fmts or not os.path.exists(path):
+        return None
+    directory, filename = os.path.split(path)
+    profile = PROFILES.get(filename, DEFAULT_PROFILE)
+    # The lock lives outside the served directory
+    with open(f"/tmp/jeebz-variants-{filename}.lock", "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None  # another process is publishing this image
+        try:
+            with Image.open(path) as src:
+                src.load()
+                image = src.convert("RGBA" if "A" in src.getbands() else "RGB")
+            manifest = {"version": int(os.stat(path).st_mtime), "width": image.width,
+                        "height": image.height, "variants": {}}
+            widths = [None] + [w for w in profile["widths"] if w < image.width]
+            if profile.get("lossless"):
+                fmts = [fmt for fmt in fmts if fmt in LOSSLESS_FORMATS]
+            for fmt in fmts:
+                entries = []
+                for width in widths:
+                    scaled = image
+                    if width:
+                        scaled = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+                    name = variant_name(filename, fmt, width)
+                    _save(scaled, os.path.join(directory, name), fmt, profile)
+                    entries.append([width or image.width, name])
+                manifest["variants"][fmt] = entries
+            tmp = manifest_path(path) + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(manifest, f)
+            os.replace(tmp, manifest_path(path))
+            return manifest
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _save(image, dest, fmt, profile):
+    tmp = dest + ".tmp"
+    options = {"lossless": True} if profile.get("lossless") else {"quality": profile.get("quality", 80)}
+    image.save(tmp, format=fmt.upper(), **options)
+    os.replace(tmp, dest)
+
+
+_manifests = {}
+
+def load_manifest(path):
+    """Manifest for `path`, or None; cached until the manifest file changes"""
+    mpath = manifest_path(path)
+    try:
+        mtime = os.stat(mpath).st_mtime_ns
+    except OSError:
+        return None
+    cached = _manifests.get(mpath)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(mpath) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    _manifests[mpath] = (mtime, manifest)
+    return manifest